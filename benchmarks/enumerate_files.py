@@ -0,0 +1,59 @@
+"""
+Compares the filesystem walker with the git index reader as the source of
+candidate files for filter_files_in_repo.
+
+Usage:
+    python benchmarks/enumerate_files.py repositories/<author>/<name> [...]
+"""
+
+import sys
+import timeit
+from pathlib import Path
+
+from repo_tool.core.filter import (
+    FileSource,
+    filter_files_in_repo,
+    get_all_files,
+    get_filter_settings_from_env,
+    get_tracked_files,
+)
+
+REPEAT = 5
+
+
+def benchmark(repo_path: Path) -> None:
+    settings = get_filter_settings_from_env()
+    exclude_patterns = settings.exclude_patterns
+
+    print(f"{repo_path}")
+    for name, enumerate_files in [
+        ("filesystem", lambda: get_all_files(repo_path, exclude_patterns)),
+        ("git_index", lambda: get_tracked_files(repo_path, exclude_patterns)),
+    ]:
+        file_count = len(enumerate_files())
+        best = min(timeit.repeat(enumerate_files, number=1, repeat=REPEAT))
+        print(f"  enumerate {name:<10} {file_count:>8} files {best * 1000:>10.1f} ms")
+
+    for source in FileSource:
+        file_count = len(
+            filter_files_in_repo(
+                repo_path, filter_settings=settings, file_source=source
+            )
+        )
+        best = min(
+            timeit.repeat(
+                lambda: filter_files_in_repo(
+                    repo_path, filter_settings=settings, file_source=source
+                ),
+                number=1,
+                repeat=REPEAT,
+            )
+        )
+        print(
+            f"  filter    {source.value:<10} {file_count:>8} files {best * 1000:>10.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    for arg in sys.argv[1:]:
+        benchmark(Path(arg))
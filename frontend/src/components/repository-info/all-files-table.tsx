@@ -1,4 +1,4 @@
-import { useState, useMemo } from "react";
+import { useState, useEffect, useMemo } from "react";
 import {
   Table,
   TableBody,
@@ -16,47 +16,71 @@ import {
   SelectTrigger,
   SelectValue,
 } from "@/components/ui/select";
-import { FileData } from "@/types";
+import { FileSortKey, FileTypeAggregation, SortOrder } from "@/types";
 import { formatNumber } from "@/utils/formatters";
 import { Card, CardContent, CardHeader, CardTitle } from "@/components/ui/card";
 import { Button } from "@/components/ui/button";
 import { Checkbox } from "@/components/ui/checkbox";
 import { useExcludeFiles } from "@/services/settings/mutations";
 import { useToast } from "@/hooks/use-toast";
+import { useGetFiles } from "@/services/summary/queries";
+
+// Delay before the search text is sent to the server
+const SEARCH_DELAY_MS = 300;
+const ALL_EXTENSIONS = "all";
 
 interface AllFilesTableParams {
-  fileData: FileData[];
+  fileTypes: FileTypeAggregation[];
   author: string;
   name: string;
 }
 
-function AllFilesTable({ fileData, author, name }: AllFilesTableParams) {
+function AllFilesTable({ fileTypes, author, name }: AllFilesTableParams) {
   const { mutate: excludeFiles } = useExcludeFiles();
   const [searchText, setSearchText] = useState("");
-  const [displayCount, setDisplayCount] = useState(20);
+  const [search, setSearch] = useState("");
+  const [extension, setExtension] = useState(ALL_EXTENSIONS);
+  const [sort, setSort] = useState<FileSortKey>("tokens");
+  const [order, setOrder] = useState<SortOrder>("desc");
+  const [pageSize, setPageSize] = useState(20);
   const [selectedFiles, setSelectedFiles] = useState<Set<string>>(new Set());
 
-  const filteredFiles = useMemo(() => {
-    const normalizedSearchText = searchText.toLowerCase();
-    return fileData.filter((file) => {
-      const fileName = file.name.toLowerCase();
-      const filePath = file.path.toLowerCase();
-      return (
-        fileName.includes(normalizedSearchText) ||
-        filePath.includes(normalizedSearchText)
-      );
-    });
-  }, [fileData, searchText]);
+  useEffect(() => {
+    const timer = setTimeout(() => setSearch(searchText), SEARCH_DELAY_MS);
+    return () => clearTimeout(timer);
+  }, [searchText]);
 
-  const displayedFiles = useMemo(() => {
-    if (displayCount === -1) {
-      return filteredFiles;
-    }
-    return filteredFiles.slice(0, displayCount);
-  }, [filteredFiles, displayCount]);
+  // Files are sorted, filtered and paged by the server
+  const { data, fetchNextPage, hasNextPage, isFetchingNextPage } = useGetFiles({
+    author,
+    name,
+    sort,
+    order,
+    extension: extension === ALL_EXTENSIONS ? null : extension,
+    search,
+    limit: pageSize,
+  });
+
+  const displayedFiles = useMemo(
+    () => data?.pages.flatMap((page) => page.files) ?? [],
+    [data]
+  );
 
   const displayedCount = displayedFiles.length;
-  const totalCount = filteredFiles.length;
+  const totalCount = data?.pages[0]?.total ?? 0;
+
+  const handleSortClick = (key: FileSortKey) => {
+    if (key === sort) {
+      setOrder(order === "asc" ? "desc" : "asc");
+    } else {
+      setSort(key);
+      // Largest files first, names and paths in alphabetical order
+      setOrder(key === "tokens" ? "desc" : "asc");
+    }
+  };
+
+  const sortIndicator = (key: FileSortKey) =>
+    key === sort ? (order === "asc" ? " ▲" : " ▼") : "";
 
   const handleCheckboxChange = (filePath: string) => {
     setSelectedFiles((prev) => {
@@ -108,12 +132,27 @@ function AllFilesTable({ fileData, author, name }: AllFilesTableParams) {
           <div className="flex-grow">
             <Input
               type="text"
-              placeholder="Search by file name..."
+              placeholder="Search by file path..."
               value={searchText}
               onChange={(e) => setSearchText(e.target.value)}
             />
           </div>
 
+          {/* File Type Filter */}
+          <Select value={extension} onValueChange={setExtension}>
+            <SelectTrigger className="w-[180px]">
+              <SelectValue placeholder="File type" />
+            </SelectTrigger>
+            <SelectContent>
+              <SelectItem value={ALL_EXTENSIONS}>All file types</SelectItem>
+              {fileTypes.map((fileType) => (
+                <SelectItem key={fileType.extension} value={fileType.extension}>
+                  {fileType.extension}
+                </SelectItem>
+              ))}
+            </SelectContent>
+          </Select>
+
           {/* Add Filter Button */}
           <Button
             onClick={handleFilterClick}
@@ -129,7 +168,7 @@ function AllFilesTable({ fileData, author, name }: AllFilesTableParams) {
               Show:
             </Label>
             <Select
-              onValueChange={(value) => setDisplayCount(parseInt(value, 10))}
+              onValueChange={(value) => setPageSize(parseInt(value, 10))}
             >
               <SelectTrigger className="w-[180px]">
                 <SelectValue placeholder="Select a number of files" />
@@ -139,7 +178,6 @@ function AllFilesTable({ fileData, author, name }: AllFilesTableParams) {
                 <SelectItem value="50">50</SelectItem>
                 <SelectItem value="100">100</SelectItem>
                 <SelectItem value="200">200</SelectItem>
-                <SelectItem value="-1">All</SelectItem>
               </SelectContent>
             </Select>
           </div>
@@ -150,15 +188,30 @@ function AllFilesTable({ fileData, author, name }: AllFilesTableParams) {
             <TableHeader>
               <TableRow>
                 <TableHead className="w-[50px]"></TableHead>
-                <TableHead className="text-left">File Name</TableHead>
-                <TableHead className="text-left">Path</TableHead>
+                <TableHead
+                  className="text-left cursor-pointer"
+                  onClick={() => handleSortClick("name")}
+                >
+                  File Name{sortIndicator("name")}
+                </TableHead>
+                <TableHead
+                  className="text-left cursor-pointer"
+                  onClick={() => handleSortClick("path")}
+                >
+                  Path{sortIndicator("path")}
+                </TableHead>
                 <TableHead className="text-left">File Type</TableHead>
-                <TableHead className="text-left">Context Length</TableHead>
+                <TableHead
+                  className="text-left cursor-pointer"
+                  onClick={() => handleSortClick("tokens")}
+                >
+                  Context Length{sortIndicator("tokens")}
+                </TableHead>
               </TableRow>
             </TableHeader>
             <TableBody>
-              {displayedFiles.map((file, index) => (
-                <TableRow key={index} className="hover:bg-muted">
+              {displayedFiles.map((file) => (
+                <TableRow key={file.path} className="hover:bg-muted">
                   <TableCell>
                     <Checkbox
                       checked={selectedFiles.has(file.path)}
@@ -176,9 +229,21 @@ function AllFilesTable({ fileData, author, name }: AllFilesTableParams) {
         </div>
 
         {/* Pagination Info */}
-        <div className="mt-4 text-sm text-gray-600">
-          Showing <span id="displayedCount">{displayedCount}</span> of{" "}
-          <span id="totalCount">{totalCount}</span> files
+        <div className="mt-4 flex items-center gap-4 text-sm text-gray-600">
+          <span>
+            Showing <span id="displayedCount">{displayedCount}</span> of{" "}
+            <span id="totalCount">{totalCount}</span> files
+          </span>
+          {hasNextPage && (
+            <Button
+              variant="outline"
+              size="sm"
+              onClick={() => fetchNextPage()}
+              disabled={isFetchingNextPage}
+            >
+              Show more
+            </Button>
+          )}
         </div>
       </CardContent>
     </Card>
@@ -20,7 +20,7 @@ function Report({ summary, author, name }: ReportParams) {
       </div>
 
       <TopFilesChart fileData={fileData} />
-      <AllFilesTable fileData={fileData} author={author} name={name} />
+      <AllFilesTable fileTypes={fileTypes} author={author} name={name} />
     </div>
   );
 }
@@ -28,10 +28,8 @@ interface TopFilesChartParams {
 }
 
 function TopFilesChart({ fileData }: TopFilesChartParams) {
-  // Sort fileData by tokens in descending order and take top 20
-  const sortedFiles = [...fileData]
-    .sort((a, b) => b.tokens - a.tokens)
-    .slice(0, 20);
+  // The summary holds the top files, already in descending order of tokens
+  const sortedFiles = fileData.slice(0, 20);
 
   const labels = sortedFiles.map((file) => file.name);
   const data = sortedFiles.map((file) => file.tokens);
@@ -60,6 +60,7 @@ export function FilterSettingsProvider({
           settings: {
             ...settings,
             maxTokens: filterSettings?.maxTokens || 10,
+            transforms: filterSettings?.transforms,
           },
         },
         {
@@ -80,6 +81,7 @@ export function FilterSettingsProvider({
       author,
       repository,
       filterSettings?.maxTokens,
+      filterSettings?.transforms,
       toast,
       onSave,
     ]
@@ -94,6 +96,7 @@ export function FilterSettingsProvider({
           settings: {
             includePatterns: filterSettings?.includePatterns || [],
             excludePatterns: filterSettings?.excludePatterns || [],
+            transforms: filterSettings?.transforms,
             ...settings,
           },
         },
@@ -115,6 +118,7 @@ export function FilterSettingsProvider({
       repository,
       filterSettings?.includePatterns,
       filterSettings?.excludePatterns,
+      filterSettings?.transforms,
       toast,
       onSave,
     ]
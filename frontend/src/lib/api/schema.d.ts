@@ -73,7 +73,7 @@ export interface paths {
         };
         /**
          * Get a summary of a repository digest
-         * @description Get a summary of a repository digest
+         * @description Get a summary of a repository digest. file_data holds the files with the most tokens, all the files are listed by the files endpoint.
          */
         get: operations["get_summary_of_repository_repositories__author___repository_name__summary_get"];
         put?: never;
@@ -84,6 +84,46 @@ export interface paths {
         patch?: never;
         trace?: never;
     };
+    "/repositories/{author}/{repository_name}/analytics": {
+        parameters: {
+            query?: never;
+            header?: never;
+            path?: never;
+            cookie?: never;
+        };
+        /**
+         * Get the token and size distributions of a repository
+         * @description Get the percentiles and power-of-two histograms of the token counts and sizes of the files of a repository summary, overall and per extension, and the tokens per directory as a tree
+         */
+        get: operations["get_analytics_of_repository_repositories__author___repository_name__analytics_get"];
+        put?: never;
+        post?: never;
+        delete?: never;
+        options?: never;
+        head?: never;
+        patch?: never;
+        trace?: never;
+    };
+    "/repositories/{author}/{repository_name}/files": {
+        parameters: {
+            query?: never;
+            header?: never;
+            path?: never;
+            cookie?: never;
+        };
+        /**
+         * List the files of a repository summary
+         * @description List the files of a repository summary one page at a time, sorted, filtered by extension and searched by path
+         */
+        get: operations["get_files_of_repository_repositories__author___repository_name__files_get"];
+        put?: never;
+        post?: never;
+        delete?: never;
+        options?: never;
+        head?: never;
+        patch?: never;
+        trace?: never;
+    };
     "/digest": {
         parameters: {
             query?: never;
@@ -210,6 +250,47 @@ export interface components {
              */
             branch?: string | null;
         };
+        /**
+         * DirectoryNode
+         * @description Tokens and files of a directory, including its subdirectories
+         */
+        DirectoryNode: {
+            /** Name */
+            name: string;
+            /** Path */
+            path: string;
+            /** Tokens */
+            tokens: number;
+            /** Files */
+            files: number;
+            /** Children */
+            children?: components["schemas"]["DirectoryNode"][];
+        };
+        /** Distribution */
+        Distribution: {
+            /** Count */
+            count: number;
+            /** Total */
+            total: number;
+            /** Mean */
+            mean: number;
+            /** Max */
+            max: number;
+            /** P50 */
+            p50: number;
+            /** P90 */
+            p90: number;
+            /** P99 */
+            p99: number;
+            histogram: components["schemas"]["Histogram"];
+        };
+        /** ExtensionDistribution */
+        ExtensionDistribution: {
+            /** Extension */
+            extension: string;
+            tokens: components["schemas"]["Distribution"];
+            sizes: components["schemas"]["Distribution"];
+        };
         /** File */
         File: {
             /**
@@ -228,6 +309,14 @@ export interface components {
              */
             url: string;
         };
+        /** FileAnalytics */
+        FileAnalytics: {
+            tokens: components["schemas"]["Distribution"];
+            sizes: components["schemas"]["Distribution"];
+            /** Extensions */
+            extensions: components["schemas"]["ExtensionDistribution"][];
+            directories: components["schemas"]["DirectoryNode"];
+        };
         /** FileData */
         FileData: {
             /** Name */
@@ -238,7 +327,30 @@ export interface components {
             extension: string;
             /** Tokens */
             tokens: number;
+            /** Original Tokens */
+            original_tokens?: number | null;
         };
+        /** FilePage */
+        FilePage: {
+            /** Files */
+            files: components["schemas"]["FileData"][];
+            /**
+             * Total
+             * @description The number of files that match the filters
+             */
+            total: number;
+            /**
+             * Next Cursor
+             * @description The cursor of the next page, or null on the last page
+             */
+            next_cursor?: string | null;
+        };
+        /**
+         * FileSortKey
+         * @description ファイル一覧の並べ替えに使える列
+         * @enum {string}
+         */
+        FileSortKey: "tokens" | "path" | "name";
         /** FileType */
         FileType: {
             /** Extension */
@@ -255,6 +367,28 @@ export interface components {
              * @description The URL of the repository to create a digest
              */
             url: string;
+            /**
+             * Token Budget
+             * @description Split the digest into parts of at most this many tokens, returned as a zip file with an index
+             */
+            token_budget?: number | null;
+            /**
+             * Dedup
+             * @description Write identical files once and replace later copies with references
+             * @default false
+             */
+            dedup?: boolean;
+        };
+        /**
+         * Histogram
+         * @description Counts of values in power-of-two bins. The first bin holds 0 and bin i
+         *     holds the values from edges[i] up to, but not including, edges[i + 1].
+         */
+        Histogram: {
+            /** Edges */
+            edges: number[];
+            /** Counts */
+            counts: number[];
         };
         /** HTTPValidationError */
         HTTPValidationError: {
@@ -308,6 +442,11 @@ export interface components {
             author: string;
             /** Files */
             files: components["schemas"]["File"][];
+            /**
+             * Next Cursor
+             * @description The cursor of the next page, or null on the last page
+             */
+            next_cursor?: string | null;
         };
         /** Settings */
         Settings: {
@@ -326,7 +465,17 @@ export interface components {
              * @description The maximum tokens to include in the digest
              */
             max_tokens: number;
+            /**
+             * Transforms
+             * @description The transforms applied to the content of each file in the digest
+             */
+            transforms?: components["schemas"]["TransformName"][];
         };
+        /**
+         * SortOrder
+         * @enum {string}
+         */
+        SortOrder: "asc" | "desc";
         /** Summary */
         Summary: {
             /** Author */
@@ -349,7 +498,15 @@ export interface components {
             context_length: number;
             /** File Data */
             file_data: components["schemas"]["FileData"][];
+            /** Original Context Length */
+            original_context_length?: number | null;
         };
+        /**
+         * TransformName
+         * @description The transforms that can be enabled in the filter settings
+         * @enum {string}
+         */
+        TransformName: "drop_license_header" | "strip_comments" | "truncate_data_literals" | "collapse_whitespace";
         /** ValidationError */
         ValidationError: {
             /** Location */
@@ -589,6 +746,83 @@ export interface operations {
             };
         };
     };
+    get_analytics_of_repository_repositories__author___repository_name__analytics_get: {
+        parameters: {
+            query?: never;
+            header?: never;
+            path: {
+                author: string;
+                repository_name: string;
+            };
+            cookie?: never;
+        };
+        requestBody?: never;
+        responses: {
+            /** @description Successful Response */
+            200: {
+                headers: {
+                    [name: string]: unknown;
+                };
+                content: {
+                    "application/json": components["schemas"]["FileAnalytics"];
+                };
+            };
+            /** @description Validation Error */
+            422: {
+                headers: {
+                    [name: string]: unknown;
+                };
+                content: {
+                    "application/json": components["schemas"]["HTTPValidationError"];
+                };
+            };
+        };
+    };
+    get_files_of_repository_repositories__author___repository_name__files_get: {
+        parameters: {
+            query?: {
+                /** @description Sort key */
+                sort?: components["schemas"]["FileSortKey"];
+                /** @description Sort order */
+                order?: components["schemas"]["SortOrder"];
+                /** @description Only list files with this extension */
+                extension?: string | null;
+                /** @description Only list files whose path contains this text */
+                search?: string | null;
+                /** @description The cursor of the page to return */
+                cursor?: string | null;
+                /** @description The maximum number of files in a page */
+                limit?: number;
+            };
+            header?: never;
+            path: {
+                author: string;
+                repository_name: string;
+            };
+            cookie?: never;
+        };
+        requestBody?: never;
+        responses: {
+            /** @description Successful Response */
+            200: {
+                headers: {
+                    [name: string]: unknown;
+                };
+                content: {
+                    "application/json": components["schemas"]["FilePage"];
+                };
+            };
+            /** @description Validation Error */
+            422: {
+                headers: {
+                    [name: string]: unknown;
+                };
+                content: {
+                    "application/json": components["schemas"]["HTTPValidationError"];
+                };
+            };
+        };
+    };
     generate_digest_digest_post: {
         parameters: {
             query?: never;
@@ -622,9 +856,18 @@ export interface operations {
     };
     get_repository_digest_repositories__author___repository_name__digest_get: {
         parameters: {
-            query?: never;
+            query?: {
+                /** @description The cursor of the page to return (JSON and NDJSON) */
+                cursor?: string | null;
+                /** @description The maximum number of files in a page */
+                limit?: number | null;
+                /** @description The maximum size of the file contents in a page, in bytes */
+                max_bytes?: number | null;
+            };
             header?: {
                 accept?: string;
+                "if-none-match"?: string | null;
+                "accept-encoding"?: string | null;
             };
             path: {
                 author: string;
@@ -25,6 +25,7 @@ function useUpdateSettings() {
           include_files: params.settings.includePatterns,
           exclude_files: params.settings.excludePatterns,
           max_tokens: params.settings.maxTokens,
+          transforms: params.settings.transforms,
         },
       }),
     onSuccess: () => {
@@ -38,6 +39,7 @@ function toSettings(data: components["schemas"]["Settings"]): Settings {
     includePatterns: data.include_files,
     excludePatterns: data.exclude_files,
     maxTokens: data.max_tokens,
+    transforms: data.transforms,
   };
 }
 
@@ -81,6 +83,7 @@ function useExcludeFiles() {
           include_files: settings.includePatterns,
           exclude_files: [...settings.excludePatterns, ...params.paths],
           max_tokens: settings.maxTokens,
+          transforms: settings.transforms,
         },
       });
     },
@@ -7,6 +7,7 @@ function toSettings(data: components["schemas"]["Settings"]): Settings {
     includePatterns: data.include_files,
     excludePatterns: data.exclude_files,
     maxTokens: data.max_tokens,
+    transforms: data.transforms,
   };
 }
 
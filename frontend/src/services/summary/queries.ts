@@ -1,7 +1,7 @@
 import client from "@/lib/api/client";
 import { components } from "@/lib/api/schema";
-import { Summary } from "@/types";
-import { useQuery } from "@tanstack/react-query";
+import { FilePage, FileSortKey, SortOrder, Summary } from "@/types";
+import { useInfiniteQuery, useQuery } from "@tanstack/react-query";
 
 function toSummary(response: components["schemas"]["Summary"]): Summary {
   return {
@@ -54,4 +54,72 @@ function useGetSummary(params: GetSummaryParams) {
   return query;
 }
 
-export { useGetSummary };
+function toFilePage(response: components["schemas"]["FilePage"]): FilePage {
+  return {
+    files: response.files.map((file: components["schemas"]["FileData"]) => ({
+      name: file.name,
+      path: file.path,
+      extension: file.extension,
+      tokens: file.tokens,
+    })),
+    total: response.total,
+    nextCursor: response.next_cursor ?? null,
+  };
+}
+
+type GetFilesParams = {
+  author: string;
+  name: string;
+  sort: FileSortKey;
+  order: SortOrder;
+  extension: string | null;
+  search: string;
+  limit: number;
+};
+function useGetFiles(params: GetFilesParams) {
+  // Nested under the summary key, so the pages are refetched with the summary
+  const query = useInfiniteQuery({
+    queryKey: [
+      "summary",
+      params.author,
+      params.name,
+      "files",
+      params.sort,
+      params.order,
+      params.extension,
+      params.search,
+      params.limit,
+    ],
+    enabled: !!params.author && !!params.name,
+    staleTime: Infinity,
+    initialPageParam: null as string | null,
+    queryFn: async ({ pageParam }) => {
+      const response = await client.GET(
+        `/repositories/{author}/{repository_name}/files`,
+        {
+          params: {
+            path: {
+              author: params.author,
+              repository_name: params.name,
+            },
+            query: {
+              sort: params.sort,
+              order: params.order,
+              extension: params.extension ?? undefined,
+              search: params.search || undefined,
+              cursor: pageParam ?? undefined,
+              limit: params.limit,
+            },
+          },
+        }
+      );
+      return response?.data
+        ? toFilePage(response.data)
+        : { files: [], total: 0, nextCursor: null };
+    },
+    getNextPageParam: (lastPage: FilePage) => lastPage.nextCursor,
+  });
+  return query;
+}
+
+export { useGetSummary, useGetFiles };
@@ -45,13 +45,31 @@ type Summary = {
   minFileSizeKb: number;
   fileTypes: FileTypeAggregation[];
   contextLength: number;
+  // The files with the most tokens, all the files are listed page by page
   fileData: FileData[];
 }
 
+type FileSortKey = "tokens" | "path" | "name";
+
+type SortOrder = "asc" | "desc";
+
+type FilePage = {
+  files: FileData[];
+  total: number;
+  nextCursor: string | null;
+}
+
 type Settings = {
   includePatterns: string[];
   excludePatterns: string[];
   maxTokens: number;
+  transforms?: TransformName[];
 }
 
-export type { Repository, FileStats, FileFilter, Summary, FileTypeAggregation, FileData, Settings };
+type TransformName =
+  | "drop_license_header"
+  | "strip_comments"
+  | "truncate_data_literals"
+  | "collapse_whitespace";
+
+export type { Repository, FileStats, FileFilter, Summary, FileTypeAggregation, FileData, FilePage, FileSortKey, SortOrder, Settings, TransformName };
@@ -1,10 +1,38 @@
-from typing import List, Optional
+import json
+import time
+from dataclasses import replace
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple, Type, Union
 
-from sqlalchemy import create_engine
-from sqlmodel import Field, Session, SQLModel, select
+from sqlalchemy import (
+    Index,
+    UniqueConstraint,
+    create_engine,
+    delete,
+    func,
+    literal,
+    tuple_,
+    update,
+)
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.sql.elements import ColumnElement
+from sqlmodel import Field, Session, SQLModel, col, select
 
+from repo_tool.core.analytics import FileAnalytics, analyze_files
+from repo_tool.core.digest import decode_cursor, encode_cursor
 from repo_tool.core.filter import FilterSettings
-from repo_tool.core.summary import FileData, FileType, Summary
+from repo_tool.core.incremental import FilterResult
+from repo_tool.core.scan import FileRecord, file_extension
+from repo_tool.core.summary import (
+    TOP_FILES,
+    FileData,
+    FileDataColumns,
+    FileSortKey,
+    FileStats,
+    FileType,
+    SortOrder,
+    Summary,
+)
 
 
 class FilterSettingsTable(SQLModel, table=True):
@@ -16,10 +44,140 @@ class FilterSettingsTable(SQLModel, table=True):
 class SummaryCacheTable(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     repository_id: str
-    summary_json: str  # Store JSON string of Summary
+    summary_json: str  # Store JSON string of Summary, without its file_data
     last_updated: str
 
 
+class SummaryFileDataTable(SQLModel, table=True):
+    """The file_data of a cached summary, stored column by column"""
+
+    repository_id: str = Field(primary_key=True)
+    data: bytes
+
+
+class SummaryAnalyticsTable(SQLModel, table=True):
+    """The token and size distributions of a cached summary"""
+
+    repository_id: str = Field(primary_key=True)
+    analytics_json: str
+
+
+class SummarySourceTable(SQLModel, table=True):
+    """
+    The stored filter result a cached summary was built from. The summary is
+    current while the key of the filter result of the repository is the same.
+    """
+
+    repository_id: str = Field(primary_key=True)
+    source_key: str
+
+
+class SummaryFileTable(SQLModel, table=True):
+    """
+    One row per file of a cached summary, read page by page by the file list.
+    Only stored for summaries of transformed files or uncommitted changes, the
+    files of other summaries are listed from their filter result.
+    """
+
+    __table_args__ = (
+        UniqueConstraint("repository_id", "path"),
+        # Each sort key is read in order, starting after the cursor, from these
+        Index(
+            "ix_summaryfiletable_repository_tokens", "repository_id", "tokens", "path"
+        ),
+        Index("ix_summaryfiletable_repository_name", "repository_id", "name", "path"),
+        Index(
+            "ix_summaryfiletable_repository_extension",
+            "repository_id",
+            "extension",
+            "tokens",
+            "path",
+        ),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    repository_id: str
+    path: str
+    name: str
+    extension: str
+    tokens: int
+    original_tokens: Optional[int] = None
+
+
+class TokenCountTable(SQLModel, table=True):
+    __table_args__ = (UniqueConstraint("blob_sha", "encoding"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    blob_sha: str = Field(index=True)
+    encoding: str
+    tokens: int
+    last_used: float = Field(index=True)
+
+
+class FilterStateTable(SQLModel, table=True):
+    __table_args__ = (UniqueConstraint("repository_id", "state_key"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    repository_id: str = Field(index=True)
+    state_key: str
+    commit_sha: str
+
+
+class FilterResultTable(SQLModel, table=True):
+    __table_args__ = (
+        UniqueConstraint("state_id", "path"),
+        # The summary reads the smallest and largest files and the files in
+        # token order through these, and the file list reads each sort key in
+        # order, starting after the cursor
+        Index("ix_filterresulttable_state_size", "state_id", "size"),
+        Index("ix_filterresulttable_state_tokens", "state_id", "tokens", "path"),
+        Index("ix_filterresulttable_state_name", "state_id", "name", "path"),
+        Index(
+            "ix_filterresulttable_state_extension",
+            "state_id",
+            "extension",
+            "tokens",
+            "path",
+        ),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    state_id: int = Field(index=True)
+    path: str
+    name: str
+    extension: str
+    size: int
+    tokens: Optional[int] = None
+    blob_sha: Optional[str] = None
+
+
+class FilterSummaryTable(SQLModel, table=True):
+    """Totals of a filter result, updated with every change to its files"""
+
+    state_id: int = Field(primary_key=True)
+    file_count: int = 0
+    total_size: int = 0
+    context_length: int = 0
+
+
+class FilterExtensionTable(SQLModel, table=True):
+    """Counts and tokens of a filter result per extension"""
+
+    __table_args__ = (UniqueConstraint("state_id", "extension"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    state_id: int = Field(index=True)
+    extension: str
+    count: int = 0
+    tokens: int = 0
+
+
+# Maximum number of token counts kept before the least recently used are evicted
+MAX_TOKEN_COUNT_ENTRIES = 500_000
+# Number of SQL parameters used per lookup
+LOOKUP_BATCH_SIZE = 500
+
+
 def get_repository_id(author: str, repository_name: str) -> str:
     return f"{author}/{repository_name}"
 
@@ -49,6 +207,7 @@ class FilterSettingsRepository:
         include_patterns: List[str],
         exclude_patterns: List[str],
         max_tokens: int,
+        transforms: Optional[List[str]] = None,
     ) -> FilterSettings:
         """
         Create or update FilterSettings
@@ -58,6 +217,7 @@ class FilterSettingsRepository:
             include_patterns=include_patterns,
             exclude_patterns=exclude_patterns,
             max_tokens=max_tokens,
+            transforms=transforms or [],
         )
 
         statement = select(FilterSettingsTable).where(
@@ -114,18 +274,73 @@ class SummaryCacheRepository:
         )
         result = self.session.exec(statement).first()
         if result:
-            return Summary.from_json(result.summary_json)
+            return self._load(
+                result, self.session.get(SummaryFileDataTable, repository_id)
+            )
         return None
 
-    def upsert(self, summary: Summary, last_updated: str) -> Summary:
+    def _load(
+        self, cache: SummaryCacheTable, file_data: Optional[SummaryFileDataTable]
+    ) -> Summary:
+        """
+        Summaries cached before file_data was stored by column still have it in
+        their JSON
+        """
+        summary = Summary.from_json(cache.summary_json)
+        if file_data is not None:
+            summary.file_data = FileDataColumns.from_bytes(file_data.data)
+        return summary
+
+    def upsert(
+        self,
+        summary: Summary,
+        last_updated: str,
+        files: Optional[Iterable[FileData]] = None,
+        analytics: Optional[FileAnalytics] = None,
+        source_key: Optional[str] = None,
+    ) -> Summary:
         """
         Create or update SummaryCache
         Returns the created or updated Summary
+
+        files are all the files of the summary, stored for the file list when
+        it is not read from a filter result, and are kept when not given.
+        analytics are the distributions of the files. They only hold for this
+        summary, so they are dropped when not given, see put_analytics.
+        source_key identifies the filter result the summary was built from, see
+        get_source_key. Without it the summary is never current.
         """
         repository_id = get_repository_id(summary.author, summary.repository)
+        source = self.session.get(SummarySourceTable, repository_id)
+        if source_key is not None:
+            self.session.merge(
+                SummarySourceTable(repository_id=repository_id, source_key=source_key)
+            )
+        elif source is not None:
+            self.session.delete(source)
+        if files is not None:
+            self._replace_files(repository_id, files)
+        if analytics is not None:
+            self.session.merge(
+                SummaryAnalyticsTable(
+                    repository_id=repository_id, analytics_json=analytics.to_json()
+                )
+            )
+        else:
+            self.session.exec(  # type: ignore[call-overload]
+                delete(SummaryAnalyticsTable).where(
+                    col(SummaryAnalyticsTable.repository_id) == repository_id
+                )
+            )
+        columns = summary.file_data
+        if not isinstance(columns, FileDataColumns):
+            columns = FileDataColumns.from_file_data(summary.file_data)
+        self.session.merge(
+            SummaryFileDataTable(repository_id=repository_id, data=columns.to_bytes())
+        )
         cache = SummaryCacheTable(
             repository_id=repository_id,
-            summary_json=summary.to_json(),
+            summary_json=replace(summary, file_data=[]).to_json(),
             last_updated=last_updated,
         )
 
@@ -155,6 +370,16 @@ class SummaryCacheRepository:
         )
         existing = self.session.exec(statement).first()
         if existing:
+            self._delete_files(repository_id)
+            analytics = self.session.get(SummaryAnalyticsTable, repository_id)
+            if analytics is not None:
+                self.session.delete(analytics)
+            file_data = self.session.get(SummaryFileDataTable, repository_id)
+            if file_data is not None:
+                self.session.delete(file_data)
+            source = self.session.get(SummarySourceTable, repository_id)
+            if source is not None:
+                self.session.delete(source)
             self.session.delete(existing)
             self.session.commit()
             return True
@@ -164,6 +389,10 @@ class SummaryCacheRepository:
         all_cache = self.session.exec(select(SummaryCacheTable)).all()
         for cache in all_cache:
             self.session.delete(cache)
+        self.session.exec(delete(SummaryFileDataTable))  # type: ignore[call-overload]
+        self.session.exec(delete(SummaryFileTable))  # type: ignore[call-overload]
+        self.session.exec(delete(SummaryAnalyticsTable))  # type: ignore[call-overload]
+        self.session.exec(delete(SummarySourceTable))  # type: ignore[call-overload]
         self.session.commit()
 
     def count(self) -> int:
@@ -171,7 +400,665 @@ class SummaryCacheRepository:
 
     def get_all(self) -> List[Summary]:
         result = self.session.exec(select(SummaryCacheTable)).all()
-        return [Summary.from_json(cache.summary_json) for cache in result]
+        file_data = {
+            row.repository_id: row
+            for row in self.session.exec(select(SummaryFileDataTable)).all()
+        }
+        return [
+            self._load(cache, file_data.get(cache.repository_id)) for cache in result
+        ]
+
+    def get_source_key(self, repository_id: str) -> Optional[str]:
+        """
+        Returns the key of the filter result the cached summary was built from,
+        or None when the summary was not built from a stored filter result
+        """
+        source = self.session.get(SummarySourceTable, repository_id)
+        return source.source_key if source is not None else None
+
+    def has_files(self, repository_id: str) -> bool:
+        """
+        Returns whether files are stored for the summary, which is not the case
+        for summaries cached before the file list was stored
+        """
+        return (
+            self.session.exec(
+                select(SummaryFileTable.id)
+                .where(SummaryFileTable.repository_id == repository_id)
+                .limit(1)
+            ).first()
+            is not None
+        )
+
+    def get_analytics_json(self, repository_id: str) -> Optional[str]:
+        """
+        Returns the stored distributions of a summary as JSON, or None for
+        summaries cached before they were stored
+        """
+        analytics = self.session.get(SummaryAnalyticsTable, repository_id)
+        return analytics.analytics_json if analytics is not None else None
+
+    def put_analytics(self, repository_id: str, analytics: FileAnalytics) -> str:
+        """
+        Stores the distributions of the files of a cached summary and returns
+        them as JSON
+        """
+        analytics_json = analytics.to_json()
+        self.session.merge(
+            SummaryAnalyticsTable(
+                repository_id=repository_id, analytics_json=analytics_json
+            )
+        )
+        self.session.commit()
+        return analytics_json
+
+    def get_files(
+        self,
+        repository_id: str,
+        sort: FileSortKey = FileSortKey.TOKENS,
+        order: SortOrder = SortOrder.DESC,
+        extension: Optional[str] = None,
+        search: Optional[str] = None,
+        cursor: Optional[str] = None,
+        limit: int = 50,
+    ) -> Tuple[List[FileData], int, Optional[str]]:
+        """
+        Returns one page of the stored files of a summary, the number of files
+        that match the filters, and the cursor of the next page, see page_files
+        """
+        return page_files(
+            self.session,
+            SummaryFileTable,
+            col(SummaryFileTable.repository_id) == repository_id,
+            sort,
+            order,
+            extension,
+            search,
+            cursor,
+            limit,
+        )
+
+    def _replace_files(self, repository_id: str, files: Iterable[FileData]) -> None:
+        self._delete_files(repository_id)
+        rows = [
+            {
+                "repository_id": repository_id,
+                "path": file.path,
+                "name": file.name,
+                "extension": file.extension,
+                "tokens": file.tokens,
+                "original_tokens": file.original_tokens,
+            }
+            for file in files
+        ]
+        for i in range(0, len(rows), LOOKUP_BATCH_SIZE):
+            self.session.exec(  # type: ignore[call-overload]
+                insert(SummaryFileTable).values(rows[i : i + LOOKUP_BATCH_SIZE])
+            )
+
+    def _delete_files(self, repository_id: str) -> None:
+        self.session.exec(  # type: ignore[call-overload]
+            delete(SummaryFileTable).where(
+                col(SummaryFileTable.repository_id) == repository_id
+            )
+        )
+
+
+def page_files(
+    session: Session,
+    table: Union[Type[SummaryFileTable], Type["FilterResultTable"]],
+    owner: ColumnElement[bool],
+    sort: FileSortKey,
+    order: SortOrder,
+    extension: Optional[str],
+    search: Optional[str],
+    cursor: Optional[str],
+    limit: int,
+) -> Tuple[List[FileData], int, Optional[str]]:
+    """
+    Returns one page of the files of table that match owner, the number of
+    files that match the filters, and the cursor of the next page, or None on
+    the last page.
+
+    Pages are read from an index in the order of the sort key, then of the
+    path, so a page starts right after the last file of the previous one.
+    search matches a part of the path, ignoring ASCII case. Raises ValueError
+    for a cursor of another sort key or order.
+    """
+    name_column = col(table.name)
+    path_column = col(table.path)
+    extension_column = col(table.extension)
+    tokens_column = col(table.tokens)
+    # Only the files of a summary keep their tokens before transforms
+    original_column = (
+        col(SummaryFileTable.original_tokens)
+        if table is SummaryFileTable
+        else literal(None)
+    )
+    sort_column = {
+        FileSortKey.TOKENS: tokens_column,
+        FileSortKey.PATH: path_column,
+        FileSortKey.NAME: name_column,
+    }[sort]
+    conditions = [owner]
+    if extension is not None:
+        conditions.append(extension_column == extension)
+    if search:
+        pattern = search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        conditions.append(path_column.like(f"%{pattern}%", escape="\\"))
+    total = session.exec(
+        select(func.count()).select_from(table).where(*conditions)
+    ).one()
+
+    keys = tuple_(sort_column, path_column)
+    if cursor:
+        cursor_sort, cursor_order, value, path = _decode_file_cursor(cursor)
+        if (cursor_sort, cursor_order) != (sort.value, order.value):
+            raise ValueError(f"Cursor of another sort order: {cursor}")
+        after = tuple_(literal(value), literal(path))
+        conditions.append(keys < after if order == SortOrder.DESC else keys > after)
+    ordering = (
+        [sort_column.desc(), path_column.desc()]
+        if order == SortOrder.DESC
+        else [sort_column, path_column]
+    )
+    rows = session.exec(
+        select(  # type: ignore[call-overload]
+            name_column, path_column, extension_column, tokens_column, original_column
+        )
+        .where(*conditions)
+        .order_by(*ordering)
+        .limit(limit + 1)
+    ).all()
+
+    files = [
+        FileData(
+            name=name,
+            path=path,
+            extension=row_extension,
+            tokens=tokens or 0,
+            original_tokens=original_tokens,
+        )
+        for name, path, row_extension, tokens, original_tokens in rows[:limit]
+    ]
+    next_cursor = None
+    if len(rows) > limit:
+        last = files[-1]
+        # The sort keys are named after the fields of FileData
+        last_value = getattr(last, sort.value)
+        next_cursor = encode_cursor(
+            json.dumps([sort.value, order.value, last_value, last.path])
+        )
+    return files, total, next_cursor
+
+
+def _decode_file_cursor(cursor: str) -> Tuple[str, str, Union[int, str], str]:
+    try:
+        sort, order, value, path = json.loads(decode_cursor(cursor))
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    if not isinstance(value, (int, str)) or not isinstance(path, str):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return sort, order, value, path
+
+
+class TokenCountRepository:
+    """
+    Token counts keyed by git blob SHA and encoding name, shared by all
+    repositories. Implements the TokenCountStore protocol of the token cache.
+    """
+
+    def __init__(self, session: Session, max_entries: int = MAX_TOKEN_COUNT_ENTRIES):
+        self.session = session
+        self.max_entries = max_entries
+
+    def get_many(self, blob_shas: Iterable[str], encoding_name: str) -> Dict[str, int]:
+        """
+        Get token counts by blob SHA. They are marked as recently used by
+        touch_many, so a lookup only reads.
+        """
+        shas = list(blob_shas)
+        counts: Dict[str, int] = {}
+        for i in range(0, len(shas), LOOKUP_BATCH_SIZE):
+            batch = shas[i : i + LOOKUP_BATCH_SIZE]
+            statement = select(TokenCountTable).where(
+                col(TokenCountTable.blob_sha).in_(batch),
+                TokenCountTable.encoding == encoding_name,
+            )
+            for row in self.session.exec(statement):
+                counts[row.blob_sha] = row.tokens
+        return counts
+
+    def touch_many(self, blob_shas: Iterable[str], encoding_name: str) -> None:
+        """
+        Mark token counts as recently used
+        """
+        shas = list(blob_shas)
+        now = time.time()
+        for i in range(0, len(shas), LOOKUP_BATCH_SIZE):
+            self.session.exec(  # type: ignore[call-overload]
+                update(TokenCountTable)
+                .where(
+                    col(TokenCountTable.blob_sha).in_(shas[i : i + LOOKUP_BATCH_SIZE]),
+                    col(TokenCountTable.encoding) == encoding_name,
+                )
+                .values(last_used=now)
+            )
+        if shas:
+            self.session.commit()
+
+    def put_many(self, counts: Dict[str, int], encoding_name: str) -> None:
+        """
+        Store token counts and evict the least recently used entries when the
+        table grows beyond max_entries
+        """
+        if not counts:
+            return
+        now = time.time()
+        rows = [
+            {
+                "blob_sha": blob_sha,
+                "encoding": encoding_name,
+                "tokens": tokens,
+                "last_used": now,
+            }
+            for blob_sha, tokens in counts.items()
+        ]
+        for i in range(0, len(rows), LOOKUP_BATCH_SIZE):
+            self.session.exec(  # type: ignore[call-overload]
+                insert(TokenCountTable)
+                .values(rows[i : i + LOOKUP_BATCH_SIZE])
+                .on_conflict_do_nothing()
+            )
+        self.session.commit()
+        self.evict()
+
+    def evict(self) -> int:
+        """
+        Delete the least recently used entries beyond max_entries.
+        Returns the number of deleted entries.
+        """
+        excess = self.count() - self.max_entries
+        if excess <= 0:
+            return 0
+        oldest = (
+            select(TokenCountTable.id)
+            .order_by(col(TokenCountTable.last_used))
+            .limit(excess)
+        )
+        self.session.exec(  # type: ignore[call-overload]
+            delete(TokenCountTable).where(col(TokenCountTable.id).in_(oldest))
+        )
+        self.session.commit()
+        return excess
+
+    def count(self) -> int:
+        return self.session.exec(
+            select(func.count()).select_from(TokenCountTable)
+        ).one()
+
+    def delete_all(self) -> None:
+        self.session.exec(delete(TokenCountTable))  # type: ignore[call-overload]
+        self.session.commit()
+
+
+class FilterResultRepository:
+    """
+    The files that passed the filters of a repository at its last processed
+    commit, one result per state key. Implements the FilterResultStore protocol
+    used for incremental re-filtering.
+    """
+
+    def __init__(self, session: Session):
+        self.session = session
+
+    def get(self, repository_id: str, state_key: str) -> Optional[FilterResult]:
+        state = self._get_state(repository_id, state_key)
+        if state is None:
+            return None
+        rows = self.session.exec(
+            select(FilterResultTable).where(FilterResultTable.state_id == state.id)
+        )
+        records = [
+            FileRecord(
+                path=Path(row.path),
+                relative_path=row.path,
+                size=row.size,
+                extension=row.extension,
+                tokens=row.tokens,
+                blob_sha=row.blob_sha,
+            )
+            for row in rows
+        ]
+        return FilterResult(commit_sha=state.commit_sha, records=records)
+
+    def get_commit(self, repository_id: str, state_key: str) -> Optional[str]:
+        state = self._get_state(repository_id, state_key)
+        return None if state is None else state.commit_sha
+
+    def get_files(
+        self,
+        repository_id: str,
+        state_key: str,
+        sort: FileSortKey = FileSortKey.TOKENS,
+        order: SortOrder = SortOrder.DESC,
+        extension: Optional[str] = None,
+        search: Optional[str] = None,
+        cursor: Optional[str] = None,
+        limit: int = 50,
+    ) -> Tuple[List[FileData], int, Optional[str]]:
+        """
+        Returns one page of the files of a stored result, the number of files
+        that match the filters, and the cursor of the next page, see page_files
+        """
+        state = self._get_state(repository_id, state_key)
+        if state is None:
+            return [], 0, None
+        return page_files(
+            self.session,
+            FilterResultTable,
+            col(FilterResultTable.state_id) == state.id,
+            sort,
+            order,
+            extension,
+            search,
+            cursor,
+            limit,
+        )
+
+    def get_file_analytics(
+        self, repository_id: str, state_key: str
+    ) -> Optional[FileAnalytics]:
+        """
+        Returns the distributions of the files of a stored result, reading only
+        the columns they are computed from
+        """
+        state = self._get_state(repository_id, state_key)
+        if state is None:
+            return None
+        rows = self.session.exec(
+            select(
+                FilterResultTable.path,
+                FilterResultTable.extension,
+                col(FilterResultTable.tokens),
+                FilterResultTable.size,
+            ).where(FilterResultTable.state_id == state.id)
+        ).all()
+        return analyze_files(
+            [path for path, _, _, _ in rows],
+            [extension for _, extension, _, _ in rows],
+            [tokens or 0 for _, _, tokens, _ in rows],
+            [size for _, _, _, size in rows],
+        )
+
+    def get_file_stats(self, repository_id: str, state_key: str) -> Optional[FileStats]:
+        """
+        Returns the summary statistics of a stored result from its totals. Only
+        the TOP_FILES files with the most tokens and the smallest and largest
+        file are read, each from the start of an index, so the cost does not
+        follow the number of files. The other files are listed by get_files.
+        """
+        state = self._get_state(repository_id, state_key)
+        if state is None or state.id is None:
+            return None
+        state_id = state.id
+        totals = self.session.get(FilterSummaryTable, state_id)
+        if totals is None:
+            return None
+
+        extensions = self.session.exec(
+            select(FilterExtensionTable).where(
+                FilterExtensionTable.state_id == state_id
+            )
+        )
+        sizes = select(FilterResultTable.size).where(
+            FilterResultTable.state_id == state_id
+        )
+        min_size = self.session.exec(
+            sizes.order_by(col(FilterResultTable.size)).limit(1)
+        ).first()
+        max_size = self.session.exec(
+            sizes.order_by(col(FilterResultTable.size).desc()).limit(1)
+        ).first()
+        rows = self.session.exec(
+            select(
+                FilterResultTable.path,
+                FilterResultTable.name,
+                FilterResultTable.extension,
+                col(FilterResultTable.tokens),
+            )
+            .where(FilterResultTable.state_id == state_id)
+            .order_by(
+                col(FilterResultTable.tokens).desc(), col(FilterResultTable.path).desc()
+            )
+            .limit(TOP_FILES)
+        )
+        file_data = [
+            FileData(name=name, path=path, extension=extension, tokens=tokens or 0)
+            for path, name, extension, tokens in rows
+        ]
+
+        total_size = totals.total_size / 1024  # bytes to KB
+        return FileStats(
+            file_count=totals.file_count,
+            total_size=total_size,
+            average_size=(
+                total_size / totals.file_count if totals.file_count > 0 else 0
+            ),
+            max_size=(max_size or 0) / 1024,
+            min_size=(min_size or 0) / 1024,
+            context_length=totals.context_length,
+            extension_tokens=[
+                FileType(extension=row.extension, count=row.count, tokens=row.tokens)
+                for row in extensions
+            ],
+            file_data=file_data,
+        )
+
+    def replace(
+        self,
+        repository_id: str,
+        state_key: str,
+        commit_sha: str,
+        records: Iterable[FileRecord],
+    ) -> None:
+        """
+        Replace the whole result of a repository and state key
+        """
+        state_id = self._upsert_state(repository_id, state_key, commit_sha)
+        self.session.exec(  # type: ignore[call-overload]
+            delete(FilterResultTable).where(col(FilterResultTable.state_id) == state_id)
+        )
+        self._delete_stats([state_id])
+        records = list(records)
+        self._insert(state_id, records)
+        self._apply_stats(state_id, [], records)
+        self.session.commit()
+
+    def apply(
+        self,
+        repository_id: str,
+        state_key: str,
+        commit_sha: str,
+        removed_paths: Iterable[str],
+        records: Iterable[FileRecord],
+    ) -> None:
+        """
+        Remove the given paths, then add the given records. The totals are
+        updated with the rows removed and added, so the cost follows the number
+        of changed files.
+        """
+        state_id = self._upsert_state(repository_id, state_key, commit_sha)
+        records = list(records)
+        # Replaced records are removed first, so their old rows are subtracted
+        paths = list(set(removed_paths).union(r.relative_path for r in records))
+        removed: List[Tuple[str, int, Optional[int]]] = []
+        for i in range(0, len(paths), LOOKUP_BATCH_SIZE):
+            batch = paths[i : i + LOOKUP_BATCH_SIZE]
+            removed.extend(
+                self.session.exec(
+                    select(
+                        FilterResultTable.path,
+                        FilterResultTable.size,
+                        col(FilterResultTable.tokens),
+                    ).where(
+                        FilterResultTable.state_id == state_id,
+                        col(FilterResultTable.path).in_(batch),
+                    )
+                )
+            )
+            self.session.exec(  # type: ignore[call-overload]
+                delete(FilterResultTable).where(
+                    col(FilterResultTable.state_id) == state_id,
+                    col(FilterResultTable.path).in_(batch),
+                )
+            )
+        self._insert(state_id, records)
+        self._apply_stats(state_id, removed, records)
+        self.session.commit()
+
+    def delete_by_repository_id(self, repository_id: str) -> None:
+        """
+        リポジトリIDでフィルター結果を削除
+        """
+        state_ids = select(FilterStateTable.id).where(
+            FilterStateTable.repository_id == repository_id
+        )
+        self.session.exec(  # type: ignore[call-overload]
+            delete(FilterResultTable).where(
+                col(FilterResultTable.state_id).in_(state_ids)
+            )
+        )
+        self._delete_stats(self.session.exec(state_ids).all())
+        self.session.exec(  # type: ignore[call-overload]
+            delete(FilterStateTable).where(
+                col(FilterStateTable.repository_id) == repository_id
+            )
+        )
+        self.session.commit()
+
+    def delete_all(self) -> None:
+        self.session.exec(delete(FilterResultTable))  # type: ignore[call-overload]
+        self.session.exec(delete(FilterSummaryTable))  # type: ignore[call-overload]
+        self.session.exec(delete(FilterExtensionTable))  # type: ignore[call-overload]
+        self.session.exec(delete(FilterStateTable))  # type: ignore[call-overload]
+        self.session.commit()
+
+    def _get_state(
+        self, repository_id: str, state_key: str
+    ) -> Optional[FilterStateTable]:
+        return self.session.exec(
+            select(FilterStateTable).where(
+                FilterStateTable.repository_id == repository_id,
+                FilterStateTable.state_key == state_key,
+            )
+        ).first()
+
+    def _upsert_state(self, repository_id: str, state_key: str, commit_sha: str) -> int:
+        state = self._get_state(repository_id, state_key)
+        if state is None:
+            state = FilterStateTable(
+                repository_id=repository_id, state_key=state_key, commit_sha=commit_sha
+            )
+        else:
+            state.commit_sha = commit_sha
+        self.session.add(state)
+        self.session.flush()
+        assert state.id is not None
+        return state.id
+
+    def _delete_stats(self, state_ids: Iterable[Optional[int]]) -> None:
+        self.session.exec(  # type: ignore[call-overload]
+            delete(FilterSummaryTable).where(
+                col(FilterSummaryTable.state_id).in_(state_ids)
+            )
+        )
+        self.session.exec(  # type: ignore[call-overload]
+            delete(FilterExtensionTable).where(
+                col(FilterExtensionTable.state_id).in_(state_ids)
+            )
+        )
+
+    def _apply_stats(
+        self,
+        state_id: int,
+        removed: Iterable[Tuple[str, int, Optional[int]]],
+        added: Iterable[FileRecord],
+    ) -> FilterSummaryTable:
+        """
+        Subtracts the removed rows from the totals, adds the added records and
+        returns the updated totals
+        """
+        totals = self.session.get(FilterSummaryTable, state_id)
+        if totals is None:
+            totals = FilterSummaryTable(state_id=state_id)
+        # Extension -> change of the file count and of the tokens
+        changes: Dict[str, List[int]] = {}
+        for path, size, tokens in removed:
+            totals.file_count -= 1
+            totals.total_size -= size
+            totals.context_length -= tokens or 0
+            change = changes.setdefault(file_extension(Path(path)), [0, 0])
+            change[0] -= 1
+            change[1] -= tokens or 0
+        for record in added:
+            totals.file_count += 1
+            totals.total_size += record.size
+            totals.context_length += record.tokens or 0
+            change = changes.setdefault(record.extension, [0, 0])
+            change[0] += 1
+            change[1] += record.tokens or 0
+        self.session.add(totals)
+
+        rows = {
+            row.extension: row
+            for row in self.session.exec(
+                select(FilterExtensionTable).where(
+                    FilterExtensionTable.state_id == state_id,
+                    col(FilterExtensionTable.extension).in_(list(changes)),
+                )
+            )
+        }
+        for extension, (count, tokens) in changes.items():
+            row = rows.get(extension) or FilterExtensionTable(
+                state_id=state_id, extension=extension
+            )
+            row.count += count
+            row.tokens += tokens
+            if row.count > 0:
+                self.session.add(row)
+            elif row.id is not None:
+                self.session.delete(row)
+        return totals
+
+    def _insert(self, state_id: int, records: Iterable[FileRecord]) -> None:
+        rows = [
+            {
+                "state_id": state_id,
+                "path": record.relative_path,
+                "name": record.path.name,
+                "extension": record.extension,
+                "size": record.size,
+                "tokens": record.tokens,
+                "blob_sha": record.blob_sha,
+            }
+            for record in records
+        ]
+        for i in range(0, len(rows), LOOKUP_BATCH_SIZE):
+            statement = insert(FilterResultTable).values(
+                rows[i : i + LOOKUP_BATCH_SIZE]
+            )
+            self.session.exec(  # type: ignore[call-overload]
+                statement.on_conflict_do_update(
+                    index_elements=["state_id", "path"],
+                    set_={
+                        "extension": statement.excluded.extension,
+                        "size": statement.excluded.size,
+                        "tokens": statement.excluded.tokens,
+                        "blob_sha": statement.excluded.blob_sha,
+                    },
+                )
+            )
 
 
 def main() -> None:
@@ -1,32 +1,70 @@
-import os
-import tempfile
 from datetime import datetime
-from typing import List, Optional
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
 from dotenv import load_dotenv
-from fastapi import Depends, Header, HTTPException, Response
-from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
+from fastapi import Depends, Header, HTTPException, Query, Response
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from fastapi.routing import APIRouter
 from pydantic import BaseModel, Field
 from sqlmodel import Session
 
 from repo_tool.api.database import get_session
 from repo_tool.api.repositories import (
+    FilterResultRepository,
     FilterSettingsRepository,
     SummaryCacheRepository,
+    TokenCountRepository,
+)
+from repo_tool.core.analytics import FileAnalytics, analyze_file_stats
+from repo_tool.core.artifacts import (
+    GZIP_SUFFIX,
+    INDEX_SUFFIX,
+    ArtifactStore,
+    accepts_gzip,
+    digest_artifact_key,
+    etag_matches,
+    gzip_chunks,
 )
 from repo_tool.core.digest import (
+    DedupStats,
     RespositoryContent,
-    generate_digest_content,
-    generate_repository_content,
+    iter_digest_sections,
+    iter_file_lines,
+    iter_indexed_digest,
+    page_records,
+    repository_content_from_records,
+)
+from repo_tool.core.filter import (
+    FilterSettings,
+    get_file_source_from_env,
+    get_filter_settings_from_env,
 )
-from repo_tool.core.filter import filter_files_in_repo, get_filter_settings_from_env
 from repo_tool.core.github import GitHub, Repository
+from repo_tool.core.incremental import refresh_filter_result, sync_filter_result
 from repo_tool.core.llm import filter_files_with_llm
-from repo_tool.core.summary import Summary, generate_summary
+from repo_tool.core.scan import FileRecord, iter_with_content, iter_with_content_ahead
+from repo_tool.core.split import (
+    iter_split_digest,
+    iter_transformed_counts,
+    iter_zip,
+    plan_digest_parts,
+)
+from repo_tool.core.summary import (
+    FileData,
+    FileSortKey,
+    SortOrder,
+    Summary,
+    aggregate_records,
+    build_summary,
+)
+from repo_tool.core.token_cache import TokenCache
+from repo_tool.core.transforms import TransformName, iter_transformed
 
 router = APIRouter()
 
+# Maximum number of files in a page of the file list
+MAX_FILE_PAGE_SIZE = 1000
+
 load_dotenv(override=True)
 
 
@@ -35,12 +73,53 @@ class Repositories:
         self.session = session
         self.summary_cache_repo = SummaryCacheRepository(session)
         self.filter_settings_repo = FilterSettingsRepository(session)
+        self.token_count_repo = TokenCountRepository(session)
+        self.filter_result_repo = FilterResultRepository(session)
+
+    def token_cache(self) -> TokenCache:
+        return TokenCache(self.token_count_repo)
+
+    def filtered_records(
+        self, repo_info: Repository, filter_settings: Optional[FilterSettings]
+    ) -> List[FileRecord]:
+        """
+        Returns the files of the repository that pass the filters, re-checking
+        only the files changed since the last processed commit
+        """
+        return refresh_filter_result(
+            repo_info.path,
+            repo_info.id,
+            self.filter_result_repo,
+            filter_settings=filter_settings,
+            token_cache=self.token_cache(),
+        )
+
+    def sync_filter_result(
+        self, repo_info: Repository, filter_settings: Optional[FilterSettings]
+    ) -> Optional[str]:
+        """
+        Brings the stored filter result of the repository up to HEAD, checking
+        only the files changed since the last processed commit, and returns its
+        state key. Returns None when tracked files have uncommitted changes,
+        since nothing is stored for them.
+        """
+        return sync_filter_result(
+            repo_info.path,
+            repo_info.id,
+            self.filter_result_repo,
+            filter_settings=filter_settings,
+            token_cache=self.token_cache(),
+        )
 
 
 def get_github() -> GitHub:
     return GitHub()
 
 
+def get_artifact_store() -> ArtifactStore:
+    return ArtifactStore()
+
+
 class ApiResponse(BaseModel):
     status: str = Field(..., description="The status of the operation")
 
@@ -104,6 +183,7 @@ def delete_all_repositories(
 
     filter_settings_repo.delete_all()
     summary_cache_repo.delete_all()
+    repositories.filter_result_repo.delete_all()
     return ApiResponse(status="success")
 
 
@@ -128,6 +208,9 @@ def delete_repository(
 
     filter_settings_repo.delete_by_repository_id(f"{author}/{repository_name}")
     summary_cache_repo.delete_by_repository_id(f"{author}/{repository_name}")
+    repositories.filter_result_repo.delete_by_repository_id(
+        f"{author}/{repository_name}"
+    )
     return ApiResponse(status="success")
 
 
@@ -137,13 +220,10 @@ def delete_repository(
     summary="Update all repositories",
     description="Update all repositories",
 )
-def update_all_repositories(
-    session: Session = Depends(get_session), github: GitHub = Depends(get_github)
-) -> ApiResponse:
+def update_all_repositories(github: GitHub = Depends(get_github)) -> ApiResponse:
+    # Cached summaries are keyed to the filter result they were built from, so
+    # they are built again on their next request, from the changed files only
     github.update()
-    repositories = Repositories(session)
-    summary_cache_repo = repositories.summary_cache_repo
-    summary_cache_repo.delete_all()
     return ApiResponse(status="success")
 
 
@@ -154,111 +234,384 @@ def update_all_repositories(
     description="Update a repository. If the URL is not provided, all repositories will be updated.",
 )
 def update_repository(
-    author: str,
-    repository_name: str,
-    session: Session = Depends(get_session),
-    github: GitHub = Depends(get_github),
+    author: str, repository_name: str, github: GitHub = Depends(get_github)
 ) -> ApiResponse:
     if not github.repo_exists(f"{author}/{repository_name}"):
         raise HTTPException(status_code=404, detail="Repository not found")
     github.update(f"{author}/{repository_name}")
-    repositories = Repositories(session)
-    summary_cache_repo = repositories.summary_cache_repo
-    summary_cache_repo.delete_by_repository_id(f"{author}/{repository_name}")
     return ApiResponse(status="success")
 
 
+def load_summary(
+    repositories: Repositories, github: GitHub, url: str
+) -> Tuple[Summary, Optional[str]]:
+    """
+    Returns the cached summary of the repository while it was built from the
+    current filter result, or builds it and caches it.
+
+    Also returns the state key of the filter result the files of the summary
+    are listed from, or None when they are transformed or have uncommitted
+    changes, in which case they are stored with the summary.
+    """
+    summary_cache_repo = repositories.summary_cache_repo
+    repo_info = github.get_repo_info(url)
+    filter_settings = repositories.filter_settings_repo.get_by_repository_id(url)
+    transforms = (filter_settings or get_filter_settings_from_env()).transforms
+    # After a pull only the changed files are checked again, and the summary is
+    # current while the filter result stays at the same commit. Nothing is
+    # stored for uncommitted changes, so their summary is always built again.
+    state_key = repositories.sync_filter_result(repo_info, filter_settings)
+    source_key = None
+    if state_key is not None:
+        commit_sha = repositories.filter_result_repo.get_commit(url, state_key)
+        source_key = f"{state_key}:{commit_sha}:{','.join(transforms)}"
+        cached_summary = summary_cache_repo.get_by_repository_id(url)
+        if cached_summary and summary_cache_repo.get_source_key(url) == source_key:
+            return cached_summary, None if transforms else state_key
+
+    # The stored totals only follow the changed files, so the files are only
+    # listed again when they are transformed or have uncommitted changes
+    file_stats = None
+    if state_key is not None and not transforms:
+        file_stats = repositories.filter_result_repo.get_file_stats(url, state_key)
+    if file_stats is not None:
+        # The files are listed from the filter result, so none are stored, and
+        # their analytics are computed from it on request, see load_analytics
+        summary = build_summary(repo_info, file_stats)
+        summary_cache_repo.upsert(
+            summary, datetime.now().isoformat(), files=[], source_key=source_key
+        )
+        return summary, state_key
+
+    records: Iterable[FileRecord] = repositories.filtered_records(
+        repo_info, filter_settings
+    )
+    if transforms:
+        # The files are read to count their tokens before and after the
+        # transforms
+        records = iter_transformed(iter_with_content(records), transforms)
+    file_stats = aggregate_records(records)
+    summary = build_summary(repo_info, file_stats)
+    summary_cache_repo.upsert(
+        summary,
+        datetime.now().isoformat(),
+        files=file_stats.file_data,
+        analytics=analyze_file_stats(file_stats),
+        source_key=source_key,
+    )
+    return summary, None
+
+
+def load_analytics(repositories: Repositories, github: GitHub, url: str) -> str:
+    """
+    Returns the distributions of the files of the summary of the repository as
+    JSON. They are stored with summaries of transformed files or uncommitted
+    changes, and computed from the filter result on their first request for the
+    others.
+    """
+    _, state_key = load_summary(repositories, github, url)
+    summary_cache_repo = repositories.summary_cache_repo
+    analytics_json = summary_cache_repo.get_analytics_json(url)
+    if analytics_json is not None:
+        return analytics_json
+    analytics = None
+    if state_key is not None:
+        analytics = repositories.filter_result_repo.get_file_analytics(url, state_key)
+    if analytics is None:
+        raise HTTPException(status_code=500, detail="Analytics are not available")
+    return summary_cache_repo.put_analytics(url, analytics)
+
+
 @router.get(
     "/repositories/{author}/{repository_name}/summary",
     response_model=Summary,
     summary="Get a summary of a repository digest",
-    description="Get a summary of a repository digest",
+    description="Get a summary of a repository digest. file_data holds the files with the most tokens, all the files are listed by the files endpoint.",
 )
 def get_summary_of_repository(
     author: str,
     repository_name: str,
     session: Session = Depends(get_session),
     github: GitHub = Depends(get_github),
-) -> Summary:
+) -> Response:
     url = f"{author}/{repository_name}"
     if not github.repo_exists(url):
         raise HTTPException(status_code=404, detail="Repository not found")
 
-    repositories = Repositories(session)
-    summary_cache_repo = repositories.summary_cache_repo
-    filter_settings_repo = repositories.filter_settings_repo
+    summary, _ = load_summary(Repositories(session), github, url)
+    # The cached file data is written straight from its columns, without
+    # building and validating a model for each file
+    return Response(content=summary.to_json(), media_type="application/json")
 
-    maybe_cached_summary = summary_cache_repo.get_by_repository_id(url)
-    if maybe_cached_summary:
-        return maybe_cached_summary
 
-    repo_info = github.get_repo_info(url)
-    filter_settings = filter_settings_repo.get_by_repository_id(url)
-    filtered_files = filter_files_in_repo(
-        repo_info.path, filter_settings=filter_settings
+@router.get(
+    "/repositories/{author}/{repository_name}/analytics",
+    response_model=FileAnalytics,
+    summary="Get the token and size distributions of a repository",
+    description="Get the percentiles and power-of-two histograms of the token counts and sizes of the files of a repository summary, overall and per extension, and the tokens per directory as a tree",
+)
+def get_analytics_of_repository(
+    author: str,
+    repository_name: str,
+    session: Session = Depends(get_session),
+    github: GitHub = Depends(get_github),
+) -> Response:
+    url = f"{author}/{repository_name}"
+    if not github.repo_exists(url):
+        raise HTTPException(status_code=404, detail="Repository not found")
+
+    analytics_json = load_analytics(Repositories(session), github, url)
+    # Sent as stored, without parsing the directory tree
+    return Response(content=analytics_json, media_type="application/json")
+
+
+class FilePage(BaseModel):
+    files: List[FileData]
+    total: int = Field(..., description="The number of files that match the filters")
+    next_cursor: Optional[str] = Field(
+        default=None,
+        description="The cursor of the next page, or null on the last page",
     )
-    summary = generate_summary(repo_info, filtered_files)
-    summary_cache_repo.upsert(summary, datetime.now().isoformat())
-    return summary
+
+
+@router.get(
+    "/repositories/{author}/{repository_name}/files",
+    response_model=FilePage,
+    summary="List the files of a repository summary",
+    description="List the files of a repository summary one page at a time, sorted, filtered by extension and searched by path",
+)
+def get_files_of_repository(
+    author: str,
+    repository_name: str,
+    sort: FileSortKey = Query(default=FileSortKey.TOKENS, description="Sort key"),
+    order: SortOrder = Query(default=SortOrder.DESC, description="Sort order"),
+    extension: Optional[str] = Query(
+        default=None, description="Only list files with this extension"
+    ),
+    search: Optional[str] = Query(
+        default=None, description="Only list files whose path contains this text"
+    ),
+    cursor: Optional[str] = Query(
+        default=None, description="The cursor of the page to return"
+    ),
+    limit: int = Query(
+        default=50,
+        gt=0,
+        le=MAX_FILE_PAGE_SIZE,
+        description="The maximum number of files in a page",
+    ),
+    session: Session = Depends(get_session),
+    github: GitHub = Depends(get_github),
+) -> FilePage:
+    url = f"{author}/{repository_name}"
+    if not github.repo_exists(url):
+        raise HTTPException(status_code=404, detail="Repository not found")
+
+    repositories = Repositories(session)
+    _, state_key = load_summary(repositories, github, url)
+    try:
+        if state_key is None:
+            files, total, next_cursor = repositories.summary_cache_repo.get_files(
+                url, sort, order, extension, search, cursor, limit
+            )
+        else:
+            # Read straight from the filter result, which follows the changed
+            # files, instead of a copy of it
+            files, total, next_cursor = repositories.filter_result_repo.get_files(
+                url, state_key, sort, order, extension, search, cursor, limit
+            )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return FilePage(files=files, total=total, next_cursor=next_cursor)
 
 
 class GenerateDigestParams(BaseModel):
     url: str = Field(..., description="The URL of the repository to create a digest")
+    token_budget: Optional[int] = Field(
+        None,
+        gt=0,
+        description="Split the digest into parts of at most this many tokens, returned as a zip file with an index",
+    )
+    dedup: bool = Field(
+        False,
+        description="Write identical files once and replace later copies with references",
+    )
+
+
+def artifact_response(
+    artifact_store: ArtifactStore,
+    key: Optional[str],
+    if_none_match: Optional[str],
+    accept_encoding: Optional[str],
+    media_type: str,
+    build: Callable[[], Iterable[bytes]],
+    filename: Optional[str] = None,
+    compressible: bool = True,
+    index: Optional[Dict[str, Tuple[int, int]]] = None,
+    range_header: Optional[str] = None,
+    store: bool = True,
+) -> Response:
+    """
+    Serves the stored artifact of key, or streams the content made by build while
+    storing it, with index as its sidecar index. Compressible content is gzip
+    compressed if the client accepts it, and the key is used as a strong ETag of
+    each encoding. Nothing is stored when key is None or store is False, but the
+    key is still used as the ETag in the latter case.
+
+    Requests with a Range header are always served the uncompressed content,
+    since the offsets of the index and of the ranges refer to it.
+    """
+    compressed = compressible and range_header is None and accepts_gzip(accept_encoding)
+    headers = {"Vary": "Accept-Encoding"}
+    if compressed:
+        headers["Content-Encoding"] = "gzip"
+    if filename is not None:
+        headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    if key is not None:
+        etag = f'"{key}{GZIP_SUFFIX}"' if compressed else f'"{key}"'
+        headers["ETag"] = etag
+        if etag_matches(if_none_match, etag):
+            return Response(
+                status_code=304, headers={"ETag": etag, "Vary": "Accept-Encoding"}
+            )
+        if store:
+            path = artifact_store.get(key, compressed)
+            if path is not None:
+                return FileResponse(path, media_type=media_type, headers=headers)
+            return StreamingResponse(
+                artifact_store.write(key, build(), compressed, index),
+                media_type=media_type,
+                headers=headers,
+            )
+
+    chunks = build()
+    if compressed:
+        chunks = gzip_chunks(chunks)
+    return StreamingResponse(chunks, media_type=media_type, headers=headers)
+
+
+def text_digest_chunks(
+    records: List[FileRecord],
+    index: Dict[str, Tuple[int, int]],
+    transforms: List[str],
+    dedup: Optional[DedupStats] = None,
+) -> Iterator[bytes]:
+    # Files are read, transformed and sent one at a time, so memory does not
+    # grow with the size of the repository
+    return iter_indexed_digest(
+        iter_transformed(iter_with_content(records), transforms), index, dedup
+    )
 
 
 @router.post(
     "/digest",
-    response_class=FileResponse,
+    response_class=StreamingResponse,
     summary="Create a digest of a repository",
     description="Create a digest of a repository. This will create a digest of the repository and return it as a file.",
 )
 def generate_digest(
     request: GenerateDigestParams,
+    if_none_match: Optional[str] = Header(default=None),
+    accept_encoding: Optional[str] = Header(default=None),
+    range_header: Optional[str] = Header(default=None, alias="Range"),
     session: Session = Depends(get_session),
     github: GitHub = Depends(get_github),
-) -> FileResponse:
+    artifact_store: ArtifactStore = Depends(get_artifact_store),
+) -> Response:
     repo_info = github.get_repo_info(request.url)
     repositories = Repositories(session)
     filter_settings_repo = repositories.filter_settings_repo
-    filter_settings = filter_settings_repo.get_by_repository_id(repo_info.id)
-    filtered_files = filter_files_in_repo(
-        repo_info.path, filter_settings=filter_settings
+    filter_settings = (
+        filter_settings_repo.get_by_repository_id(repo_info.id)
+        or get_filter_settings_from_env()
     )
-    digest = generate_digest_content(repo_info.path, filtered_files)
+    file_source = get_file_source_from_env()
 
-    # Create temporary file
-    fd, temp_path = tempfile.mkstemp(suffix=".txt")
-    try:
-        with os.fdopen(fd, "w") as tmp:
-            tmp.write(digest)
-
-        # Get repository name for the filename
-        repo_name = request.url.rstrip("/").split("/")[-1]
-        filename = f"{repo_name}_digest.txt"
-
-        return FileResponse(
-            path=temp_path,
-            filename=filename,
-            media_type="text/plain",
-            background=None,  # This ensures the temp file is removed after the response
+    # Get repository name for the filename
+    repo_name = request.url.rstrip("/").split("/")[-1]
+
+    if request.token_budget is not None:
+        token_budget = request.token_budget
+        key = digest_artifact_key(
+            repo_info.path, filter_settings, file_source, f"split-{token_budget}.zip"
         )
-    except Exception as e:
-        os.unlink(temp_path)  # Clean up the temp file in case of error
-        raise HTTPException(status_code=500, detail=str(e))
+
+        def build_split() -> Iterator[bytes]:
+            records = repositories.filtered_records(repo_info, filter_settings)
+            transforms = filter_settings.transforms
+            try:
+                parts = plan_digest_parts(
+                    iter_transformed_counts(records, transforms), token_budget
+                )
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            return iter_zip(iter_split_digest(parts, token_budget, transforms))
+
+        return artifact_response(
+            artifact_store,
+            key,
+            if_none_match,
+            accept_encoding,
+            "application/zip",
+            build_split,
+            filename=f"{repo_name}_digest.zip",
+            compressible=False,
+            range_header=range_header,
+        )
+
+    # Identical files are detected while the digest is written, and the tokens
+    # saved are reported at its end
+    dedup = DedupStats() if request.dedup else None
+    output_format = "txt-dedup" if request.dedup else "txt"
+    key = digest_artifact_key(
+        repo_info.path, filter_settings, file_source, output_format
+    )
+    index: Dict[str, Tuple[int, int]] = {}
+    return artifact_response(
+        artifact_store,
+        key,
+        if_none_match,
+        accept_encoding,
+        "text/plain",
+        lambda: text_digest_chunks(
+            repositories.filtered_records(repo_info, filter_settings),
+            index,
+            filter_settings.transforms,
+            dedup,
+        ),
+        filename=f"{repo_name}_digest.txt",
+        index=index,
+        range_header=range_header,
+    )
 
 
 @router.get(
     "/repositories/{author}/{repository_name}/digest",
     summary="Get a digest of a repository",
-    description="Get a digest of a repository in either JSON or plain text format based on format query parameter",
+    description="Get a digest of a repository in JSON, NDJSON (application/x-ndjson, one file per line) or plain text format based on the Accept header",
     response_model=RespositoryContent,
 )
 def get_repository_digest(
     author: str,
     repository_name: str,
     accept: str = Header(default="application/json"),
+    cursor: Optional[str] = Query(
+        default=None, description="The cursor of the page to return (JSON and NDJSON)"
+    ),
+    limit: Optional[int] = Query(
+        default=None, gt=0, description="The maximum number of files in a page"
+    ),
+    max_bytes: Optional[int] = Query(
+        default=None,
+        gt=0,
+        description="The maximum size of the file contents in a page, in bytes",
+    ),
+    if_none_match: Optional[str] = Header(default=None),
+    accept_encoding: Optional[str] = Header(default=None),
+    range_header: Optional[str] = Header(default=None, alias="Range"),
     session: Session = Depends(get_session),
     github: GitHub = Depends(get_github),
+    artifact_store: ArtifactStore = Depends(get_artifact_store),
 ) -> Response:
     if not github.repo_exists(f"{author}/{repository_name}"):
         raise HTTPException(status_code=404, detail="Repository not found")
@@ -266,18 +619,214 @@ def get_repository_digest(
     repo_info = github.get_repo_info(f"{author}/{repository_name}")
     repositories = Repositories(session)
     filter_settings_repo = repositories.filter_settings_repo
-    filter_settings = filter_settings_repo.get_by_repository_id(repo_info.id)
-    filtered_files = filter_files_in_repo(
-        repo_info.path, filter_settings=filter_settings
+    filter_settings = (
+        filter_settings_repo.get_by_repository_id(repo_info.id)
+        or get_filter_settings_from_env()
     )
+    file_source = get_file_source_from_env()
 
     if accept.lower() == "text/plain":
-        return PlainTextResponse(
-            content=generate_digest_content(repo_info.path, filtered_files)
+        key = digest_artifact_key(repo_info.path, filter_settings, file_source, "txt")
+        index: Dict[str, Tuple[int, int]] = {}
+        return artifact_response(
+            artifact_store,
+            key,
+            if_none_match,
+            accept_encoding,
+            "text/plain",
+            lambda: text_digest_chunks(
+                repositories.filtered_records(repo_info, filter_settings),
+                index,
+                filter_settings.transforms,
+            ),
+            index=index,
+            range_header=range_header,
+        )
+
+    def select_page() -> Tuple[List[FileRecord], Optional[str]]:
+        records = repositories.filtered_records(repo_info, filter_settings)
+        try:
+            return page_records(records, cursor, limit, max_bytes)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    page_format = f"{cursor or ''}:{limit or ''}:{max_bytes or ''}"
+    # Pages are made from the stored filter result on every request instead of
+    # being stored, so paging through a repository does not evict the digests
+    # from the artifact store. Only the whole digest is stored.
+    paged = cursor is not None or limit is not None or max_bytes is not None
+
+    if accept.lower() == "application/x-ndjson":
+
+        def build_ndjson() -> Iterator[bytes]:
+            page, _ = select_page()
+            # Files are read ahead in a thread pool and sent in path order as
+            # soon as each one is read
+            lines = iter_file_lines(
+                repo_info,
+                iter_transformed(
+                    iter_with_content_ahead(page), filter_settings.transforms
+                ),
+            )
+            return (line.encode() for line in lines)
+
+        key = digest_artifact_key(
+            repo_info.path, filter_settings, file_source, f"ndjson:{page_format}"
+        )
+        return artifact_response(
+            artifact_store,
+            key,
+            if_none_match,
+            accept_encoding,
+            "application/x-ndjson",
+            build_ndjson,
+            range_header=range_header,
+            store=not paged,
+        )
+
+    # default to json
+    def build_json() -> List[bytes]:
+        page, next_cursor = select_page()
+        # Only the files of the page are read
+        content = repository_content_from_records(
+            repo_info,
+            iter_transformed(iter_with_content(page), filter_settings.transforms),
+            next_cursor,
+        )
+        return [bytes(JSONResponse(content=content.model_dump()).body)]
+
+    key = digest_artifact_key(
+        repo_info.path, filter_settings, file_source, f"json-page:{page_format}"
+    )
+    return artifact_response(
+        artifact_store,
+        key,
+        if_none_match,
+        accept_encoding,
+        "application/json",
+        build_json,
+        range_header=range_header,
+        store=not paged,
+    )
+
+
+def indexed_digest_artifact(
+    artifact_store: ArtifactStore,
+    repositories: Repositories,
+    repo_info: Repository,
+    filter_settings: FilterSettings,
+    key: str,
+) -> Dict[str, Tuple[int, int]]:
+    """Returns the sidecar index of the text digest, building the digest if needed"""
+    index = artifact_store.get_index(key)
+    if index is None:
+        index = {}
+        records = repositories.filtered_records(repo_info, filter_settings)
+        chunks = text_digest_chunks(records, index, filter_settings.transforms)
+        for _ in artifact_store.write(key, chunks, index=index):
+            pass
+    return index
+
+
+@router.get(
+    "/repositories/{author}/{repository_name}/digest/index",
+    summary="Get the section index of a repository digest",
+    description="Get the byte offset and length of each file's section in the plain text digest, for use with Range requests on the uncompressed digest",
+)
+def get_repository_digest_index(
+    author: str,
+    repository_name: str,
+    session: Session = Depends(get_session),
+    github: GitHub = Depends(get_github),
+    artifact_store: ArtifactStore = Depends(get_artifact_store),
+) -> Response:
+    if not github.repo_exists(f"{author}/{repository_name}"):
+        raise HTTPException(status_code=404, detail="Repository not found")
+
+    repo_info = github.get_repo_info(f"{author}/{repository_name}")
+    repositories = Repositories(session)
+    filter_settings = (
+        repositories.filter_settings_repo.get_by_repository_id(repo_info.id)
+        or get_filter_settings_from_env()
+    )
+    key = digest_artifact_key(
+        repo_info.path, filter_settings, get_file_source_from_env(), "txt"
+    )
+    if key is None:
+        raise HTTPException(
+            status_code=409, detail="Repository has uncommitted changes"
         )
-    else:  # default to json
-        content = generate_repository_content(repo_info, filtered_files)
-        return JSONResponse(content=content.model_dump())
+    indexed_digest_artifact(
+        artifact_store, repositories, repo_info, filter_settings, key
+    )
+    return FileResponse(
+        artifact_store.index_path(key),
+        media_type="application/json",
+        headers={"ETag": f'"{key}{INDEX_SUFFIX}"'},
+    )
+
+
+@router.get(
+    "/repositories/{author}/{repository_name}/digest/sections",
+    summary="Get sections of a repository digest",
+    description="Get the digest sections of the given files, read from the stored digest with one seek per file",
+)
+def get_repository_digest_sections(
+    author: str,
+    repository_name: str,
+    path: List[str] = Query(..., description="The relative paths of the files"),
+    session: Session = Depends(get_session),
+    github: GitHub = Depends(get_github),
+    artifact_store: ArtifactStore = Depends(get_artifact_store),
+) -> StreamingResponse:
+    if not github.repo_exists(f"{author}/{repository_name}"):
+        raise HTTPException(status_code=404, detail="Repository not found")
+
+    repo_info = github.get_repo_info(f"{author}/{repository_name}")
+    repositories = Repositories(session)
+    filter_settings = (
+        repositories.filter_settings_repo.get_by_repository_id(repo_info.id)
+        or get_filter_settings_from_env()
+    )
+    key = digest_artifact_key(
+        repo_info.path, filter_settings, get_file_source_from_env(), "txt"
+    )
+
+    def check_paths(found: Iterable[str]) -> None:
+        missing = set(path).difference(found)
+        if missing:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Files not found in the digest: {', '.join(sorted(missing))}",
+            )
+
+    if key is None:
+        # The digest is not stored for uncommitted changes, so the sections are
+        # made from the requested files only
+        by_path = {
+            record.relative_path: record
+            for record in repositories.filtered_records(repo_info, filter_settings)
+        }
+        check_paths(by_path)
+        sections = iter_digest_sections(
+            iter_transformed(
+                iter_with_content(by_path[file_path] for file_path in path),
+                filter_settings.transforms,
+            )
+        )
+        chunks: Iterator[bytes] = (
+            text.encode() for file_path, text in sections if file_path is not None
+        )
+        return StreamingResponse(chunks, media_type="text/plain")
+
+    index = indexed_digest_artifact(
+        artifact_store, repositories, repo_info, filter_settings, key
+    )
+    check_paths(index)
+    ranges = artifact_store.open_ranges(key, [index[file_path] for file_path in path])
+    if ranges is None:
+        raise HTTPException(status_code=503, detail="Digest was evicted, try again")
+    return StreamingResponse(ranges, media_type="text/plain")
 
 
 class Settings(BaseModel):
@@ -290,6 +839,10 @@ class Settings(BaseModel):
     max_tokens: int = Field(
         ..., description="The maximum tokens to include in the digest"
     )
+    transforms: List[TransformName] = Field(
+        default_factory=list,
+        description="The transforms applied to the content of each file in the digest",
+    )
 
 
 @router.get("/settings")
@@ -299,6 +852,7 @@ def get_settings() -> Settings:
         include_files=settings.exclude_patterns,
         exclude_files=settings.include_patterns,
         max_tokens=settings.max_tokens,
+        transforms=[TransformName(name) for name in settings.transforms],
     )
 
 
@@ -312,6 +866,7 @@ def update_settings(request: Settings) -> Settings:
         include_files=request.include_files,
         exclude_files=request.exclude_files,
         max_tokens=request.max_tokens,
+        transforms=request.transforms,
     )
 
 
@@ -328,12 +883,14 @@ def get_settings_of_repository(
             include_files=maybe_settings.include_patterns,
             exclude_files=maybe_settings.exclude_patterns,
             max_tokens=maybe_settings.max_tokens,
+            transforms=[TransformName(name) for name in maybe_settings.transforms],
         )
     default_settings = get_filter_settings_from_env()
     return Settings(
         include_files=default_settings.include_patterns,
         exclude_files=default_settings.exclude_patterns,
         max_tokens=default_settings.max_tokens,
+        transforms=[TransformName(name) for name in default_settings.transforms],
     )
 
 
@@ -349,11 +906,15 @@ def update_settings_of_repository(
     filter_settings_repo = repositories.filter_settings_repo
 
     summary_cache_repo.delete_by_repository_id(f"{author}/{repository_name}")
+    repositories.filter_result_repo.delete_by_repository_id(
+        f"{author}/{repository_name}"
+    )
     filter_settings_repo.upsert(
         f"{author}/{repository_name}",
         request.include_files,
         request.exclude_files,
         request.max_tokens,
+        [name.value for name in request.transforms],
     )
     return request
 
@@ -381,10 +942,10 @@ def get_ai_filter_of_repository(
     )
     if not filter_settings:
         filter_settings = get_filter_settings_from_env()
-    filtered_files = filter_files_in_repo(
-        repo_info.path,
-        filter_settings=filter_settings,
-    )
+    filtered_files = [
+        record.path
+        for record in repositories.filtered_records(repo_info, filter_settings)
+    ]
     include_patterns = filter_files_with_llm(filtered_files, request.prompt)
     include_patterns_str = [
         str(pattern.relative_to(repo_info.path)) for pattern in include_patterns
@@ -395,10 +956,15 @@ def get_ai_filter_of_repository(
         include_patterns=list(all_include_patterns),
         exclude_patterns=filter_settings.exclude_patterns,
         max_tokens=filter_settings.max_tokens,
+        transforms=filter_settings.transforms,
     )
     summary_cache_repo.delete_by_repository_id(f"{author}/{repository_name}")
+    repositories.filter_result_repo.delete_by_repository_id(
+        f"{author}/{repository_name}"
+    )
     return Settings(
         include_files=list(all_include_patterns),
         exclude_files=filter_settings.exclude_patterns,
         max_tokens=filter_settings.max_tokens,
+        transforms=[TransformName(name) for name in filter_settings.transforms],
     )
@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 
 import humanize
 import typer
@@ -11,6 +11,8 @@ from typer import Typer
 
 from repo_tool.core.digest import generate_digest
 from repo_tool.core.github import GitHub
+from repo_tool.core.split import generate_split_digest
+from repo_tool.core.transforms import TransformName
 
 app = Typer()
 
@@ -125,6 +127,17 @@ def digest(
     repo_url: str = typer.Argument(..., help="Repository URL"),
     branch: Optional[str] = typer.Option(None, help="Branch to generate digest for"),
     prompt: Optional[str] = typer.Option(None, help="Prompt to generate digest with"),
+    token_budget: Optional[int] = typer.Option(
+        None, min=1, help="Split the digest into parts of at most this many tokens"
+    ),
+    dedup: bool = typer.Option(
+        False, help="Write identical files once and reference them afterwards"
+    ),
+    transform: Optional[List[TransformName]] = typer.Option(
+        None,
+        help="Transform the content of each file, can be repeated "
+        "(default: DIGEST_TRANSFORMS)",
+    ),
 ) -> None:
     """
     Generate a digest for a repository.
@@ -136,7 +149,14 @@ def digest(
             github.clone(repo_url, branch)
         elif branch:
             github.checkout(repo_info.path, branch)
-        generate_digest(repo_info, prompt)
+        transforms = [name.value for name in transform] if transform else None
+        if token_budget is not None:
+            generate_split_digest(repo_info, token_budget, prompt, transforms)
+            typer.secho(
+                f"Digest generated successfully at digests/{repo_info.name}/",
+            )
+            return
+        generate_digest(repo_info, prompt, dedup, transforms)
         typer.secho(
             f"Digest generated successfully at digests/{repo_info.name}.txt",
         )
@@ -0,0 +1,261 @@
+import json
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+import numpy.typing as npt
+
+from repo_tool.core.summary import FileStats
+
+# The percentiles reported for each distribution
+PERCENTILES = (50, 90, 99)
+# Files in directories deeper than this are counted in their ancestor at this
+# depth, so the tree stays small enough to send with a treemap
+MAX_TREE_DEPTH = 6
+
+IntArray = npt.NDArray[np.int64]
+
+
+@dataclass
+class Histogram:
+    """
+    Counts of values in power-of-two bins. The first bin holds 0 and bin i
+    holds the values from edges[i] up to, but not including, edges[i + 1].
+    """
+
+    edges: List[int]
+    counts: List[int]
+
+
+@dataclass
+class Distribution:
+    count: int
+    total: int
+    mean: float
+    max: int
+    p50: float
+    p90: float
+    p99: float
+    histogram: Histogram
+
+
+@dataclass
+class ExtensionDistribution:
+    extension: str
+    tokens: Distribution
+    # In bytes
+    sizes: Distribution
+
+
+@dataclass
+class DirectoryNode:
+    """Tokens and files of a directory, including its subdirectories"""
+
+    name: str
+    path: str
+    tokens: int
+    files: int
+    # In descending order of tokens
+    children: List["DirectoryNode"] = field(default_factory=list)
+
+
+@dataclass
+class FileAnalytics:
+    tokens: Distribution
+    # In bytes
+    sizes: Distribution
+    # In descending order of tokens
+    extensions: List[ExtensionDistribution]
+    directories: DirectoryNode
+
+    def to_json(self) -> str:
+        return json.dumps(self, default=lambda o: o.__dict__, ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, json_str: str) -> "FileAnalytics":
+        data = json.loads(json_str)
+        return cls(
+            tokens=_distribution_from_dict(data["tokens"]),
+            sizes=_distribution_from_dict(data["sizes"]),
+            extensions=[
+                ExtensionDistribution(
+                    extension=item["extension"],
+                    tokens=_distribution_from_dict(item["tokens"]),
+                    sizes=_distribution_from_dict(item["sizes"]),
+                )
+                for item in data["extensions"]
+            ],
+            directories=_node_from_dict(data["directories"]),
+        )
+
+
+def _distribution_from_dict(data: Dict[str, Any]) -> Distribution:
+    return Distribution(**{**data, "histogram": Histogram(**data["histogram"])})
+
+
+def _node_from_dict(data: Dict[str, Any]) -> DirectoryNode:
+    return DirectoryNode(
+        **{**data, "children": [_node_from_dict(child) for child in data["children"]]}
+    )
+
+
+def _histogram_bins(values: IntArray) -> IntArray:
+    """
+    Returns the power-of-two bin of each value. frexp returns the exponent e
+    with 2 ** (e - 1) <= value < 2 ** e, and 0 for 0, which is the bin index.
+    """
+    return np.frexp(values.astype(np.float64))[1].astype(np.int64)
+
+
+def _histogram_edges(bins: int) -> List[int]:
+    return [0] + [2**i for i in range(bins)]
+
+
+def _distributions(
+    codes: IntArray, values: IntArray, groups: int
+) -> List[Distribution]:
+    """
+    Returns the distribution of the values of each group, with one pass of
+    sorting and counting over all the groups together
+    """
+    counts = np.bincount(codes, minlength=groups)
+    totals = np.bincount(codes, weights=values, minlength=groups)
+    # Sorted by group, then by value, so the values of a group are contiguous
+    sorted_values = values[np.lexsort((values, codes))].astype(np.float64)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+    # Linear interpolation between the closest ranks, as numpy.percentile
+    positions = starts[:, None] + np.asarray(PERCENTILES)[None, :] / 100 * (
+        counts[:, None] - 1
+    )
+    lower = np.floor(positions).astype(np.int64)
+    upper = np.ceil(positions).astype(np.int64)
+    percentiles = sorted_values[lower] + (
+        sorted_values[upper] - sorted_values[lower]
+    ) * (positions - lower)
+    maxima = sorted_values[starts + counts - 1]
+
+    bins = _histogram_bins(values)
+    width = int(bins.max()) + 1
+    histograms = np.bincount(codes * width + bins, minlength=groups * width).reshape(
+        groups, width
+    )
+    # Each histogram ends at the bin of its largest value
+    lengths = _histogram_bins(maxima.astype(np.int64)) + 1
+    edges = _histogram_edges(width)
+
+    return [
+        Distribution(
+            count=int(counts[i]),
+            total=int(totals[i]),
+            mean=float(totals[i] / counts[i]),
+            max=int(maxima[i]),
+            p50=float(percentiles[i, 0]),
+            p90=float(percentiles[i, 1]),
+            p99=float(percentiles[i, 2]),
+            histogram=Histogram(
+                edges=edges[: lengths[i] + 1],
+                counts=histograms[i, : lengths[i]].tolist(),
+            ),
+        )
+        for i in range(groups)
+    ]
+
+
+def _empty_distribution() -> Distribution:
+    return Distribution(0, 0, 0.0, 0, 0.0, 0.0, 0.0, Histogram(edges=[0], counts=[]))
+
+
+def _directory(path: str) -> str:
+    return "/".join(path.split("/")[:-1][:MAX_TREE_DEPTH])
+
+
+def _directory_tree(paths: Sequence[str], tokens: IntArray) -> DirectoryNode:
+    """
+    Sums the tokens and files of each directory with one group-by over the
+    files, then rolls the sums up to the ancestors of the directories
+    """
+    directories, inverse = np.unique(
+        np.array([_directory(path) for path in paths], dtype=str),
+        return_inverse=True,
+    )
+    directory_tokens = np.bincount(inverse, weights=tokens)
+    directory_files = np.bincount(inverse)
+
+    root = DirectoryNode(name="", path="", tokens=0, files=0)
+    nodes = {"": root}
+    # Only the directories are walked from here, not the files
+    for directory, dir_tokens, dir_files in zip(
+        directories.tolist(), directory_tokens.tolist(), directory_files.tolist()
+    ):
+        parts = directory.split("/") if directory else []
+        node = root
+        node.tokens += int(dir_tokens)
+        node.files += dir_files
+        for depth in range(1, len(parts) + 1):
+            path = "/".join(parts[:depth])
+            child = nodes.get(path)
+            if child is None:
+                child = DirectoryNode(
+                    name=parts[depth - 1], path=path, tokens=0, files=0
+                )
+                nodes[path] = child
+                node.children.append(child)
+            child.tokens += int(dir_tokens)
+            child.files += dir_files
+            node = child
+
+    for node in nodes.values():
+        node.children.sort(key=lambda child: (-child.tokens, child.name))
+    return root
+
+
+def analyze_files(
+    paths: Sequence[str],
+    extensions: Sequence[str],
+    tokens: Sequence[int],
+    sizes: Sequence[int],
+) -> FileAnalytics:
+    """
+    Returns the distributions of the token counts and sizes of the files,
+    overall and per extension, and the tokens per directory. The arguments are
+    the columns of the files, in the same order.
+    """
+    if not paths:
+        return FileAnalytics(
+            tokens=_empty_distribution(),
+            sizes=_empty_distribution(),
+            extensions=[],
+            directories=DirectoryNode(name="", path="", tokens=0, files=0),
+        )
+
+    token_values = np.asarray(tokens, dtype=np.int64)
+    size_values = np.asarray(sizes, dtype=np.int64)
+    names, codes = np.unique(np.array(extensions, dtype=str), return_inverse=True)
+    codes = codes.astype(np.int64)
+    everything = np.zeros(len(token_values), dtype=np.int64)
+
+    by_extension = [
+        ExtensionDistribution(extension=str(name), tokens=tokens, sizes=sizes)
+        for name, tokens, sizes in zip(
+            names,
+            _distributions(codes, token_values, len(names)),
+            _distributions(codes, size_values, len(names)),
+        )
+    ]
+    by_extension.sort(key=lambda item: (-item.tokens.total, item.extension))
+    return FileAnalytics(
+        tokens=_distributions(everything, token_values, 1)[0],
+        sizes=_distributions(everything, size_values, 1)[0],
+        extensions=by_extension,
+        directories=_directory_tree(paths, token_values),
+    )
+
+
+def analyze_file_stats(file_stats: FileStats) -> FileAnalytics:
+    return analyze_files(
+        [file.path for file in file_stats.file_data],
+        [file.extension for file in file_stats.file_data],
+        [file.tokens for file in file_stats.file_data],
+        file_stats.file_sizes,
+    )
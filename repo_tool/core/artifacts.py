@@ -0,0 +1,259 @@
+import hashlib
+import json
+import os
+import tempfile
+import zlib
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Generator, Iterable, Iterator, List, Optional, Tuple, Union
+
+from git import Repo
+
+from repo_tool.core.contants import ARTIFACT_DIR
+from repo_tool.core.filter import FileSource, FilterSettings
+from repo_tool.core.incremental import get_state_key, has_uncommitted_changes
+from repo_tool.core.transforms import normalize_transforms
+
+DEFAULT_MAX_ARTIFACT_BYTES = 1024 * 1024 * 1024
+TEMP_PREFIX = ".tmp-"
+GZIP_SUFFIX = ".gz"
+INDEX_SUFFIX = ".index.json"
+RANGE_CHUNK_SIZE = 64 * 1024
+GZIP_LEVEL = 6
+
+
+def get_max_artifact_bytes() -> int:
+    return int(os.getenv("ARTIFACT_CACHE_MAX_BYTES", str(DEFAULT_MAX_ARTIFACT_BYTES)))
+
+
+def digest_artifact_key(
+    repo_path: Path,
+    filter_settings: FilterSettings,
+    file_source: FileSource,
+    output_format: str,
+) -> Optional[str]:
+    """
+    Returns the key of a digest of the repository at HEAD, made from the commit
+    SHA, the filter state key, the transforms and the output format. Returns
+    None when the files may have uncommitted changes, see
+    has_uncommitted_changes, since the content is not decided by the commit then.
+    """
+    repo = Repo(repo_path)
+    if has_uncommitted_changes(repo, file_source, filter_settings):
+        return None
+    state_key = get_state_key(filter_settings, file_source)
+    transforms = ",".join(normalize_transforms(filter_settings.transforms))
+    key = f"{repo.head.commit.hexsha}:{state_key}:{transforms}:{output_format}"
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Checks an If-None-Match header against a strong ETag"""
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    """Checks whether an Accept-Encoding header allows a gzip response"""
+    if not accept_encoding:
+        return False
+    qualities: Dict[str, float] = {}
+    for coding in accept_encoding.split(","):
+        name, _, params = coding.partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            param_name, _, value = param.partition("=")
+            if param_name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[name.strip().lower()] = quality
+    for name in ("gzip", "x-gzip", "*"):
+        if name in qualities:
+            return qualities[name] > 0
+    return False
+
+
+def gzip_compressor() -> "zlib._Compress":
+    return zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+
+def gzip_chunks(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """Compresses chunks into a gzip stream as they arrive"""
+    compressor = gzip_compressor()
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+@lru_cache(maxsize=16)
+def load_index(index_path: str) -> Dict[str, Tuple[int, int]]:
+    # Artifacts are never changed once stored, so their indexes can be cached
+    with open(index_path, encoding="utf-8") as f:
+        return {
+            path: (offset, length) for path, (offset, length) in json.load(f).items()
+        }
+
+
+class ArtifactStore:
+    """
+    On-disk store of generated digests keyed by content, so an artifact never
+    needs to be invalidated.
+
+    Artifacts are written to a temporary file and moved into place once
+    complete, so readers only ever see whole artifacts. The store is kept under
+    max_bytes by removing the least recently used artifacts, using the
+    modification time, which is updated on every hit.
+
+    Every artifact is stored with a gzip compressed variant, so compressed
+    responses can be served without compressing again, and optionally with a
+    sidecar index of the byte ranges of its sections.
+    """
+
+    def __init__(
+        self, root: Union[str, Path] = ARTIFACT_DIR, max_bytes: Optional[int] = None
+    ):
+        self.root = Path(root)
+        self.max_bytes = get_max_artifact_bytes() if max_bytes is None else max_bytes
+
+    def path(self, key: str, compressed: bool = False) -> Path:
+        return self.root / (key + GZIP_SUFFIX if compressed else key)
+
+    def get(self, key: str, compressed: bool = False) -> Optional[Path]:
+        """Returns the path of a stored artifact and marks it as recently used"""
+        path = self.path(key, compressed)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def index_path(self, key: str) -> Path:
+        return self.root / (key + INDEX_SUFFIX)
+
+    def get_index(self, key: str) -> Optional[Dict[str, Tuple[int, int]]]:
+        """
+        Returns the sidecar index of a stored artifact, mapping each section to
+        its byte offset and length, and marks the artifact as recently used
+        """
+        if self.get(key) is None:
+            return None
+        try:
+            return load_index(str(self.index_path(key)))
+        except FileNotFoundError:
+            return None
+
+    def open_ranges(
+        self, key: str, ranges: List[Tuple[int, int]]
+    ) -> Optional[Iterator[bytes]]:
+        """
+        Opens a stored artifact and returns an iterator over the given byte
+        ranges, with one seek per range. Returns None if the artifact is gone.
+        """
+        try:
+            f = open(self.path(key), "rb")
+        except FileNotFoundError:
+            return None
+
+        def read_ranges() -> Iterator[bytes]:
+            with f:
+                for offset, length in ranges:
+                    f.seek(offset)
+                    while length > 0:
+                        chunk = f.read(min(length, RANGE_CHUNK_SIZE))
+                        if not chunk:
+                            break
+                        length -= len(chunk)
+                        yield chunk
+
+        return read_ranges()
+
+    def write(
+        self,
+        key: str,
+        chunks: Iterable[bytes],
+        compressed: bool = False,
+        index: Optional[Dict[str, Tuple[int, int]]] = None,
+    ) -> Generator[bytes, None, None]:
+        """
+        Yields the chunks, gzip compressed if compressed is set, while writing
+        them to the artifact of key and its compressed variant. The artifact is
+        only stored if all chunks were consumed.
+
+        index is stored as the sidecar index once all chunks were consumed, so it
+        can be filled in by the producer of the chunks.
+        """
+        self.root.mkdir(parents=True, exist_ok=True)
+        compressor = gzip_compressor()
+        fd, temp_path = tempfile.mkstemp(dir=self.root, prefix=TEMP_PREFIX)
+        gzip_fd, gzip_temp_path = tempfile.mkstemp(dir=self.root, prefix=TEMP_PREFIX)
+        index_temp_path = None
+        try:
+            with os.fdopen(fd, "wb") as f, os.fdopen(gzip_fd, "wb") as gzip_f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    compressed_chunk = compressor.compress(chunk)
+                    gzip_f.write(compressed_chunk)
+                    if not compressed:
+                        yield chunk
+                    elif compressed_chunk:
+                        yield compressed_chunk
+                compressed_chunk = compressor.flush()
+                gzip_f.write(compressed_chunk)
+                if compressed:
+                    yield compressed_chunk
+            if index is not None:
+                index_fd, index_temp_path = tempfile.mkstemp(
+                    dir=self.root, prefix=TEMP_PREFIX
+                )
+                with os.fdopen(index_fd, "w") as index_f:
+                    json.dump(index, index_f, separators=(",", ":"))
+                os.replace(index_temp_path, self.index_path(key))
+            os.replace(gzip_temp_path, self.path(key, compressed=True))
+            os.replace(temp_path, self.path(key))
+        finally:
+            for path in (temp_path, gzip_temp_path, index_temp_path):
+                if path is not None and os.path.exists(path):
+                    os.unlink(path)
+        self.evict(keep=key)
+
+    def evict(self, keep: Optional[str] = None) -> None:
+        """
+        Removes the least recently used artifacts, with their compressed variants
+        and indexes, until the store fits
+        """
+        last_used: Dict[str, float] = {}
+        sizes: Dict[str, int] = {}
+        with os.scandir(self.root) as it:
+            for entry in it:
+                if entry.name.startswith(TEMP_PREFIX) or not entry.is_file():
+                    continue
+                entry_stat = entry.stat()
+                # Keys have no dots, so the key is what comes before the suffix
+                key = entry.name.split(".", 1)[0]
+                last_used[key] = max(last_used.get(key, 0), entry_stat.st_mtime)
+                sizes[key] = sizes.get(key, 0) + entry_stat.st_size
+        total = sum(sizes.values())
+        for key in sorted(last_used, key=last_used.__getitem__):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            for path in (
+                self.path(key),
+                self.path(key, compressed=True),
+                self.index_path(key),
+            ):
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+            total -= sizes[key]
@@ -0,0 +1,45 @@
+import os
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+# Number of bytes read from the start of a file to classify it
+SNIFF_SIZE = 8 * 1024
+# Bytes that are expected in text: common whitespace and escape, printable ASCII,
+# and everything above 0x7F so that UTF-8 multibyte sequences count as text
+TEXT_BYTES = bytes({7, 8, 9, 10, 12, 13, 27} | set(range(0x20, 0x100)) - {0x7F})
+# Ratio of control characters above which content is treated as binary
+MAX_CONTROL_RATIO = 0.3
+
+
+def is_binary_content(head: bytes) -> bool:
+    """
+    Classifies the first bytes of a file. Content containing a NUL byte, or with
+    a high ratio of control characters, is considered binary.
+    """
+    if not head:
+        return False
+    if b"\0" in head:
+        return True
+    control_chars = head.translate(None, TEXT_BYTES)
+    return len(control_chars) / len(head) > MAX_CONTROL_RATIO
+
+
+def is_binary_file(file_path: Path, file_stat: Optional[os.stat_result] = None) -> bool:
+    """
+    Checks whether a file is binary by sniffing its first few KB.
+
+    Results are cached by (path, size, mtime), so each file is only read once
+    across filtering, summary and digest generation while it is unchanged.
+    """
+    if file_stat is None:
+        file_stat = file_path.stat()
+    return _is_binary_file(str(file_path), file_stat.st_size, file_stat.st_mtime_ns)
+
+
+@lru_cache(maxsize=65536)
+def _is_binary_file(path: str, size: int, mtime_ns: int) -> bool:
+    if size == 0:
+        return False
+    with open(path, "rb") as f:
+        return is_binary_content(f.read(SNIFF_SIZE))
@@ -1 +1,2 @@
 DIGEST_DIR = "digests"
+ARTIFACT_DIR = f"{DIGEST_DIR}/artifacts"
@@ -1,104 +1,301 @@
+import base64
 import concurrent.futures
+import hashlib
 import os
-from concurrent.futures import Future
+import stat
+from dataclasses import dataclass
 from io import StringIO
 from pathlib import Path
-from typing import List, Optional, TypeVar
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO, Tuple, TypeVar
 
 from pydantic import BaseModel, Field
 
+from repo_tool.core.binary import is_binary_file
 from repo_tool.core.contants import DIGEST_DIR
-from repo_tool.core.filter import filter_files_in_repo
+from repo_tool.core.filter import get_filter_settings_from_env, iter_scan_repository
 from repo_tool.core.github import Repository
-from repo_tool.core.summary import generate_summary
+from repo_tool.core.scan import FileRecord, FilterStats, read_records
+from repo_tool.core.summary import StatsAggregator, build_summary
+from repo_tool.core.tokens import encoding
+from repo_tool.core.transforms import iter_transformed
 
 T = TypeVar("T")  # Define a type variable for the Future's return type
 
+PREAMBLE = (
+    "The following text represents the contents of the repository.\n"
+    "Each section begins with ----, followed by the file path and name.\n"
+    "A file list is provided at the beginning. End of repository content is marked by --END--.\n\n"
+)
 
-def generateSummaryAndReport(repo_info: Repository, file_list: List[Path]) -> None:
-    summary = generate_summary(repo_info, file_list)
-    summary.generate_report()
 
-
-def generate_digest(repo_info: Repository, prompt: Optional[str] = None) -> None:
+def generate_digest(
+    repo_info: Repository,
+    prompt: Optional[str] = None,
+    dedup: bool = False,
+    transforms: Optional[List[str]] = None,
+) -> None:
     try:
-        file_list = filter_files_in_repo(repo_info.path, prompt)
-        if file_list:
-            print("Generating summary and digest...")
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                # Create properly typed futures list
-                futures: List[Future[None]] = [
-                    executor.submit(store_result_to_file, repo_info.path, file_list),
-                    executor.submit(generateSummaryAndReport, repo_info, file_list),
-                ]
-                # Wait for all tasks to complete
-                concurrent.futures.wait(futures)
-        else:
-            print("Failed to generate digest.")
+        stats = FilterStats()
+        aggregator = StatsAggregator()
+        dedup_stats = DedupStats() if dedup else None
+        filter_settings = get_filter_settings_from_env()
+        if transforms is not None:
+            filter_settings.transforms = transforms
+        # Each file is read once, transformed and written to the digest as soon
+        # as it passes the filters, while the summary statistics are collected
+        # on the way
+        records = iter_transformed(
+            iter_scan_repository(
+                repo_info.path,
+                prompt,
+                filter_settings=filter_settings,
+                stats=stats,
+                count_tokens=True,
+                keep_content=True,
+            ),
+            filter_settings.transforms,
+        )
+        print("Generating summary and digest...")
+        file_count = store_records_to_file(
+            repo_info.path, collect_stats(records, aggregator), dedup_stats
+        )
+        if dedup_stats is not None:
+            print(
+                f"Replaced {dedup_stats.duplicates} identical files with references, "
+                f"saving {dedup_stats.saved_tokens} tokens."
+            )
+        print_report(repo_info, stats, aggregator, file_count)
     except Exception as e:
         print("Error:", e)
 
 
-def generate_digest_content(repo_path: Path, filtered_files: List[Path]) -> str:
+def print_report(
+    repo_info: Repository,
+    stats: FilterStats,
+    aggregator: StatsAggregator,
+    file_count: int,
+) -> None:
+    print(
+        f"Checked {stats.files_checked} files, "
+        f"skipped {stats.encodes_skipped} token encodes."
+    )
+    if aggregator.original_context_length is not None:
+        print(
+            f"Transforms reduced {aggregator.original_context_length} tokens "
+            f"to {aggregator.context_length}."
+        )
+    if file_count:
+        file_stats = aggregator.file_stats()
+        summary = build_summary(repo_info, file_stats)
+        summary.generate_report(all_files=file_stats.file_data)
+    else:
+        print("Failed to generate digest.")
+
+
+def collect_stats(
+    records: Iterable[FileRecord], aggregator: StatsAggregator
+) -> Iterator[FileRecord]:
+    """
+    Passes the records through while adding them to the summary statistics.
+    """
+    for record in records:
+        aggregator.add(record)
+        yield record
+
+
+@dataclass
+class DedupStats:
+    """What the dedup mode of the digest saved"""
+
+    duplicates: int = 0
+    saved_tokens: int = 0
+
+
+def generate_digest_content(
+    repo_path: Path,
+    filtered_files: List[Path],
+    dedup: Optional[DedupStats] = None,
+) -> str:
     """
     Generates digest content as a string from the filtered files in the repository.
+    Identical files are written once if dedup is given, see iter_digest_sections.
     """
-    if not filtered_files:
-        return "No matching files found."
+    return digest_from_records(read_records(repo_path, filtered_files), dedup)
+
 
+def digest_from_records(
+    records: Iterable[FileRecord], dedup: Optional[DedupStats] = None
+) -> str:
+    """
+    Generates digest content as a string from scanned file records.
+    """
     output = StringIO()
+    write_digest(records, output, dedup)
+    return output.getvalue()
 
-    # Add preamble
-    output.write(
-        "The following text represents the contents of the repository.\n"
-        "Each section begins with ----, followed by the file path and name.\n"
-        "A file list is provided at the beginning. End of repository content is marked by --END--.\n\n"
-    )
 
-    # ファイルのみを処理
-    file_list = [f for f in filtered_files if f.is_file()]
+def write_digest(
+    records: Iterable[FileRecord],
+    output: TextIO,
+    dedup: Optional[DedupStats] = None,
+) -> int:
+    """
+    Writes the digest of scanned file records to output as the records arrive,
+    and returns the number of files written.
+    """
+    file_count = 0
+
+    def counted() -> Iterator[FileRecord]:
+        nonlocal file_count
+        for record in records:
+            file_count += not record.is_binary
+            yield record
 
-    # Add file contents
-    for file_path in file_list:
-        try:
-            relative_path = file_path.relative_to(repo_path)
-            output.write("----\n")  # Section divider
-            output.write(f"{relative_path}\n")  # File path
+    for chunk in iter_digest(counted(), dedup=dedup):
+        output.write(chunk)
+    return file_count
 
-            # ファイルを1行ずつ読み込んで処理
-            with file_path.open("r", encoding="utf-8", errors="ignore") as f:
-                for line in f:
-                    output.write(line)
-            output.write("\n")
 
-        except Exception as e:
+def iter_digest(
+    records: Iterable[FileRecord],
+    preamble: str = PREAMBLE,
+    end_marker: str = "--END--",
+    dedup: Optional[DedupStats] = None,
+) -> Iterator[str]:
+    """
+    Yields the digest of scanned file records piece by piece, so it can be
+    streamed without holding more than one file in memory. The records must
+    hold their content, see iter_scan_repository(keep_content=True) and
+    iter_with_content.
+    """
+    for _, text in iter_digest_sections(records, preamble, end_marker, dedup):
+        yield text
+
+
+def iter_digest_sections(
+    records: Iterable[FileRecord],
+    preamble: str = PREAMBLE,
+    end_marker: str = "--END--",
+    dedup: Optional[DedupStats] = None,
+) -> Iterator[Tuple[Optional[str], str]]:
+    """
+    Yields the pieces of the digest with the relative path of the file whose
+    section they belong to, or None for the preamble and the end marker.
+
+    If dedup is given, the content of each file is hashed and only the first
+    file with a given content is written in full. Later copies get a reference
+    to it, and the number of copies and the tokens saved are added to dedup and
+    reported at the end of the digest.
+    """
+    # Content hash -> path of the first file and its token count, if known
+    seen: Dict[str, Tuple[str, Optional[int]]] = {}
+    file_count = 0
+    for record in records:
+        # テキストファイルのみを処理
+        if record.is_binary:
+            continue
+
+        if file_count == 0:
+            # Add preamble
+            yield None, preamble
+        file_count += 1
+
+        # Section divider and file path
+        path = record.relative_path
+        yield path, f"----\n{path}\n"
+        if record.error is not None or record.content is None:
             # Log the error and continue
-            relative_path = file_path.relative_to(repo_path)
-            output.write("----\n")
-            output.write(f"{relative_path}\n")
-            output.write(f"Error reading file: {e}\n\n")
+            yield path, f"Error reading file: {record.error}\n\n"
+            continue
+        if dedup is not None:
+            content_hash = hashlib.sha1(record.content.encode()).hexdigest()
+            original = seen.get(content_hash)
+            if original is None:
+                seen[content_hash] = (path, record.tokens)
+            else:
+                original_path, tokens = original
+                reference = f"(identical to {original_path})\n"
+                if len(reference) < len(record.content):
+                    if tokens is None:
+                        tokens = len(encoding.encode_ordinary(record.content))
+                        seen[content_hash] = (original_path, tokens)
+                    reference_tokens = len(encoding.encode_ordinary(reference))
+                    dedup.duplicates += 1
+                    dedup.saved_tokens += max(0, tokens - reference_tokens)
+                    yield path, reference
+                    continue
+        yield path, record.content
+        yield path, "\n"
+
+    if file_count == 0:
+        yield None, "No matching files found."
+        return
+    if dedup is not None and dedup.duplicates:
+        yield None, (
+            f"{dedup.duplicates} identical files were replaced by references, "
+            f"saving {dedup.saved_tokens} tokens.\n"
+        )
+    yield None, end_marker
 
-    output.write("--END--")
-    return output.getvalue()
+
+def iter_indexed_digest(
+    records: Iterable[FileRecord],
+    index: Dict[str, Tuple[int, int]],
+    dedup: Optional[DedupStats] = None,
+) -> Iterator[bytes]:
+    """
+    Yields the encoded digest while recording the byte offset and length of
+    each file's section, including its header, in index.
+    """
+    offset = 0
+    for path, text in iter_digest_sections(records, dedup=dedup):
+        data = text.encode()
+        if path is not None:
+            start, length = index.get(path, (offset, 0))
+            index[path] = (start, length + len(data))
+        offset += len(data)
+        yield data
+
+
+def is_text_file(file_path: Path) -> bool:
+    """
+    Returns True if the path is a regular file that is not binary.
+    """
+    try:
+        file_stat = file_path.stat()
+    except OSError:
+        return False
+    return stat.S_ISREG(file_stat.st_mode) and not is_binary_file(file_path, file_stat)
 
 
 def store_result_to_file(repo_path: Path, filtered_files: List[Path]) -> None:
     """
     Generates a digest from the filtered files and stores it in a file.
     """
-    if not filtered_files:
-        print("No matching files found.")
-        return
+    store_records_to_file(repo_path, read_records(repo_path, filtered_files))
 
+
+def store_records_to_file(
+    repo_path: Path,
+    records: Iterable[FileRecord],
+    dedup: Optional[DedupStats] = None,
+) -> int:
+    """
+    Writes the digest of scanned file records to a file as the records arrive,
+    and returns the number of files written.
+    """
     # 出力ディレクトリとファイルパスの設定
     output_dir = Path(DIGEST_DIR)
     output_dir.mkdir(exist_ok=True)
     output_path = output_dir / f"{repo_path.name}.txt"
 
-    digest_content = generate_digest_content(repo_path, filtered_files)
-
     with open(output_path, "w", encoding="utf-8") as output:
-        output.write(digest_content)
+        file_count = write_digest(records, output, dedup)
+
+    if file_count == 0:
+        output_path.unlink()
+        print("No matching files found.")
+    return file_count
 
 
 class File(BaseModel):
@@ -112,6 +309,10 @@ class RespositoryContent(BaseModel):
     name: str = Field(..., description="The name of the repository")
     author: str = Field(..., description="The author of the repository")
     files: List[File]
+    next_cursor: Optional[str] = Field(
+        default=None,
+        description="The cursor of the next page, or null on the last page",
+    )
 
 
 def read_file_content(file_path: Path, repository: Repository) -> Optional[File]:
@@ -126,7 +327,7 @@ def read_file_content(file_path: Path, repository: Repository) -> Optional[File]
         File object if successful, None if failed
     """
     try:
-        if not file_path.is_file():
+        if not is_text_file(file_path):
             return None
 
         relative_path = str(file_path.relative_to(repository.path))
@@ -162,15 +363,12 @@ def generate_repository_content(
 
     files = []
     with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-        # Submit all file reading tasks
-        future_to_file = {
-            executor.submit(read_file_content, file_path, repository): file_path
-            for file_path in filtered_files
-        }
-
-        # Collect results as they complete
-        for future in concurrent.futures.as_completed(future_to_file):
-            file_result = future.result()
+        # Results are collected in the order of the files, so it does not depend
+        # on which read finishes first
+        for file_result in executor.map(
+            lambda file_path: read_file_content(file_path, repository),
+            filtered_files,
+        ):
             if file_result:
                 files.append(file_result)
 
@@ -180,3 +378,99 @@ def generate_repository_content(
         author=repository.author,
         files=files,
     )
+
+
+def encode_cursor(relative_path: str) -> str:
+    return base64.urlsafe_b64encode(relative_path.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> str:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return base64.b64decode(padded, altchars=b"-_", validate=True).decode()
+    except ValueError as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def page_records(
+    records: Iterable[FileRecord],
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    max_bytes: Optional[int] = None,
+) -> Tuple[List[FileRecord], Optional[str]]:
+    """
+    Returns the text records of one page in path order, and the cursor of the
+    next page, or None on the last page.
+
+    A page holds at most limit files and max_bytes bytes of file content, but
+    always at least one file. Pages are decided by the sizes of the records, so
+    no file is read.
+    """
+    after = decode_cursor(cursor) if cursor else None
+    candidates = sorted(
+        (
+            record
+            for record in records
+            if not record.is_binary and (after is None or record.relative_path > after)
+        ),
+        key=lambda record: record.relative_path,
+    )
+    page: List[FileRecord] = []
+    page_bytes = 0
+    for record in candidates:
+        if limit is not None and len(page) >= limit:
+            break
+        if max_bytes is not None and page and page_bytes + record.size > max_bytes:
+            break
+        page.append(record)
+        page_bytes += record.size
+
+    next_cursor = None
+    if len(page) < len(candidates):
+        next_cursor = encode_cursor(page[-1].relative_path)
+    return page, next_cursor
+
+
+def file_from_record(repository: Repository, record: FileRecord, content: str) -> File:
+    return File(
+        path=record.relative_path,
+        content=content,
+        url=f"{repository.url}/blob/{repository.branch}/{record.relative_path}",
+    )
+
+
+def iter_file_lines(
+    repository: Repository, records: Iterable[FileRecord]
+) -> Iterator[str]:
+    """
+    Yields each text record as a File object in JSON on its own line, as soon as
+    the record arrives. The records must hold their content.
+    """
+    for record in records:
+        if record.is_binary or record.content is None:
+            continue
+        file = file_from_record(repository, record, record.content)
+        yield file.model_dump_json() + "\n"
+
+
+def repository_content_from_records(
+    repository: Repository,
+    records: Iterable[FileRecord],
+    next_cursor: Optional[str] = None,
+) -> RespositoryContent:
+    """
+    Generate repository content from scanned file records without reading the
+    files again. The records must hold their content.
+    """
+    files = [
+        file_from_record(repository, record, record.content)
+        for record in records
+        if not record.is_binary and record.content is not None
+    ]
+    return RespositoryContent(
+        id=repository.id,
+        name=repository.name,
+        author=repository.author,
+        files=files,
+        next_cursor=next_cursor,
+    )
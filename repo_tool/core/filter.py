@@ -1,13 +1,18 @@
-import fnmatch
+import hashlib
 import json
-from dataclasses import dataclass
+import os
+from dataclasses import dataclass, field
+from enum import Enum
 from pathlib import Path
-from typing import List, Optional
-
-import tiktoken
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
+from repo_tool.core.git_index import read_git_index
 from repo_tool.core.llm import filter_files_with_llm
 from repo_tool.core.logger import log_error
+from repo_tool.core.matcher import compile_filter
+from repo_tool.core.scan import FileRecord, FilterStats, iter_scan_files, scan_files
+from repo_tool.core.token_cache import TokenCache
+from repo_tool.core.tokens import BatchTokenizer
 
 
 @dataclass
@@ -15,6 +20,9 @@ class FilterSettings:
     include_patterns: List[str]
     exclude_patterns: List[str]
     max_tokens: int
+    # The transforms applied to the content of each file in the digest. They do
+    # not change which files pass, so they are not part of the fingerprint
+    transforms: List[str] = field(default_factory=list)
 
     @staticmethod
     def from_json(json_str: str) -> "FilterSettings":
@@ -23,6 +31,28 @@ class FilterSettings:
     def to_json(self) -> str:
         return json.dumps(self, ensure_ascii=False, default=lambda o: o.__dict__)
 
+    def fingerprint(self) -> str:
+        """
+        Returns a hash that changes whenever a setting that affects the filter
+        result changes. The order of the patterns does not matter.
+        """
+        canonical = json.dumps(
+            [
+                sorted(set(self.include_patterns)),
+                sorted(set(self.exclude_patterns)),
+                self.max_tokens,
+            ],
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class FileSource(str, Enum):
+    """Where the candidate files of a repository are enumerated from"""
+
+    FILESYSTEM = "filesystem"  # Walk the working tree
+    GIT_INDEX = "git_index"  # Read the tracked files from .git/index
+
 
 max_tokens = 50000
 
@@ -30,7 +60,18 @@ max_tokens = 50000
 def get_filter_settings_from_env() -> FilterSettings:
     include_patterns = read_pattern_file(Path(".") / ".gptinclude")
     exclude_patterns = read_pattern_file(Path(".") / ".gptignore")
-    return FilterSettings(include_patterns, exclude_patterns, max_tokens)
+    return FilterSettings(
+        include_patterns, exclude_patterns, max_tokens, get_transforms_from_env()
+    )
+
+
+def get_transforms_from_env() -> List[str]:
+    transforms = os.getenv("DIGEST_TRANSFORMS", "")
+    return [name.strip() for name in transforms.split(",") if name.strip()]
+
+
+def get_file_source_from_env() -> FileSource:
+    return FileSource(os.getenv("FILE_SOURCE", FileSource.FILESYSTEM.value))
 
 
 def read_pattern_file(file_path: Path) -> List[str]:
@@ -50,32 +91,143 @@ def read_pattern_file(file_path: Path) -> List[str]:
 
 def get_all_files(repo_path: Path, ignore_patterns: List[str]) -> List[Path]:
     try:
-        all_files = []
-        for path in repo_path.rglob("*"):
-            if not should_ignore(path, repo_path, ignore_patterns):
-                all_files.append(path)
-        return all_files
+        return list(walk_files(repo_path, ignore_patterns))
     except Exception as e:
         log_error(e)
         raise RuntimeError(f"Error while retrieving files from {repo_path}: {e}") from e
 
 
+def walk_files(repo_path: Path, ignore_patterns: List[str]) -> Iterator[Path]:
+    """
+    Walks the repository with os.scandir and yields every file that is not ignored.
+
+    Directories are checked against the ignore patterns before descending, so
+    excluded subtrees such as .git/ or node_modules/ are never listed. The type
+    information cached on each DirEntry is reused, so no extra stat calls are made.
+    Entries are visited in sorted order to keep the output deterministic.
+    """
+    matcher = compile_filter([], ignore_patterns)
+    stack = [(str(repo_path), "")]
+    while stack:
+        dir_path, relative_dir = stack.pop()
+        with os.scandir(dir_path) as it:
+            entries = sorted(it, key=lambda entry: entry.name)
+
+        sub_dirs = []
+        for entry in entries:
+            relative_path = relative_dir + entry.name
+            if entry.is_dir(follow_symlinks=False):
+                if not matcher.should_prune(relative_path):
+                    sub_dirs.append((entry.path, relative_path + "/"))
+            elif entry.is_file() and not matcher.is_ignored(relative_path):
+                yield Path(entry.path)
+
+        # Pushed in reverse so that directories are walked in sorted order
+        stack.extend(reversed(sub_dirs))
+
+
+def make_path_filter(ignore_patterns: List[str]) -> Callable[[str], bool]:
+    """
+    Returns a function that checks whether a repository relative file path would
+    be listed by walk_files: it is not ignored and no directory above it is
+    pruned. A path ending with / is a directory, which is checked for whether
+    walk_files descends into it. The results for directories are cached
+    between calls.
+    """
+    matcher = compile_filter([], ignore_patterns)
+    pruned_dirs: Dict[str, bool] = {}
+
+    def is_in_pruned_dir(relative_path: str) -> bool:
+        parent, _, _ = relative_path.rpartition("/")
+        if not parent:
+            return False
+        if parent not in pruned_dirs:
+            pruned_dirs[parent] = is_in_pruned_dir(parent) or matcher.should_prune(
+                parent
+            )
+        return pruned_dirs[parent]
+
+    def is_listed(relative_path: str) -> bool:
+        if relative_path.endswith("/"):
+            return not is_in_pruned_dir(relative_path)
+        return not matcher.is_ignored(relative_path) and not is_in_pruned_dir(
+            relative_path
+        )
+
+    return is_listed
+
+
+def walk_order_key(relative_path: str) -> Tuple[Tuple[str, ...], str]:
+    """
+    Sort key that orders repository relative paths like walk_files lists them:
+    the files of a directory before its sub directories, both in name order.
+    """
+    *parents, name = relative_path.split("/")
+    return tuple(parents), name
+
+
+def sort_records(
+    records: Iterable[FileRecord], file_source: FileSource
+) -> List[FileRecord]:
+    """
+    Sorts records in the order the file source lists them. The git index is
+    sorted by path bytes.
+    """
+    if file_source is FileSource.GIT_INDEX:
+        return sorted(
+            records,
+            key=lambda r: r.relative_path.encode("utf-8", errors="surrogateescape"),
+        )
+    return sorted(records, key=lambda r: walk_order_key(r.relative_path))
+
+
+def get_tracked_files(
+    repo_path: Path,
+    ignore_patterns: List[str],
+    token_cache: Optional[TokenCache] = None,
+) -> List[Path]:
+    """
+    Lists the tracked files of a repository from its git index instead of walking
+    the working tree, so untracked build output is skipped automatically.
+
+    The ignore patterns are applied like in walk_files, including directories
+    that would be pruned. The blob SHAs of the index are registered with the
+    token cache so that unchanged files do not need to be hashed.
+    """
+    is_listed = make_path_filter(ignore_patterns)
+    entries = [entry for entry in read_git_index(repo_path) if is_listed(entry.path)]
+    if token_cache is not None:
+        token_cache.add_index_entries(repo_path, entries)
+    return [repo_path / entry.path for entry in entries]
+
+
 def should_ignore(file_path: Path, repo_path: Path, ignore_patterns: List[str]) -> bool:
     """
     Checks if a file or directory matches any of the ignore patterns.
     """
-    relative_path = str(file_path.relative_to(repo_path))
-    for pattern in ignore_patterns:
-        # Match directories and files explicitly
-        if pattern.endswith("/") and file_path.is_dir():
-            if fnmatch.fnmatch(relative_path + "/", pattern):
-                return True
-        elif fnmatch.fnmatch(relative_path, pattern):
-            return True
-    return False
+    relative_path = file_path.relative_to(repo_path).as_posix()
+    return matches_ignore_pattern(relative_path, file_path.is_dir(), ignore_patterns)
 
 
-encoding = tiktoken.get_encoding("o200k_base")
+def matches_ignore_pattern(
+    relative_path: str, is_dir: bool, ignore_patterns: List[str]
+) -> bool:
+    """
+    Checks a repository relative path against the ignore patterns.
+    """
+    return compile_filter([], ignore_patterns).is_ignored(relative_path, is_dir)
+
+
+def should_prune_dir(relative_dir: str, ignore_patterns: List[str]) -> bool:
+    """
+    Checks if everything below a directory is ignored, so the walk can skip it.
+
+    A directory is pruned when it matches a directory pattern ("node_modules/"),
+    or when a pattern ending with "*" ("*bin/*", "examples/**") already matches
+    the directory path itself followed by "/", which means it matches every
+    path below it.
+    """
+    return compile_filter([], ignore_patterns).should_prune(relative_dir)
 
 
 def filter_files(
@@ -84,70 +236,210 @@ def filter_files(
     ignore_patterns: List[str],
     include_patterns: List[str],
     max_tokens: int,
+    stats: Optional[FilterStats] = None,
+    token_cache: Optional[TokenCache] = None,
+    tokenizer: Optional[BatchTokenizer] = None,
 ) -> List[Path]:
     """
     Filters the files based on .gptignore and .gptinclude patterns.
+
+    Binary files are dropped by sniffing their first bytes. Text files are only
+    tokenized when their byte size does not already decide the max_tokens check,
+    and their token counts are read through the token cache. Files that still
+    need tokenizing are encoded together by the batch tokenizer. Pass a
+    FilterStats to collect how many encodes were skipped.
     """
-    filtered_files = []
-    for file_path in all_files:
-        if should_ignore(file_path, repo_path, ignore_patterns):
-            continue
+    records = scan_files(
+        all_files,
+        repo_path,
+        ignore_patterns,
+        include_patterns,
+        max_tokens,
+        stats=stats,
+        token_cache=token_cache,
+        tokenizer=tokenizer,
+    )
+    return [record.path for record in records if not record.is_binary]
 
-        relative_path = str(file_path.relative_to(repo_path))
 
-        # Check if the file matches any include pattern
-        include_match = any(
-            fnmatch.fnmatch(relative_path, pattern) for pattern in include_patterns
+def scan_repository(
+    repo_path: Path,
+    prompt: Optional[str] = None,
+    filter_settings: Optional[FilterSettings] = None,
+    stats: Optional[FilterStats] = None,
+    token_cache: Optional[TokenCache] = None,
+    file_source: Optional[FileSource] = None,
+    tokenizer: Optional[BatchTokenizer] = None,
+    count_tokens: bool = False,
+    keep_content: bool = False,
+) -> List[FileRecord]:
+    """
+    Filters a repository like filter_files_in_repo and returns the records of the
+    text files that passed. See iter_scan_repository.
+    """
+    return list(
+        iter_scan_repository(
+            repo_path,
+            prompt,
+            filter_settings,
+            stats,
+            token_cache,
+            file_source,
+            tokenizer,
+            count_tokens,
+            keep_content,
         )
+    )
 
-        # If include patterns are provided, skip files that do not match
-        if include_patterns and not include_match:
-            continue
-
-        if file_path.is_dir():
-            continue
-
-        with file_path.open("r", encoding="utf-8", errors="ignore") as f:
-            content = f.read()
-            file_size = len(encoding.encode(content))
-
-        if file_size >= max_tokens:
-            continue
 
-        filtered_files.append(file_path)
-    return filtered_files
-
-
-def filter_files_in_repo(
+def iter_scan_repository(
     repo_path: Path,
     prompt: Optional[str] = None,
     filter_settings: Optional[FilterSettings] = None,
-) -> List[Path]:
+    stats: Optional[FilterStats] = None,
+    token_cache: Optional[TokenCache] = None,
+    file_source: Optional[FileSource] = None,
+    tokenizer: Optional[BatchTokenizer] = None,
+    count_tokens: bool = False,
+    keep_content: bool = False,
+) -> Iterator[FileRecord]:
     """
-    Processes a repository using the .gptignore file to filter files.
+    Filters a repository like filter_files_in_repo and yields the records of the
+    text files as they pass, so the summary and the digest can be built while
+    the walk is still running and without reading the files again.
+
+    With count_tokens every record has its exact token count, and with
+    keep_content every record holds the text of its file. With a prompt the
+    files are sent to the LLM in batches as they pass, and the records are
+    yielded once the LLM has selected them.
     """
     if not repo_path.exists():
         raise ValueError(f"Repository path '{repo_path}' does not exist.")
 
     if filter_settings is None:
         filter_settings = get_filter_settings_from_env()
+    if file_source is None:
+        file_source = get_file_source_from_env()
+    if token_cache is None:
+        token_cache = TokenCache()
 
+    records = _iter_scan_repository(
+        repo_path,
+        filter_settings,
+        stats,
+        token_cache,
+        file_source,
+        tokenizer,
+        count_tokens,
+        keep_content,
+    )
+    if prompt:
+        return _iter_selected_by_llm(records, prompt)
+    return records
+
+
+def _iter_scan_repository(
+    repo_path: Path,
+    filter_settings: FilterSettings,
+    stats: Optional[FilterStats],
+    token_cache: TokenCache,
+    file_source: FileSource,
+    tokenizer: Optional[BatchTokenizer],
+    count_tokens: bool,
+    keep_content: bool,
+) -> Iterator[FileRecord]:
     try:
         # Get all files and filter based on extensions and .gptignore
-        all_files = get_all_files(repo_path, filter_settings.exclude_patterns)
-        filtered_files = filter_files(
+        all_files: Iterable[Path]
+        if file_source is FileSource.GIT_INDEX:
+            all_files = get_tracked_files(
+                repo_path, filter_settings.exclude_patterns, token_cache
+            )
+        else:
+            all_files = walk_files(repo_path, filter_settings.exclude_patterns)
+        for record in iter_scan_files(
             all_files,
             repo_path,
             filter_settings.exclude_patterns,
             filter_settings.include_patterns,
             filter_settings.max_tokens,
-        )
-        if prompt:
-            filtered_files = filter_files_with_llm(filtered_files, prompt)
-        file_list = [file_path for file_path in filtered_files if file_path.is_file()]
-        return file_list
+            count_tokens=count_tokens,
+            keep_content=keep_content,
+            stats=stats,
+            token_cache=token_cache,
+            tokenizer=tokenizer,
+        ):
+            if not record.is_binary:
+                yield record
     except Exception as e:
         log_error(e)
         raise RuntimeError(
             f"Error while processing repository '{repo_path}': {e}"
         ) from e
+
+
+def _iter_selected_by_llm(
+    records: Iterator[FileRecord], prompt: str
+) -> Iterator[FileRecord]:
+    passed: List[FileRecord] = []
+
+    def paths() -> Iterator[Path]:
+        for record in records:
+            passed.append(record)
+            yield record.path
+
+    selected = set(filter_files_with_llm(paths(), prompt))
+    yield from (record for record in passed if record.path in selected)
+
+
+def iter_filtered_files(
+    repo_path: Path,
+    prompt: Optional[str] = None,
+    filter_settings: Optional[FilterSettings] = None,
+    stats: Optional[FilterStats] = None,
+    token_cache: Optional[TokenCache] = None,
+    file_source: Optional[FileSource] = None,
+    tokenizer: Optional[BatchTokenizer] = None,
+) -> Iterator[Path]:
+    """
+    Yields the files of a repository as they pass the filters, in the same order
+    as filter_files_in_repo returns them.
+    """
+    for record in iter_scan_repository(
+        repo_path,
+        prompt,
+        filter_settings,
+        stats,
+        token_cache,
+        file_source,
+        tokenizer,
+    ):
+        yield record.path
+
+
+def filter_files_in_repo(
+    repo_path: Path,
+    prompt: Optional[str] = None,
+    filter_settings: Optional[FilterSettings] = None,
+    stats: Optional[FilterStats] = None,
+    token_cache: Optional[TokenCache] = None,
+    file_source: Optional[FileSource] = None,
+    tokenizer: Optional[BatchTokenizer] = None,
+) -> List[Path]:
+    """
+    Processes a repository using the .gptignore file to filter files.
+
+    Candidate files are enumerated from the working tree or from the git index,
+    depending on file_source (default: the FILE_SOURCE environment variable).
+    """
+    return list(
+        iter_filtered_files(
+            repo_path,
+            prompt,
+            filter_settings,
+            stats,
+            token_cache,
+            file_source,
+            tokenizer,
+        )
+    )
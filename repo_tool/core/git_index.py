@@ -0,0 +1,135 @@
+import os
+import struct
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Tuple
+
+INDEX_SIGNATURE = b"DIRC"
+SUPPORTED_VERSIONS = (2, 3, 4)
+
+# ctime, mtime, dev, ino, mode, uid, gid, size, sha1, flags
+ENTRY_HEADER = struct.Struct(">IIIIIIIIII20sH")
+EXTENDED_FLAG = 0x4000
+STAGE_MASK = 0x3000
+NAME_LENGTH_MASK = 0x0FFF
+SKIP_WORKTREE_FLAG = 0x4000
+
+# Object types stored in the upper bits of the mode
+OBJECT_TYPE_MASK = 0o170000
+REGULAR_FILE = 0o100000
+
+
+@dataclass(frozen=True)
+class IndexEntry:
+    path: str
+    blob_sha: str
+    size: int
+    mtime_s: int
+    mtime_ns: int
+
+    def matches_stat(self, file_stat: os.stat_result) -> bool:
+        """
+        Returns True if the file has not changed since the index was written,
+        which means blob_sha is the SHA of the file in the working tree.
+        """
+        return (
+            self.size == file_stat.st_size % 2**32
+            and self.mtime_s == int(file_stat.st_mtime)
+            and (self.mtime_ns == 0 or self.mtime_ns == file_stat.st_mtime_ns % 10**9)
+        )
+
+
+def decode_offset(data: bytes, pos: int) -> Tuple[int, int]:
+    """
+    Decodes the variable length integer used for path prefix compression
+    in index version 4.
+    """
+    byte = data[pos]
+    pos += 1
+    value = byte & 0x7F
+    while byte & 0x80:
+        byte = data[pos]
+        pos += 1
+        value = ((value + 1) << 7) | (byte & 0x7F)
+    return value, pos
+
+
+def read_git_index(repo_path: Path) -> List[IndexEntry]:
+    """
+    Reads the tracked regular files of a repository from .git/index.
+
+    Only stage 0 entries are returned. Submodules, symlinks and entries marked
+    skip-worktree are left out, since they are not regular files in the working
+    tree. Raises ValueError if the index is missing or in an unsupported format.
+    """
+    index_path = repo_path / ".git" / "index"
+    try:
+        data = index_path.read_bytes()
+    except OSError as e:
+        raise ValueError(f"Git index not found at {index_path}") from e
+
+    if len(data) < 12 or data[:4] != INDEX_SIGNATURE:
+        raise ValueError(f"Invalid git index: {index_path}")
+    version, entry_count = struct.unpack_from(">II", data, 4)
+    if version not in SUPPORTED_VERSIONS:
+        raise ValueError(f"Unsupported git index version {version}: {index_path}")
+
+    entries = []
+    pos = 12
+    previous_path = b""
+    for _ in range(entry_count):
+        entry_start = pos
+        (
+            _ctime_s,
+            _ctime_ns,
+            mtime_s,
+            mtime_ns,
+            _dev,
+            _ino,
+            mode,
+            _uid,
+            _gid,
+            size,
+            sha,
+            flags,
+        ) = ENTRY_HEADER.unpack_from(data, pos)
+        pos += ENTRY_HEADER.size
+
+        extended_flags = 0
+        if version >= 3 and flags & EXTENDED_FLAG:
+            (extended_flags,) = struct.unpack_from(">H", data, pos)
+            pos += 2
+
+        if version == 4:
+            strip, pos = decode_offset(data, pos)
+            end = data.index(b"\0", pos)
+            path = previous_path[: len(previous_path) - strip] + data[pos:end]
+            pos = end + 1
+        else:
+            name_length = flags & NAME_LENGTH_MASK
+            if name_length == NAME_LENGTH_MASK:
+                end = data.index(b"\0", pos)
+            else:
+                end = pos + name_length
+            path = data[pos:end]
+            # Entries are padded with 1-8 NUL bytes to a multiple of 8 bytes
+            pos = entry_start + ((end - entry_start + 8) & ~7)
+        previous_path = path
+
+        if (
+            flags & STAGE_MASK
+            or extended_flags & SKIP_WORKTREE_FLAG
+            or mode & OBJECT_TYPE_MASK != REGULAR_FILE
+        ):
+            continue
+
+        entries.append(
+            IndexEntry(
+                path=path.decode("utf-8", errors="surrogateescape"),
+                blob_sha=sha.hex(),
+                size=size,
+                mtime_s=mtime_s,
+                mtime_ns=mtime_ns,
+            )
+        )
+    return entries
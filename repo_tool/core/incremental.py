@@ -0,0 +1,231 @@
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, List, Optional, Protocol, Set
+
+from git import GitCommandError, Repo
+
+from repo_tool.core.filter import (
+    FileSource,
+    FilterSettings,
+    get_file_source_from_env,
+    get_filter_settings_from_env,
+    make_path_filter,
+    scan_repository,
+    sort_records,
+)
+from repo_tool.core.scan import FileRecord, FilterStats, scan_files
+from repo_tool.core.token_cache import TokenCache
+from repo_tool.core.tokens import BatchTokenizer, encoding
+
+
+@dataclass
+class FilterResult:
+    """The files that passed the filters at a commit"""
+
+    commit_sha: str
+    records: List[FileRecord]
+
+
+class FilterResultStore(Protocol):
+    """Persistent storage of filter results keyed by repository and state key"""
+
+    def get(self, repository_id: str, state_key: str) -> Optional[FilterResult]:
+        """Returns the stored result, with record paths relative to the repository"""
+        ...
+
+    def get_commit(self, repository_id: str, state_key: str) -> Optional[str]:
+        """Returns the commit of the stored result without reading its records"""
+        ...
+
+    def replace(
+        self,
+        repository_id: str,
+        state_key: str,
+        commit_sha: str,
+        records: Iterable[FileRecord],
+    ) -> None: ...
+
+    def apply(
+        self,
+        repository_id: str,
+        state_key: str,
+        commit_sha: str,
+        removed_paths: Iterable[str],
+        records: Iterable[FileRecord],
+    ) -> None:
+        """Removes the given paths, then adds or replaces the given records"""
+        ...
+
+
+def get_state_key(filter_settings: FilterSettings, file_source: FileSource) -> str:
+    """
+    Returns the key of a stored filter result. Results are only reused for the
+    same filter settings, file source and encoding.
+    """
+    return f"{filter_settings.fingerprint()}:{file_source.value}:{encoding.name}"
+
+
+def has_uncommitted_changes(
+    repo: Repo, file_source: FileSource, filter_settings: FilterSettings
+) -> bool:
+    """
+    Checks whether the files of the file source may differ from HEAD.
+
+    The git index only lists tracked files, so only their changes count. The
+    walked working tree also lists untracked files and files ignored by
+    .gitignore, whose edits git does not see, so any of them that the exclude
+    patterns do not exclude counts as a change.
+    """
+    if file_source is FileSource.GIT_INDEX:
+        return repo.is_dirty(untracked_files=False)
+
+    # Untracked and ignored directories are reported as a whole, with a
+    # trailing slash
+    output = repo.git.status("--porcelain", "-z", "--ignored")
+    is_listed = make_path_filter(filter_settings.exclude_patterns)
+    for entry in output.split("\0"):
+        if not entry:
+            continue
+        status, path = entry[:2], entry[3:]
+        if status not in ("??", "!!") or is_listed(path):
+            return True
+    return False
+
+
+def changed_paths(repo: Repo, old_sha: str, new_sha: str) -> Optional[Set[str]]:
+    """
+    Returns the paths that were added, modified, deleted or renamed between two
+    commits. Both sides of a rename are returned. Returns None if the old commit
+    is no longer available.
+    """
+    try:
+        output = repo.git.diff("--name-only", "-z", "--no-renames", old_sha, new_sha)
+    except GitCommandError:
+        return None
+    return {path for path in output.split("\0") if path}
+
+
+def sync_filter_result(
+    repo_path: Path,
+    repository_id: str,
+    store: FilterResultStore,
+    filter_settings: Optional[FilterSettings] = None,
+    stats: Optional[FilterStats] = None,
+    token_cache: Optional[TokenCache] = None,
+    file_source: Optional[FileSource] = None,
+    tokenizer: Optional[BatchTokenizer] = None,
+) -> Optional[str]:
+    """
+    Brings the stored filter result up to HEAD and returns its state key, or
+    None when the files have uncommitted changes and nothing is stored, see
+    has_uncommitted_changes.
+
+    Only the paths changed between the stored commit and HEAD are checked
+    again, so the cost follows the size of the diff. The whole repository is
+    scanned when there is no stored result or when the stored commit is gone.
+    """
+    if filter_settings is None:
+        filter_settings = get_filter_settings_from_env()
+    if file_source is None:
+        file_source = get_file_source_from_env()
+    if token_cache is None:
+        token_cache = TokenCache()
+
+    repo = Repo(repo_path)
+    if has_uncommitted_changes(repo, file_source, filter_settings):
+        return None
+    head_sha = repo.head.commit.hexsha
+    state_key = get_state_key(filter_settings, file_source)
+
+    stored_sha = store.get_commit(repository_id, state_key)
+    if stored_sha == head_sha:
+        return state_key
+
+    changed = None
+    if stored_sha is not None:
+        changed = changed_paths(repo, stored_sha, head_sha)
+    if changed is None:
+        records = scan_repository(
+            repo_path,
+            filter_settings=filter_settings,
+            stats=stats,
+            token_cache=token_cache,
+            file_source=file_source,
+            tokenizer=tokenizer,
+            count_tokens=True,
+        )
+        store.replace(repository_id, state_key, head_sha, records)
+        return state_key
+
+    is_listed = make_path_filter(filter_settings.exclude_patterns)
+    candidates = [
+        repo_path / path
+        for path in sorted(changed)
+        if is_listed(path) and (repo_path / path).is_file()
+    ]
+    updated = [
+        record
+        for record in scan_files(
+            candidates,
+            repo_path,
+            filter_settings.exclude_patterns,
+            filter_settings.include_patterns,
+            filter_settings.max_tokens,
+            count_tokens=True,
+            stats=stats,
+            token_cache=token_cache,
+            tokenizer=tokenizer,
+        )
+        if not record.is_binary
+    ]
+    store.apply(repository_id, state_key, head_sha, changed, updated)
+    return state_key
+
+
+def refresh_filter_result(
+    repo_path: Path,
+    repository_id: str,
+    store: FilterResultStore,
+    filter_settings: Optional[FilterSettings] = None,
+    stats: Optional[FilterStats] = None,
+    token_cache: Optional[TokenCache] = None,
+    file_source: Optional[FileSource] = None,
+    tokenizer: Optional[BatchTokenizer] = None,
+) -> List[FileRecord]:
+    """
+    Returns the records of the files that pass the filters at HEAD, with their
+    exact token counts, reusing the result stored for the previously processed
+    commit, see sync_filter_result. When tracked files have uncommitted changes
+    the whole repository is scanned and the result is not stored.
+    """
+    if filter_settings is None:
+        filter_settings = get_filter_settings_from_env()
+    if file_source is None:
+        file_source = get_file_source_from_env()
+    if token_cache is None:
+        token_cache = TokenCache()
+
+    state_key = sync_filter_result(
+        repo_path,
+        repository_id,
+        store,
+        filter_settings=filter_settings,
+        stats=stats,
+        token_cache=token_cache,
+        file_source=file_source,
+        tokenizer=tokenizer,
+    )
+    result = None if state_key is None else store.get(repository_id, state_key)
+    if result is None:
+        return scan_repository(
+            repo_path,
+            filter_settings=filter_settings,
+            stats=stats,
+            token_cache=token_cache,
+            file_source=file_source,
+            tokenizer=tokenizer,
+            count_tokens=True,
+        )
+    for record in result.records:
+        record.path = repo_path / record.relative_path
+    return sort_records(result.records, file_source)
@@ -1,7 +1,8 @@
 import asyncio
+import itertools
 import os
 from pathlib import Path
-from typing import Any, List
+from typing import Iterable, List
 
 from dotenv import load_dotenv
 from langchain.prompts import ChatPromptTemplate
@@ -60,13 +61,6 @@ class FilteredFiles(BaseModel):
     )
 
 
-def split_into_batches(items: List[Any], batch_size: int) -> List[List[Any]]:
-    """
-    Split a list into smaller batches.
-    """
-    return [items[i : i + batch_size] for i in range(0, len(items), batch_size)]
-
-
 llm_chain = None
 if os.getenv("OPENAI_API_KEY"):
     llm = ChatOpenAI(
@@ -103,33 +97,39 @@ async def filter_files_batch(file_batch: List[Path], prompt: str) -> List[Path]:
 
 
 async def filter_files_with_llm_in_batch(
-    file_list: List[Path], prompt: str, batch_size: int = defatult_batch_size
+    file_list: Iterable[Path], prompt: str, batch_size: int = defatult_batch_size
 ) -> List[Path]:
     """
-    Filter a list of files in batches using an LLM.
+    Filter files in batches using an LLM.
+
+    The files can be a generator. Each batch is sent as soon as it is full, and
+    the next batch is taken from the generator in a worker thread, so the LLM
+    calls overlap with producing the files.
     """
     print("Using LLM to filter files in parallel...")
 
-    # Split file list into batches
-    batches = split_into_batches(file_list, batch_size)
+    files = iter(file_list)
+
+    def take_batch() -> List[Path]:
+        return list(itertools.islice(files, batch_size))
 
     # Process each batch in parallel
-    tasks = [
-        asyncio.create_task(filter_files_batch(batch, prompt)) for batch in batches
-    ]
+    tasks = []
+    file_count = 0
+    while batch := await asyncio.to_thread(take_batch):
+        file_count += len(batch)
+        tasks.append(asyncio.create_task(filter_files_batch(batch, prompt)))
     results = await asyncio.gather(*tasks)
 
     # Combine results
     filtered_files = [file for batch_result in results for file in batch_result]
 
-    print(
-        f"Finished filtering {len(file_list)} files with LLM in {len(batches)} batches."
-    )
+    print(f"Finished filtering {file_count} files with LLM in {len(tasks)} batches.")
     return filtered_files
 
 
 def filter_files_with_llm(
-    file_list: List[Path], prompt: str, batch_size: int = defatult_batch_size
+    file_list: Iterable[Path], prompt: str, batch_size: int = defatult_batch_size
 ) -> List[Path]:
     """
     Synchronous wrapper for filtering files with LLM in batches.
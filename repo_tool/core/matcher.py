@@ -0,0 +1,128 @@
+import fnmatch
+import os
+import re
+from functools import lru_cache
+from typing import Iterable, List, Optional, Pattern, Set, Tuple
+
+GLOB_CHARS = ("*", "?", "[")
+
+
+def is_literal(pattern: str) -> bool:
+    return not any(char in pattern for char in GLOB_CHARS)
+
+
+class PatternSet:
+    """
+    A list of fnmatch patterns compiled into a form that can be matched in
+    roughly O(path length), independent of the number of patterns.
+
+    - Literal patterns go into a hash set.
+    - "*<literal>" and "<literal>*" patterns become suffix and prefix tuples
+      checked with str.endswith / str.startswith.
+    - Every other glob is merged into one combined regex.
+
+    Matching follows fnmatch.fnmatch semantics, including os.path.normcase.
+    """
+
+    __slots__ = ("literals", "prefixes", "suffixes", "regex", "match_all")
+
+    def __init__(self, patterns: Iterable[str]):
+        literals: Set[str] = set()
+        prefixes: List[str] = []
+        suffixes: List[str] = []
+        globs: List[str] = []
+        self.match_all = False
+
+        for pattern in dict.fromkeys(os.path.normcase(p) for p in patterns):
+            if is_literal(pattern):
+                literals.add(pattern)
+            elif set(pattern) == {"*"}:
+                self.match_all = True
+            elif pattern.startswith("*") and is_literal(pattern.lstrip("*")):
+                suffixes.append(pattern.lstrip("*"))
+            elif pattern.endswith("*") and is_literal(pattern.rstrip("*")):
+                prefixes.append(pattern.rstrip("*"))
+            else:
+                globs.append(pattern)
+
+        self.literals = frozenset(literals)
+        self.prefixes = tuple(prefixes)
+        self.suffixes = tuple(suffixes)
+        self.regex: Optional[Pattern[str]] = (
+            re.compile("|".join(fnmatch.translate(glob) for glob in globs))
+            if globs
+            else None
+        )
+
+    def __bool__(self) -> bool:
+        return bool(
+            self.match_all
+            or self.literals
+            or self.prefixes
+            or self.suffixes
+            or self.regex
+        )
+
+    def match(self, path: str) -> bool:
+        path = os.path.normcase(path)
+        return (
+            self.match_all
+            or path in self.literals
+            or (bool(self.suffixes) and path.endswith(self.suffixes))
+            or (bool(self.prefixes) and path.startswith(self.prefixes))
+            or (self.regex is not None and self.regex.match(path) is not None)
+        )
+
+
+class CompiledFilter:
+    """
+    Compiled include and exclude patterns of a FilterSettings.
+
+    Exclude patterns ending with "/" only apply to directories and are matched
+    against the directory path followed by "/".
+    """
+
+    def __init__(
+        self, include_patterns: Tuple[str, ...], exclude_patterns: Tuple[str, ...]
+    ):
+        dir_patterns = [p for p in exclude_patterns if p.endswith("/")]
+        file_patterns = [p for p in exclude_patterns if not p.endswith("/")]
+
+        self.include = PatternSet(include_patterns)
+        self.exclude = PatternSet(file_patterns)
+        self.exclude_dirs = PatternSet(dir_patterns)
+        # A pattern "<stem>*" whose stem matches "<dir>/" matches every path below <dir>
+        self.prune_dirs = PatternSet(
+            dir_patterns + [p[:-1] for p in file_patterns if p.endswith("*")]
+        )
+
+    def is_ignored(self, relative_path: str, is_dir: bool = False) -> bool:
+        if is_dir and self.exclude_dirs.match(relative_path + "/"):
+            return True
+        return self.exclude.match(relative_path)
+
+    def is_included(self, relative_path: str) -> bool:
+        """
+        Returns True if there are no include patterns or the path matches one.
+        """
+        return not self.include or self.include.match(relative_path)
+
+    def should_prune(self, relative_dir: str) -> bool:
+        return self.prune_dirs.match(relative_dir + "/")
+
+
+def compile_filter(
+    include_patterns: Iterable[str], exclude_patterns: Iterable[str]
+) -> CompiledFilter:
+    """
+    Returns the compiled filter for the given patterns. Filters are cached by the
+    hash of the pattern tuples, so they are only built once per FilterSettings.
+    """
+    return _compile_filter(tuple(include_patterns), tuple(exclude_patterns))
+
+
+@lru_cache(maxsize=64)
+def _compile_filter(
+    include_patterns: Tuple[str, ...], exclude_patterns: Tuple[str, ...]
+) -> CompiledFilter:
+    return CompiledFilter(include_patterns, exclude_patterns)
@@ -0,0 +1,413 @@
+import os
+import stat
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import Deque, Iterable, Iterator, List, Optional, Tuple
+
+from repo_tool.core.binary import is_binary_file
+from repo_tool.core.matcher import compile_filter
+from repo_tool.core.token_cache import TokenCache, blob_hasher
+from repo_tool.core.tokens import (
+    STREAMING_THRESHOLD,
+    BatchTokenizer,
+    SizeCheck,
+    check_size_against_limit,
+)
+
+# Number of records held back behind a file waiting to be tokenized, before the
+# pending batch is encoded even if it is below the tokenizer's size budget
+MAX_QUEUED_RECORDS = 256
+# Number of files read ahead of the consumer by iter_with_content_ahead
+READ_AHEAD_FILES = 16
+# Number of files whose cached token counts are looked up together
+PREFETCH_FILES = 500
+
+
+@dataclass
+class FilterStats:
+    """Counters collected while filtering files by their token count"""
+
+    files_checked: int = 0
+    binary_files: int = 0
+    encodes: int = 0
+    encodes_skipped: int = 0
+    tokenizer_threads: int = 0
+
+
+@dataclass
+class FileRecord:
+    """
+    The result of scanning one file of a repository.
+
+    tokens is None when the token count was not needed, and content is None
+    unless the scan was asked to keep it. original_tokens is the token count
+    before the content was transformed, and None if it was not.
+    """
+
+    path: Path
+    relative_path: str
+    size: int
+    extension: str
+    is_binary: bool = False
+    tokens: Optional[int] = None
+    blob_sha: Optional[str] = None
+    content: Optional[str] = None
+    error: Optional[str] = None
+    original_tokens: Optional[int] = None
+
+
+def file_extension(file_path: Path) -> str:
+    return file_path.suffix.lower() or "no_extension"
+
+
+def decode_text(data: bytes) -> str:
+    """
+    Decodes file content the same way as open(..., "r", errors="ignore"),
+    including the translation of \\r\\n and \\r line endings.
+    """
+    text = data.decode("utf-8", errors="ignore")
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text
+
+
+def scan_files(
+    all_files: Iterable[Path],
+    repo_path: Path,
+    ignore_patterns: List[str],
+    include_patterns: List[str],
+    max_tokens: int,
+    count_tokens: bool = False,
+    keep_content: bool = False,
+    stats: Optional[FilterStats] = None,
+    token_cache: Optional[TokenCache] = None,
+    tokenizer: Optional[BatchTokenizer] = None,
+) -> List[FileRecord]:
+    """
+    Reads every file that matches the patterns at most once and returns a record
+    for each file that is binary or below max_tokens. See iter_scan_files.
+    """
+    return list(
+        iter_scan_files(
+            all_files,
+            repo_path,
+            ignore_patterns,
+            include_patterns,
+            max_tokens,
+            count_tokens,
+            keep_content,
+            stats,
+            token_cache,
+            tokenizer,
+        )
+    )
+
+
+def iter_scan_files(
+    all_files: Iterable[Path],
+    repo_path: Path,
+    ignore_patterns: List[str],
+    include_patterns: List[str],
+    max_tokens: int,
+    count_tokens: bool = False,
+    keep_content: bool = False,
+    stats: Optional[FilterStats] = None,
+    token_cache: Optional[TokenCache] = None,
+    tokenizer: Optional[BatchTokenizer] = None,
+) -> Iterator[FileRecord]:
+    """
+    Reads every file that matches the patterns at most once and yields a record
+    for each file that is binary or below max_tokens, in the order of all_files.
+
+    The same read is used to hash the file for the token cache, to tokenize it
+    and, with keep_content, to keep its text for the digest. With count_tokens
+    every text file gets its exact token count, otherwise files are only
+    tokenized when their byte size does not already decide the max_tokens check.
+    Files larger than STREAMING_THRESHOLD whose content is not kept are counted
+    by streaming, so counting stops at the limit.
+
+    Records that need no tokenizing are yielded as soon as they are read. The
+    others are tokenized in batches, which are encoded once they reach the
+    tokenizer's size budget or MAX_QUEUED_RECORDS records are waiting behind
+    them, so the first records arrive without waiting for the whole repository.
+    """
+    if stats is None:
+        stats = FilterStats()
+    if token_cache is None:
+        token_cache = TokenCache()
+    if tokenizer is None:
+        tokenizer = BatchTokenizer()
+    stats.tokenizer_threads = tokenizer.num_threads
+    matcher = compile_filter(include_patterns, ignore_patterns)
+    # Records waiting for a token count, with their text if it is in memory and
+    # whether their blob SHA was computed while reading them
+    pending: List[Tuple[FileRecord, Optional[str], bool]] = []
+    pending_size = 0
+    # Records in file order since the first pending one, kept to preserve order
+    queue: List[FileRecord] = []
+
+    def count_pending() -> None:
+        # The cached counts of the files hashed while they were read are looked
+        # up together
+        token_cache.prefetch(
+            record.blob_sha
+            for record, _, hashed in pending
+            if hashed and record.blob_sha
+        )
+        uncounted: List[Tuple[FileRecord, Optional[str]]] = []
+        for record, text, hashed in pending:
+            if hashed and record.blob_sha:
+                record.tokens = token_cache.get(record.blob_sha)
+            if record.tokens is None:
+                uncounted.append((record, text))
+            else:
+                stats.encodes_skipped += 1
+        stats.encodes += len(uncounted)
+        in_memory: List[FileRecord] = []
+        texts: List[str] = []
+        streamed: List[FileRecord] = []
+        for record, text in uncounted:
+            if text is None:
+                streamed.append(record)
+            else:
+                in_memory.append(record)
+                texts.append(text)
+        for record, tokens in zip(in_memory, tokenizer.count_tokens(texts)):
+            record.tokens = tokens
+        counts = tokenizer.count_file_tokens(
+            [record.path for record in streamed], limit=max_tokens
+        )
+        for record, tokens in zip(streamed, counts):
+            record.tokens = tokens
+        for record, _ in uncounted:
+            # Counts that stopped at the limit are not exact, so they are not cached
+            if record.blob_sha and record.tokens is not None:
+                if record.tokens < max_tokens:
+                    token_cache.put(record.blob_sha, record.tokens)
+        pending.clear()
+        token_cache.flush()
+
+    def is_below_limit(record: FileRecord) -> bool:
+        return record.tokens is None or record.tokens < max_tokens
+
+    def iter_candidates() -> Iterator[Tuple[Path, str, os.stat_result]]:
+        for file_path in all_files:
+            relative_path = file_path.relative_to(repo_path).as_posix()
+
+            if matcher.is_ignored(relative_path):
+                continue
+
+            # If include patterns are provided, skip files that do not match
+            if not matcher.is_included(relative_path):
+                continue
+
+            try:
+                file_stat = file_path.stat()
+            except FileNotFoundError:
+                # Tracked files can be missing from the working tree
+                continue
+            if stat.S_ISDIR(file_stat.st_mode):
+                continue
+            yield file_path, relative_path, file_stat
+
+    for file_path, relative_path, file_stat in iter_prefetched(
+        iter_candidates(), token_cache
+    ):
+        stats.files_checked += 1
+        record = FileRecord(
+            path=file_path,
+            relative_path=relative_path,
+            size=file_stat.st_size,
+            extension=file_extension(file_path),
+        )
+        text = None
+        needs_count = False
+        if is_binary_file(file_path, file_stat):
+            stats.binary_files += 1
+            record.is_binary = True
+        else:
+            size_check = check_size_against_limit(file_stat.st_size, max_tokens)
+            if size_check is SizeCheck.OVER:
+                stats.encodes_skipped += 1
+                continue
+            needs_tokens = count_tokens or size_check is SizeCheck.UNKNOWN
+            record.blob_sha = token_cache.known_blob_sha(file_path, file_stat)
+            if needs_tokens and record.blob_sha:
+                # Read from memory, since the counts of the window were prefetched
+                record.tokens = token_cache.get(record.blob_sha)
+            hashed = record.blob_sha is None
+            text = read_text_file(
+                record, file_stat, needs_tokens, keep_content, token_cache
+            )
+            needs_count = (
+                needs_tokens and record.tokens is None and record.error is None
+            )
+            if not needs_count:
+                stats.encodes_skipped += 1
+
+        if needs_count:
+            pending.append((record, text, hashed))
+            pending_size += len(text) if text is not None else 0
+
+        if not pending:
+            if is_below_limit(record):
+                yield record
+            continue
+
+        queue.append(record)
+        if (
+            pending_size >= tokenizer.batch_size_budget
+            or len(queue) >= MAX_QUEUED_RECORDS
+        ):
+            count_pending()
+            pending_size = 0
+            yield from filter(is_below_limit, queue)
+            queue.clear()
+
+    if pending:
+        count_pending()
+    yield from filter(is_below_limit, queue)
+    token_cache.flush()
+
+
+def iter_prefetched(
+    candidates: Iterable[Tuple[Path, str, os.stat_result]], token_cache: TokenCache
+) -> Iterator[Tuple[Path, str, os.stat_result]]:
+    """
+    Yields the candidate files in windows of PREFETCH_FILES, after looking up the
+    cached token counts of the files of each window whose blob SHA is known
+    from the git index, with one lookup for the whole window
+    """
+    window: List[Tuple[Path, str, os.stat_result]] = []
+
+    def prefetch() -> None:
+        known = (token_cache.known_blob_sha(path, st) for path, _, st in window)
+        token_cache.prefetch(sha for sha in known if sha is not None)
+
+    for candidate in candidates:
+        window.append(candidate)
+        if len(window) >= PREFETCH_FILES:
+            prefetch()
+            yield from window
+            window = []
+    prefetch()
+    yield from window
+
+
+def read_text_file(
+    record: FileRecord,
+    file_stat: os.stat_result,
+    needs_tokens: bool,
+    keep_content: bool,
+    token_cache: TokenCache,
+) -> Optional[str]:
+    """
+    Fills in the blob SHA, unless it is known from the git index, and with
+    keep_content the content of a text file's record. The file is read at most
+    once, and only if its content is kept or its token count is not cached.
+    Returns the text if it was read.
+
+    The cached token count of a blob SHA computed here is not looked up, so the
+    counts of many files can be looked up together before they are counted.
+    """
+    reads_content = keep_content or (
+        needs_tokens
+        and record.tokens is None
+        and file_stat.st_size <= STREAMING_THRESHOLD
+    )
+    if reads_content:
+        try:
+            data = record.path.read_bytes()
+        except OSError as e:
+            record.error = str(e)
+            return None
+        if record.blob_sha is None:
+            hasher = blob_hasher(len(data))
+            hasher.update(data)
+            record.blob_sha = hasher.hexdigest()
+        text = decode_text(data)
+        if keep_content:
+            record.content = text
+        return text
+
+    if needs_tokens and record.blob_sha is None:
+        record.blob_sha = token_cache.blob_sha(record.path, file_stat)
+    return None
+
+
+def read_records(repo_path: Path, file_paths: List[Path]) -> List[FileRecord]:
+    """
+    Builds records with content for a list of already filtered files, for callers
+    that only have paths. Binary files are marked and not read.
+    """
+    records = []
+    for file_path in file_paths:
+        try:
+            file_stat = file_path.stat()
+        except OSError:
+            continue
+        if not stat.S_ISREG(file_stat.st_mode):
+            continue
+        record = FileRecord(
+            path=file_path,
+            relative_path=file_path.relative_to(repo_path).as_posix(),
+            size=file_stat.st_size,
+            extension=file_extension(file_path),
+            is_binary=is_binary_file(file_path, file_stat),
+        )
+        if not record.is_binary:
+            try:
+                record.content = decode_text(file_path.read_bytes())
+            except OSError as e:
+                record.error = str(e)
+        records.append(record)
+    return records
+
+
+def with_content(record: FileRecord) -> FileRecord:
+    """
+    Returns a copy of the record with the content of its file, or with the read
+    error. Binary records and records that hold their content are returned as is.
+    """
+    if record.is_binary or record.content is not None:
+        return record
+    try:
+        content = decode_text(record.path.read_bytes())
+    except OSError as e:
+        return replace(record, error=str(e))
+    return replace(record, content=content)
+
+
+def iter_with_content(records: Iterable[FileRecord]) -> Iterator[FileRecord]:
+    """
+    Yields a copy of each record with the content of its file, reading the files
+    one at a time. Binary records are passed through unchanged.
+    """
+    for record in records:
+        yield with_content(record)
+
+
+def iter_with_content_ahead(
+    records: Iterable[FileRecord], read_ahead: int = READ_AHEAD_FILES
+) -> Iterator[FileRecord]:
+    """
+    Same as iter_with_content, but reads up to read_ahead files in a thread pool
+    while the earlier ones are consumed. Records are yielded in order, and at
+    most read_ahead contents are held at a time.
+    """
+    max_workers = min(read_ahead, (os.cpu_count() or 1) * 4)
+    pending: Deque["Future[FileRecord]"] = deque()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        try:
+            for record in records:
+                pending.append(executor.submit(with_content, record))
+                if len(pending) >= read_ahead:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            # Reads that have not started are dropped if the consumer stops early
+            for future in pending:
+                future.cancel()
@@ -0,0 +1,351 @@
+import math
+import zipfile
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from repo_tool.core.contants import DIGEST_DIR
+from repo_tool.core.digest import PREAMBLE, collect_stats, iter_digest, print_report
+from repo_tool.core.filter import get_filter_settings_from_env, iter_scan_repository
+from repo_tool.core.github import Repository
+from repo_tool.core.scan import FileRecord, FilterStats, iter_with_content, read_records
+from repo_tool.core.summary import StatsAggregator
+from repo_tool.core.tokens import BatchTokenizer, encoding
+from repo_tool.core.transforms import iter_transformed, normalize_transforms
+
+INDEX_NAME = "index.txt"
+# Upper bound of the part numbers used to bound the size of headers
+MAX_PARTS = 99999
+
+
+@dataclass
+class DigestSection:
+    """A file of a digest part, or one piece of a file larger than the budget"""
+
+    record: FileRecord
+    piece: int = 1
+    pieces: int = 1
+
+    @property
+    def label(self) -> str:
+        if self.pieces == 1:
+            return self.record.relative_path
+        return f"{self.record.relative_path} (piece {self.piece} of {self.pieces})"
+
+
+@dataclass
+class DigestPart:
+    """The sections of one digest part and the tokens of their content"""
+
+    sections: List[DigestSection] = field(default_factory=list)
+    tokens: int = 0
+
+
+def part_preamble(number: int, total: int) -> str:
+    return (
+        PREAMBLE
+        + f"This is part {number} of {total}. The index lists the files in each part.\n\n"
+    )
+
+
+def part_end_marker(number: int, total: int) -> str:
+    if number == total:
+        return "--END--"
+    return f"--END OF PART {number} OF {total}--"
+
+
+def max_tokens_of(text: str) -> int:
+    # Every token covers at least one byte, so the byte length bounds the count
+    # without tokenizing
+    return len(text.encode())
+
+
+def section_overhead(label: str) -> int:
+    return max_tokens_of(f"----\n{label}\n\n")
+
+
+PART_OVERHEAD = max_tokens_of(
+    part_preamble(MAX_PARTS, MAX_PARTS) + part_end_marker(MAX_PARTS - 1, MAX_PARTS)
+)
+
+
+def plan_digest_parts(
+    records: Iterable[FileRecord], token_budget: int
+) -> List[DigestPart]:
+    """
+    Packs the text records into parts of at most token_budget tokens each,
+    keeping the order of the files.
+
+    Only the token counts of the records are used, and the headers are counted
+    by their byte length, which bounds their token count. A file is only split
+    if it does not fit in a part on its own; its pieces then get parts of their
+    own, with the same number of tokens each, see split_content.
+    """
+    available = token_budget - PART_OVERHEAD
+    if available <= 0:
+        raise ValueError(f"Token budget must be larger than {PART_OVERHEAD}")
+
+    parts: List[DigestPart] = []
+    current = DigestPart()
+    used = 0
+    for record in records:
+        if record.is_binary:
+            continue
+        if record.tokens is None:
+            raise ValueError(f"No token count for {record.relative_path}")
+
+        size = record.tokens + section_overhead(record.relative_path)
+        if size <= available:
+            if used + size > available:
+                parts.append(current)
+                current = DigestPart()
+                used = 0
+            current.sections.append(DigestSection(record))
+            current.tokens += record.tokens
+            used += size
+            continue
+
+        # The file alone is over the budget
+        piece_label = DigestSection(record, MAX_PARTS, MAX_PARTS).label
+        per_piece = available - section_overhead(piece_label)
+        if per_piece <= 0:
+            raise ValueError(f"Token budget is too small for {record.relative_path}")
+        if current.sections:
+            parts.append(current)
+            current = DigestPart()
+            used = 0
+        pieces = math.ceil(record.tokens / per_piece)
+        for piece in range(1, pieces + 1):
+            section = DigestSection(record, piece, pieces)
+            parts.append(DigestPart([section], math.ceil(record.tokens / pieces)))
+
+    if current.sections:
+        parts.append(current)
+    return parts
+
+
+def split_content(content: str, pieces: int) -> List[str]:
+    """
+    Splits content into the given number of pieces, each holding at most
+    ceil(tokens / pieces) of the tokens counted for the whole content.
+
+    The content is encoded once and cut between tokens, at the characters the
+    tokens start in. Only the tokens right at a cut can be encoded differently
+    when a piece is encoded alone, which the byte length of the headers leaves
+    room for in a part.
+    """
+    tokens = encoding.encode_ordinary(content)
+    per_piece = max(1, math.ceil(len(tokens) / pieces))
+    # The character index each token starts at
+    _, offsets = encoding.decode_with_offsets(tokens)
+    cuts = [0] + [offsets[i] for i in range(per_piece, len(tokens), per_piece)]
+    cuts.append(len(content))
+    result = [content[start:end] for start, end in zip(cuts, cuts[1:])]
+    return result + [""] * (pieces - len(result))
+
+
+def iter_transformed_counts(
+    records: Iterable[FileRecord], transforms: Optional[List[str]] = None
+) -> Iterator[FileRecord]:
+    """
+    Yields the records with the token counts of their transformed content, so
+    the parts can be planned for it. The content is not kept, since the parts
+    read and transform the files again. The records are passed through when no
+    transform is enabled.
+    """
+    if not normalize_transforms(transforms or []):
+        yield from records
+        return
+    for record in iter_transformed(iter_with_content(records), transforms):
+        yield replace(record, content=None)
+
+
+def iter_part_records(
+    part: DigestPart,
+    transforms: Optional[List[str]] = None,
+    split_files: Optional[Dict[str, Tuple[FileRecord, List[Optional[str]]]]] = None,
+) -> Iterator[FileRecord]:
+    """
+    Yields the records of a part with their content, reading one file at a time.
+
+    A file split into pieces is read, transformed and split at its first piece
+    and kept in split_files until its last one, so the parts of the other
+    pieces take their slice without encoding the file again.
+    """
+    if split_files is None:
+        split_files = {}
+    whole_records = iter_transformed(
+        iter_with_content(
+            section.record for section in part.sections if section.pieces == 1
+        ),
+        transforms,
+    )
+    for section in part.sections:
+        if section.pieces == 1:
+            yield next(whole_records)
+            continue
+
+        path = section.record.relative_path
+        if path not in split_files:
+            record = next(
+                iter_transformed(iter_with_content([section.record]), transforms)
+            )
+            pieces: List[Optional[str]] = [None] * section.pieces
+            if record.content is not None:
+                pieces = list(split_content(record.content, section.pieces))
+            split_files[path] = (record, pieces)
+        record, pieces = split_files[path]
+        if section.piece == section.pieces:
+            del split_files[path]
+        yield replace(
+            record, relative_path=section.label, content=pieces[section.piece - 1]
+        )
+
+
+def part_name(number: int, total: int) -> str:
+    return f"part-{number:0{max(3, len(str(total)))}d}.txt"
+
+
+def iter_digest_index(parts: List[DigestPart], token_budget: int) -> Iterator[str]:
+    total = len(parts)
+    yield (
+        f"This digest is split into {total} parts of at most {token_budget} tokens.\n"
+        "The files in each part are listed below.\n\n"
+    )
+    for number, part in enumerate(parts, start=1):
+        yield f"{part_name(number, total)} ({part.tokens} tokens)\n"
+        for section in part.sections:
+            yield f"  {section.label}\n"
+        yield "\n"
+
+
+def iter_split_digest(
+    parts: List[DigestPart],
+    token_budget: int,
+    transforms: Optional[List[str]] = None,
+) -> Iterator[Tuple[str, Iterator[str]]]:
+    """
+    Yields the name and the content of the index and of every part. The parts
+    must be planned with the same transforms, see iter_transformed_counts.
+    """
+    total = len(parts)
+    # The pieces of a split file are in consecutive parts, which are written in
+    # order, so the file is split once for all of them
+    split_files: Dict[str, Tuple[FileRecord, List[Optional[str]]]] = {}
+    yield INDEX_NAME, iter_digest_index(parts, token_budget)
+    for number, part in enumerate(parts, start=1):
+        yield part_name(number, total), iter_digest(
+            iter_part_records(part, transforms, split_files),
+            preamble=part_preamble(number, total),
+            end_marker=part_end_marker(number, total),
+        )
+
+
+class _ChunkBuffer:
+    """Write-only file object that collects the bytes written by ZipFile"""
+
+    def __init__(self) -> None:
+        self.chunks: List[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def iter_zip(files: Iterable[Tuple[str, Iterable[str]]]) -> Iterator[bytes]:
+    """Yields a zip archive of the files while their content is generated"""
+    buffer = _ChunkBuffer()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, chunks in files:
+            with archive.open(name, "w") as entry:
+                for chunk in chunks:
+                    entry.write(chunk.encode())
+                    if buffer.chunks:
+                        yield buffer.take()
+    yield buffer.take()
+
+
+def generate_digest_parts(
+    repo_path: Path,
+    filtered_files: List[Path],
+    token_budget: int,
+    transforms: Optional[List[str]] = None,
+) -> Dict[str, str]:
+    """
+    Generates the index and the parts of a digest split by token_budget from the
+    filtered files in the repository, keyed by file name.
+    """
+    records = read_records(repo_path, filtered_files)
+    text_records = [r for r in records if not r.is_binary and r.content is not None]
+    counts = BatchTokenizer().count_tokens([r.content or "" for r in text_records])
+    for record, tokens in zip(text_records, counts):
+        record.tokens = tokens
+    parts = plan_digest_parts(
+        iter_transformed_counts(text_records, transforms), token_budget
+    )
+    return {
+        name: "".join(chunks)
+        for name, chunks in iter_split_digest(parts, token_budget, transforms)
+    }
+
+
+def generate_split_digest(
+    repo_info: Repository,
+    token_budget: int,
+    prompt: Optional[str] = None,
+    transforms: Optional[List[str]] = None,
+) -> None:
+    """
+    Writes the digest of a repository split by token_budget to
+    digests/<name>/, replacing the parts of a previous run.
+    """
+    try:
+        stats = FilterStats()
+        aggregator = StatsAggregator()
+        filter_settings = get_filter_settings_from_env()
+        if transforms is not None:
+            filter_settings.transforms = transforms
+        transforms = filter_settings.transforms
+        records = list(
+            collect_stats(
+                iter_transformed_counts(
+                    iter_scan_repository(
+                        repo_info.path,
+                        prompt,
+                        filter_settings=filter_settings,
+                        stats=stats,
+                        count_tokens=True,
+                    ),
+                    transforms,
+                ),
+                aggregator,
+            )
+        )
+        print("Generating summary and digest...")
+        parts = plan_digest_parts(records, token_budget)
+
+        output_dir = Path(DIGEST_DIR) / repo_info.name
+        output_dir.mkdir(parents=True, exist_ok=True)
+        for old_file in output_dir.glob("*.txt"):
+            old_file.unlink()
+        if parts:
+            for name, chunks in iter_split_digest(parts, token_budget, transforms):
+                with open(output_dir / name, "w", encoding="utf-8") as output:
+                    output.writelines(chunks)
+            print(f"Split the digest into {len(parts)} parts.")
+        else:
+            print("No matching files found.")
+        print_report(repo_info, stats, aggregator, len(records))
+    except Exception as e:
+        print("Error:", e)
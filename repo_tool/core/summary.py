@@ -1,25 +1,48 @@
 import asyncio
+import heapq
 import json
 import os
-from dataclasses import dataclass, field
+import struct
+import sys
+import zlib
+from array import array
+from dataclasses import dataclass, field, replace
+from enum import Enum
 from pathlib import Path
-from typing import Any, Dict, List, Optional, TypeVar
+from typing import (
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+    Union,
+    overload,
+)
 
 import aiofiles
-import tiktoken
 from jinja2 import Environment, FileSystemLoader
 
+from repo_tool.core.binary import is_binary_file
 from repo_tool.core.contants import DIGEST_DIR
 from repo_tool.core.github import Repository
+from repo_tool.core.scan import FileRecord, decode_text, file_extension
+from repo_tool.core.token_cache import TokenCache, blob_hasher
+from repo_tool.core.tokens import BatchTokenizer
 
 # 型変数の定義
 T = TypeVar("T")
 
 data_size = 20
+# サマリーに含める、トークン数の多いファイルの数
+TOP_FILES = 20
 precision = 2
 BATCH_SIZE = 100
 MAX_FILE_SIZE = 5000
-encoding = tiktoken.get_encoding("o200k_base")
+# 列形式の file_data の先頭に付ける識別子
+FILE_DATA_MAGIC = b"FDC1"
 
 
 @dataclass
@@ -28,6 +51,7 @@ class FileInfo:
 
     file_path: Path
     repo_path: Path
+    blob_sha: Optional[str] = None
 
 
 @dataclass
@@ -43,6 +67,238 @@ class FileData:
     path: str
     extension: str
     tokens: int
+    # 変換前のトークン数 (変換が無効の場合は None)
+    original_tokens: Optional[int] = None
+
+
+_HAS_NAMES = 1
+_HAS_ORIGINAL_TOKENS = 2
+# original_tokens が None であることを表す値
+_NO_TOKENS = -1
+_json_string = json.JSONEncoder(ensure_ascii=False).encode
+
+
+def _little_endian(values: "array[int]") -> bytes:
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_little_endian(typecode: str, data: bytes) -> "array[int]":
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+class FileDataColumns(Sequence[FileData]):
+    """
+    file_data を列ごとに保持する読み取り専用のシーケンス
+    パス、拡張子の辞書と各ファイルのコード、トークン数の配列だけを持ち、
+    FileData は要素にアクセスしたときに初めて作られる
+    """
+
+    __slots__ = (
+        "_path_blob",
+        "_paths",
+        "_names",
+        "_extensions",
+        "_codes",
+        "_tokens",
+        "_original_tokens",
+    )
+
+    def __init__(
+        self,
+        paths: Union[List[str], bytes],
+        extensions: List[str],
+        codes: "array[int]",
+        tokens: "array[int]",
+        original_tokens: "Optional[array[int]]" = None,
+        names: Optional[List[str]] = None,
+    ):
+        # パスは NUL 区切りのバイト列のまま受け取り、最初に使うときに分割する
+        self._path_blob = paths if isinstance(paths, bytes) else None
+        self._paths = None if isinstance(paths, bytes) else paths
+        # ファイル名はパスの末尾と異なる場合だけ持つ
+        self._names = names
+        self._extensions = extensions
+        self._codes = codes
+        self._tokens = tokens
+        self._original_tokens = original_tokens
+
+    @classmethod
+    def from_file_data(cls, file_data: Iterable[FileData]) -> "FileDataColumns":
+        paths: List[str] = []
+        names: List[str] = []
+        extension_codes: Dict[str, int] = {}
+        codes = array("I")
+        tokens = array("q")
+        original_tokens = array("q")
+        derived_names = True
+        has_original_tokens = False
+        for item in file_data:
+            paths.append(item.path)
+            names.append(item.name)
+            derived_names = derived_names and item.path.rpartition("/")[2] == item.name
+            codes.append(
+                extension_codes.setdefault(item.extension, len(extension_codes))
+            )
+            tokens.append(item.tokens)
+            if item.original_tokens is None:
+                original_tokens.append(_NO_TOKENS)
+            else:
+                original_tokens.append(item.original_tokens)
+                has_original_tokens = True
+        return cls(
+            paths,
+            list(extension_codes),
+            codes,
+            tokens,
+            original_tokens if has_original_tokens else None,
+            None if derived_names else names,
+        )
+
+    @property
+    def paths(self) -> List[str]:
+        if self._paths is None:
+            blob = self._path_blob or b""
+            self._paths = blob.decode("utf-8").split("\0") if self._tokens else []
+            self._path_blob = None
+        return self._paths
+
+    def _name(self, index: int) -> str:
+        if self._names is not None:
+            return self._names[index]
+        return self.paths[index].rpartition("/")[2]
+
+    def _original(self, index: int) -> Optional[int]:
+        if self._original_tokens is None or self._original_tokens[index] < 0:
+            return None
+        return self._original_tokens[index]
+
+    def __len__(self) -> int:
+        return len(self._tokens)
+
+    @overload
+    def __getitem__(self, index: int) -> FileData: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> List[FileData]: ...
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[FileData, List[FileData]]:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("file data index out of range")
+        return FileData(
+            name=self._name(index),
+            path=self.paths[index],
+            extension=self._extensions[self._codes[index]],
+            tokens=self._tokens[index],
+            original_tokens=self._original(index),
+        )
+
+    def __iter__(self) -> Iterator[FileData]:
+        for index in range(len(self)):
+            yield self[index]
+
+    def to_json(self) -> str:
+        """
+        FileData を作らずに、FileData のリストと同じ JSON を書き出す
+        """
+        extensions = [_json_string(extension) for extension in self._extensions]
+        rows = []
+        for index, path in enumerate(self.paths):
+            original = self._original(index)
+            rows.append(
+                f'{{"name": {_json_string(self._name(index))}, '
+                f'"path": {_json_string(path)}, '
+                f'"extension": {extensions[self._codes[index]]}, '
+                f'"tokens": {self._tokens[index]}, '
+                f'"original_tokens": {"null" if original is None else original}}}'
+            )
+        return "[" + ", ".join(rows) + "]"
+
+    def to_bytes(self) -> bytes:
+        """
+        各列を長さ付きで並べ、zlib で圧縮したバイト列を返す
+        """
+        flags = 0
+        sections = [
+            "\0".join(self.paths).encode("utf-8"),
+            b"",
+            "\0".join(self._extensions).encode("utf-8"),
+            _little_endian(self._codes),
+            _little_endian(self._tokens),
+            b"",
+        ]
+        if self._names is not None:
+            flags |= _HAS_NAMES
+            sections[1] = "\0".join(self._names).encode("utf-8")
+        if self._original_tokens is not None:
+            flags |= _HAS_ORIGINAL_TOKENS
+            sections[5] = _little_endian(self._original_tokens)
+        body = [struct.pack("<II", len(self), flags)]
+        for section in sections:
+            body.append(struct.pack("<Q", len(section)))
+            body.append(section)
+        return FILE_DATA_MAGIC + zlib.compress(b"".join(body))
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "FileDataColumns":
+        if not data.startswith(FILE_DATA_MAGIC):
+            raise ValueError("Not a file data blob")
+        body = memoryview(zlib.decompress(data[len(FILE_DATA_MAGIC) :]))
+        count, flags = struct.unpack_from("<II", body)
+        offset = struct.calcsize("<II")
+        sections: List[bytes] = []
+        for _ in range(6):
+            (length,) = struct.unpack_from("<Q", body, offset)
+            offset += 8
+            sections.append(bytes(body[offset : offset + length]))
+            offset += length
+        paths, names, extensions, codes, tokens, original_tokens = sections
+        columns = cls(
+            paths,
+            extensions.decode("utf-8").split("\0") if extensions else [],
+            _from_little_endian("I", codes),
+            _from_little_endian("q", tokens),
+            (
+                _from_little_endian("q", original_tokens)
+                if flags & _HAS_ORIGINAL_TOKENS
+                else None
+            ),
+            names.decode("utf-8").split("\0") if flags & _HAS_NAMES else None,
+        )
+        if len(columns) != count:
+            raise ValueError("File data blob is truncated")
+        return columns
+
+
+class FileSortKey(str, Enum):
+    """ファイル一覧の並べ替えに使える列"""
+
+    TOKENS = "tokens"
+    PATH = "path"
+    NAME = "name"
+
+
+class SortOrder(str, Enum):
+    ASC = "asc"
+    DESC = "desc"
+
+
+def top_files(file_data: Iterable[FileData], count: int = TOP_FILES) -> List[FileData]:
+    """
+    トークン数の多い順に上位 count 件を返す
+    全体をソートせず、ヒープで count 件だけを保持して選ぶ
+    """
+    return heapq.nlargest(count, file_data, key=lambda item: item.tokens)
 
 
 @dataclass
@@ -54,7 +310,13 @@ class FileStats:
     min_size: float
     context_length: int
     extension_tokens: List[FileType] = field(default_factory=list)
+    # 全ファイルのデータ (順序は集計した順)
+    # 保存済みのフィルター結果から作る場合はトークン数の多い上位 TOP_FILES 件のみ
     file_data: List[FileData] = field(default_factory=list)
+    # 各ファイルのサイズ (バイト単位、file_data と同じ順序)
+    # 保存済みのフィルター結果から作る場合は空
+    file_sizes: List[int] = field(default_factory=list)
+    original_context_length: Optional[int] = None
 
 
 @dataclass
@@ -68,10 +330,20 @@ class Summary:
     min_file_size_kb: float
     file_types: List[FileType]
     context_length: int
-    file_data: List[FileData]
+    # トークン数の多い上位 TOP_FILES 件。全ファイルは /files で取得する
+    # キャッシュから読み込んだ場合は列形式の FileDataColumns
+    file_data: Sequence[FileData]
+    # 変換前の合計トークン数 (変換が無効の場合は None)
+    original_context_length: Optional[int] = None
 
     def to_json(self) -> str:
-        return json.dumps(self, default=lambda o: o.__dict__, ensure_ascii=False)
+        if not isinstance(self.file_data, FileDataColumns):
+            return json.dumps(self, default=lambda o: o.__dict__, ensure_ascii=False)
+        # 列形式の file_data は FileData を作らずに書き出す
+        head = replace(self, file_data=[]).to_json()
+        return head.replace(
+            '"file_data": []', f'"file_data": {self.file_data.to_json()}', 1
+        )
 
     @classmethod
     def from_json(cls, json_str: str) -> "Summary":
@@ -81,9 +353,12 @@ class Summary:
         data["file_data"] = [FileData(**fd) for fd in data["file_data"]]
         return cls(**data)
 
-    def generate_report(self, data_size: int = 20) -> None:
+    def generate_report(
+        self, data_size: int = 20, all_files: Optional[Iterable[FileData]] = None
+    ) -> None:
         """
         HTMLレポートを生成して保存する
+        all_files を指定するとファイル一覧に全ファイルを載せる
         """
         # Jinja2 環境を設定
         env = Environment(loader=FileSystemLoader("templates"))
@@ -103,7 +378,11 @@ class Summary:
             file_sizes_labels=[item.name for item in self.file_data[:data_size]],
             file_sizes_data=[item.tokens for item in self.file_data[:data_size]],
             file_sizes_paths=[item.path for item in self.file_data[:data_size]],
-            all_files=self.file_data,
+            all_files=sorted(
+                self.file_data if all_files is None else all_files,
+                key=lambda x: x.tokens,
+                reverse=True,
+            ),
         )
 
         # HTMLレポートを保存
@@ -124,6 +403,8 @@ def format_number(value: int | float | str) -> str:
 def generate_summary(
     repo_info: Repository,
     file_list: List[Path],
+    token_cache: Optional[TokenCache] = None,
+    tokenizer: Optional[BatchTokenizer] = None,
 ) -> Summary:
     """
     ファイル統計のサマリーレポートを生成する
@@ -131,15 +412,30 @@ def generate_summary(
     Args:
         repo_path: リポジトリのパス
         file_list: 処理対象のファイルリスト
-        enable_profiling: プロファイリングを有効にするかどうか (デフォルト: False)
+        token_cache: トークン数のキャッシュ (デフォルト: メモリのみ)
+        tokenizer: バッチトークナイザー (デフォルト: 全コアを使用)
+    """
+    file_infos = [FileInfo(Path(f), repo_info.path) for f in file_list]
+    file_stats = asyncio.run(process_files(file_infos, token_cache, tokenizer))
+    return build_summary(repo_info, file_stats)
+
+
+def summarize_records(repo_info: Repository, records: Iterable[FileRecord]) -> Summary:
+    """
+    スキャン済みのファイルレコードからサマリーを生成する
+
+    レコードには iter_scan_repository(count_tokens=True) で数えたトークン数が
+    入っているため、ファイルを読み直す必要はない。レコードはジェネレーター
+    でもよく、届いた順に集計する
     """
+    return build_summary(repo_info, aggregate_records(records))
+
+
+def build_summary(repo_info: Repository, file_stats: FileStats) -> Summary:
     if not os.path.exists(DIGEST_DIR):
         os.makedirs(DIGEST_DIR, exist_ok=True)
 
-    file_infos = [FileInfo(Path(f), repo_info.path) for f in file_list]
-    file_stats = asyncio.run(process_files(file_infos))
-
-    summary = Summary(
+    return Summary(
         author=repo_info.author,
         repository=repo_info.name,
         total_files=file_stats.file_count,
@@ -149,112 +445,212 @@ def generate_summary(
         min_file_size_kb=round(file_stats.min_size, precision),
         file_types=file_stats.extension_tokens,
         context_length=file_stats.context_length,
-        file_data=file_stats.file_data,
+        file_data=top_files(file_stats.file_data),
+        original_context_length=file_stats.original_context_length,
     )
-    return summary
 
 
-async def process_files(file_infos: List[FileInfo]) -> FileStats:
+class StatsAggregator:
+    """
+    ファイルレコードを1件ずつ受け取って集計する
+
+    バイナリファイルと読み込めなかったファイルは集計から除外する
+    """
+
+    def __init__(self) -> None:
+        self.extension_data: Dict[str, Dict[str, int]] = {}
+        self.total_size = 0.0
+        self.max_size = 0.0
+        self.min_size: Optional[float] = None
+        self.context_length = 0
+        self.original_context_length: Optional[int] = None
+        self.file_data_list: List[FileData] = []
+        self.file_sizes: List[int] = []
+
+    def add(self, record: FileRecord) -> None:
+        if record.is_binary or record.error is not None:
+            return
+
+        file_size = record.size / 1024  # bytes to KB
+        tokens = record.tokens or 0
+        self.total_size += file_size
+        self.context_length += tokens
+        if record.original_tokens is not None:
+            # 変換されたファイルは変換前のトークン数も集計する
+            self.original_context_length = (
+                self.original_context_length or 0
+            ) + record.original_tokens
+        self.max_size = max(self.max_size, file_size)
+        self.min_size = (
+            file_size if self.min_size is None else min(self.min_size, file_size)
+        )
+
+        self.file_sizes.append(record.size)
+        self.file_data_list.append(
+            FileData(
+                name=record.path.name,
+                path=record.relative_path,
+                extension=record.extension,
+                tokens=tokens,
+                original_tokens=record.original_tokens,
+            )
+        )
+
+        ext = record.extension
+        if ext not in self.extension_data:
+            self.extension_data[ext] = {"count": 0, "tokens": 0}
+        self.extension_data[ext]["count"] += 1
+        self.extension_data[ext]["tokens"] += tokens
+
+    def file_stats(self) -> FileStats:
+        # 上位のファイルは top_files で選ぶため、全体はソートしない
+        file_data_list = self.file_data_list
+
+        extension_tokens = [
+            FileType(extension=ext, count=data["count"], tokens=data["tokens"])
+            for ext, data in self.extension_data.items()
+        ]
+
+        file_count = len(file_data_list)
+        return FileStats(
+            file_count=file_count,
+            total_size=self.total_size,
+            average_size=self.total_size / file_count if file_count > 0 else 0,
+            max_size=self.max_size,
+            min_size=self.min_size or 0,
+            extension_tokens=extension_tokens,
+            context_length=self.context_length,
+            file_data=file_data_list,
+            file_sizes=self.file_sizes,
+            original_context_length=self.original_context_length,
+        )
+
+
+def aggregate_records(records: Iterable[FileRecord]) -> FileStats:
+    """
+    ファイルレコードを集計する
+    """
+    aggregator = StatsAggregator()
+    for record in records:
+        aggregator.add(record)
+    return aggregator.file_stats()
+
+
+async def process_files(
+    file_infos: List[FileInfo],
+    token_cache: Optional[TokenCache] = None,
+    tokenizer: Optional[BatchTokenizer] = None,
+) -> FileStats:
     """
     全ファイルの非同期処理と集計を行う
+
+    stat と blob SHA の計算はスレッドで行い、キャッシュにないファイルは
+    バッチごとに BatchTokenizer でまとめてトークン化する
+
+    Args:
+        file_infos: 処理対象のファイル
+        token_cache: トークン数のキャッシュ (デフォルト: メモリのみ)
+        tokenizer: バッチトークナイザー (デフォルト: 全コアを使用)
     """
-    # バッチサイズを設定
-    BATCH_SIZE = 100
+    if token_cache is None:
+        token_cache = TokenCache()
+    if tokenizer is None:
+        tokenizer = BatchTokenizer()
 
-    extension_data: Dict[str, Dict[str, int]] = {}
-    total_size = 0
-    file_sizes = []
-    context_length = 0
-    processed_files = []
-    file_data_list = []
+    records: List[FileRecord] = []
 
-    # バッチ処理を実装
     for i in range(0, len(file_infos), BATCH_SIZE):
         batch = file_infos[i : i + BATCH_SIZE]
-        tasks = [process_single_file(file_info) for file_info in batch]
-        results = await asyncio.gather(*tasks)
+        results = [
+            result
+            for result in await asyncio.gather(
+                *[
+                    asyncio.to_thread(stat_single_file, file_info, token_cache)
+                    for file_info in batch
+                ]
+            )
+            if result is not None
+        ]
 
-        for result in results:
-            if result is None:
+        # キャッシュ済みのトークン数をまとめて取得する
+        token_cache.prefetch(
+            record.blob_sha for record, _ in results if record.blob_sha
+        )
+        pending: List[FileRecord] = []
+        for record, data in results:
+            if record.tokens is None and record.blob_sha:
+                record.tokens = token_cache.get(record.blob_sha)
+            if record.tokens is not None:
                 continue
-
-            processed_files.append(result["path"])
-            total_size += result["size"]
-            context_length += result["tokens"]
-            file_sizes.append(result["size"])
-
-            file_data_list.append(
-                FileData(
-                    name=Path(result["path"]).name,
-                    path=result["path"],
-                    extension=result["extension"],
-                    tokens=result["tokens"],
-                )
+            # blob SHA の計算で読んだ内容があれば、読み直さずに使う
+            if data is None:
+                try:
+                    async with aiofiles.open(record.path, "rb") as f:
+                        data = await f.read()
+                except Exception as e:
+                    print(f"Error processing file {record.path}: {e}")
+                    continue
+            record.content = decode_text(data)
+            pending.append(record)
+
+        # キャッシュにないファイルはイベントループの外でまとめてトークン化する
+        if pending:
+            counts = await asyncio.to_thread(
+                tokenizer.count_tokens, [record.content or "" for record in pending]
             )
+            for record, tokens in zip(pending, counts):
+                record.tokens = tokens
+                record.content = None
+                if record.blob_sha:
+                    token_cache.put(record.blob_sha, tokens)
 
-            ext = result["extension"]
-            if ext not in extension_data:
-                extension_data[ext] = {"count": 0, "tokens": 0}
-            extension_data[ext]["count"] += 1
-            extension_data[ext]["tokens"] += result["tokens"]
-
-    # ファイルデータをトークン数でソート
-    file_data_list.sort(key=lambda x: x.tokens, reverse=True)
-
-    extension_tokens = [
-        FileType(extension=ext, count=data["count"], tokens=data["tokens"])
-        for ext, data in extension_data.items()
-    ]
-
-    file_count = len(processed_files)
-    return FileStats(
-        file_count=file_count,
-        total_size=total_size,
-        average_size=total_size / file_count if file_count > 0 else 0,
-        max_size=max(file_sizes, default=0),
-        min_size=min(file_sizes, default=0),
-        extension_tokens=extension_tokens,
-        context_length=context_length,
-        file_data=file_data_list,
-    )
+        records.extend(record for record, _ in results if record.tokens is not None)
 
+    token_cache.flush()
+    return aggregate_records(records)
 
-async def process_single_file(file_info: FileInfo) -> Optional[Dict[str, Any]]:
+
+def stat_single_file(
+    file_info: FileInfo, token_cache: Optional[TokenCache] = None
+) -> Optional[Tuple[FileRecord, Optional[bytes]]]:
     """
-    単一ファイルの非同期処理を行う補助関数
+    単一ファイルの stat と blob SHA の計算を行う (スレッドで実行する)
+
+    blob SHA を計算するために読んだ内容も返し、git index から blob SHA が
+    分かった場合は None を返す。バイナリファイルと stat できないファイルは
+    None を返す。大きすぎるファイルはトークン数を 0 とする
     """
     try:
-        relative_path = str(file_info.file_path.relative_to(file_info.repo_path))
+        relative_path = file_info.file_path.relative_to(file_info.repo_path).as_posix()
+        file_stat = file_info.file_path.stat()
 
-        # stat呼び出しを先に行う
-        try:
-            file_size = file_info.file_path.stat().st_size / 1024  # bytes to KB
-        except Exception:
+        # バイナリファイルは読み込む前に除外する
+        if is_binary_file(file_info.file_path, file_stat):
             return None
 
+        record = FileRecord(
+            path=file_info.file_path,
+            relative_path=relative_path,
+            size=file_stat.st_size,
+            extension=file_extension(file_info.file_path),
+        )
+
         # 大きすぎるファイルはスキップ
-        if file_size > MAX_FILE_SIZE:  # 1MB以上のファイルはスキップ
-            return {
-                "path": relative_path,
-                "size": file_size,
-                "tokens": 0,
-                "extension": file_info.file_path.suffix.lower() or "no_extension",
-            }
-
-        async with aiofiles.open(
-            file_info.file_path, "r", encoding="utf-8", errors="ignore"
-        ) as f:
-            content = await f.read()
-
-        # トークン化処理
-        tokens = len(encoding.encode(content))
-
-        return {
-            "path": relative_path,
-            "size": file_size,
-            "tokens": tokens,
-            "extension": file_info.file_path.suffix.lower() or "no_extension",
-        }
+        if file_stat.st_size / 1024 > MAX_FILE_SIZE:
+            record.tokens = 0
+            return record, None
+
+        # git index から分かる場合はハッシュ計算を省略する
+        data = None
+        if token_cache is not None:
+            record.blob_sha = token_cache.known_blob_sha(file_info.file_path, file_stat)
+        if record.blob_sha is None:
+            data = file_info.file_path.read_bytes()
+            hasher = blob_hasher(len(data))
+            hasher.update(data)
+            record.blob_sha = hasher.hexdigest()
+        file_info.blob_sha = record.blob_sha
+        return record, data
     except Exception as e:
         print(f"Error processing file {file_info.file_path}: {e}")
         return None
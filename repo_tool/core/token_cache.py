@@ -0,0 +1,122 @@
+import hashlib
+import os
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Protocol, Set
+
+from repo_tool.core.git_index import IndexEntry
+from repo_tool.core.tokens import encoding
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class TokenCountStore(Protocol):
+    """Persistent storage of token counts keyed by git blob SHA"""
+
+    def get_many(self, blob_shas: Iterable[str], encoding_name: str) -> Dict[str, int]:
+        """Returns the stored counts"""
+        ...
+
+    def put_many(self, counts: Dict[str, int], encoding_name: str) -> None: ...
+
+    def touch_many(self, blob_shas: Iterable[str], encoding_name: str) -> None:
+        """Marks the stored counts as recently used"""
+        ...
+
+
+def blob_hasher(size: int) -> "hashlib._Hash":
+    """
+    Returns a sha1 object primed with the git blob header, so feeding it the file
+    content yields the same SHA as `git hash-object`.
+    """
+    return hashlib.sha1(b"blob %d\0" % size)
+
+
+def git_blob_sha(file_path: Path, size: Optional[int] = None) -> str:
+    if size is None:
+        size = file_path.stat().st_size
+    hasher = blob_hasher(size)
+    with file_path.open("rb") as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class TokenCache:
+    """
+    Read-through cache of token counts keyed by git blob SHA and encoding name.
+
+    Counts are kept in memory for the duration of a request. Lookups that miss
+    the memory go to the store, preferably many at once with prefetch(). New
+    counts are written back and the counts read from the store are marked as
+    recently used on flush(). Without a store the cache only lives in memory.
+
+    Blob SHAs read from the git index can be registered with add_index_entries(),
+    so files that are unchanged since the index was written do not need hashing.
+    """
+
+    def __init__(self, store: Optional[TokenCountStore] = None):
+        self.store = store
+        self.encoding_name = encoding.name
+        self.hits = 0
+        self.misses = 0
+        self._counts: Dict[str, int] = {}
+        self._fetched: Set[str] = set()
+        self._new: Dict[str, int] = {}
+        # Counts read from the store since the last flush
+        self._used: Set[str] = set()
+        self._index_entries: Dict[str, IndexEntry] = {}
+
+    def add_index_entries(self, repo_path: Path, entries: Iterable[IndexEntry]) -> None:
+        for entry in entries:
+            self._index_entries[str(repo_path / entry.path)] = entry
+
+    def known_blob_sha(
+        self, file_path: Path, file_stat: os.stat_result
+    ) -> Optional[str]:
+        """
+        Returns the blob SHA from the git index if the file is unchanged since the
+        index was written.
+        """
+        entry = self._index_entries.get(str(file_path))
+        if entry is not None and entry.matches_stat(file_stat):
+            return entry.blob_sha
+        return None
+
+    def blob_sha(self, file_path: Path, file_stat: os.stat_result) -> str:
+        known = self.known_blob_sha(file_path, file_stat)
+        if known is not None:
+            return known
+        return git_blob_sha(file_path, file_stat.st_size)
+
+    def prefetch(self, blob_shas: Iterable[str]) -> None:
+        """Loads the counts of many blobs from the store with one lookup"""
+        missing = {sha for sha in blob_shas if sha not in self._fetched}
+        if not missing:
+            return
+        self._fetched.update(missing)
+        if self.store is not None:
+            counts = self.store.get_many(missing, self.encoding_name)
+            self._counts.update(counts)
+            self._used.update(counts)
+
+    def get(self, blob_sha: str) -> Optional[int]:
+        self.prefetch([blob_sha])
+        tokens = self._counts.get(blob_sha)
+        if tokens is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return tokens
+
+    def put(self, blob_sha: str, tokens: int) -> None:
+        self._counts[blob_sha] = tokens
+        self._new[blob_sha] = tokens
+
+    def flush(self) -> None:
+        if self.store is not None:
+            if self._used:
+                self.store.touch_many(self._used, self.encoding_name)
+            if self._new:
+                self.store.put_many(self._new, self.encoding_name)
+        self._used = set()
+        self._new = {}
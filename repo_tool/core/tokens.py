@@ -0,0 +1,222 @@
+import os
+import time
+from dataclasses import dataclass
+from enum import Enum
+from functools import lru_cache
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+import tiktoken
+
+encoding = tiktoken.get_encoding("o200k_base")
+
+# Number of characters read per chunk when counting tokens of a file
+CHUNK_SIZE = 64 * 1024
+# Text without a safe boundary is split anyway once it grows past this size
+MAX_PENDING_SIZE = 4 * CHUNK_SIZE
+# Total size of the texts encoded together in one batch
+BATCH_SIZE_BUDGET = 8 * 1024 * 1024
+# Files larger than this are counted by streaming, so they can stop at the limit
+STREAMING_THRESHOLD = 1024 * 1024
+
+
+class SizeCheck(Enum):
+    """Result of checking a file's byte size against a token limit"""
+
+    UNDER = "under"  # The file is certainly below the limit
+    OVER = "over"  # The file certainly reaches the limit
+    UNKNOWN = "unknown"  # The file has to be tokenized
+
+
+@lru_cache(maxsize=None)
+def max_token_bytes() -> int:
+    """
+    Returns the byte length of the longest token in the encoding's vocabulary.
+    """
+    return max(len(token) for token in encoding.token_byte_values())
+
+
+def check_size_against_limit(size_bytes: int, max_tokens: int) -> SizeCheck:
+    """
+    Decides the max_tokens check from the file size alone when possible.
+
+    Every token covers at least one byte, so a file has at most as many tokens as
+    bytes. Every token covers at most max_token_bytes() bytes, so a UTF-8 file has
+    at least size / max_token_bytes() tokens. Only files whose size falls between
+    the two bounds need to be tokenized.
+    """
+    if size_bytes < max_tokens:
+        return SizeCheck.UNDER
+    if size_bytes >= max_tokens * max_token_bytes():
+        return SizeCheck.OVER
+    return SizeCheck.UNKNOWN
+
+
+def find_safe_boundary(text: str) -> int:
+    """
+    Returns the index of the last position where the text can be split without
+    changing its tokenization, or -1 if there is none.
+
+    A line break followed by a letter or digit is always a boundary between
+    pre-tokenized pieces of o200k_base, so the pieces on either side are encoded
+    the same way whether the text is split there or not.
+    """
+    index = text.rfind("\n")
+    while index != -1:
+        if index + 1 < len(text) and text[index + 1].isalnum():
+            return index + 1
+        index = text.rfind("\n", 0, index)
+    return -1
+
+
+class TokenCounter:
+    """
+    Counts tokens of text that is fed in chunks.
+
+    Chunks are only encoded up to a safe boundary, the rest is kept until the next
+    chunk arrives. Once the running total reaches the limit, further input is
+    ignored, so callers can stop reading as soon as `exceeded` is True.
+    """
+
+    def __init__(self, limit: Optional[int] = None):
+        self.limit = limit
+        self.tokens = 0
+        self._pending = ""
+
+    @property
+    def exceeded(self) -> bool:
+        return self.limit is not None and self.tokens >= self.limit
+
+    def feed(self, text: str) -> None:
+        if self.exceeded:
+            return
+        buffer = self._pending + text
+        split = find_safe_boundary(buffer)
+        if split == -1 and len(buffer) > MAX_PENDING_SIZE:
+            split = buffer.rfind("\n") + 1 or len(buffer)
+        if split <= 0:
+            self._pending = buffer
+            return
+        self.tokens += len(encoding.encode_ordinary(buffer[:split]))
+        self._pending = buffer[split:]
+
+    def finish(self) -> int:
+        """
+        Encodes the remaining text and returns the token count. When the limit was
+        reached the returned count is at least the limit, but not exact.
+        """
+        if self._pending and not self.exceeded:
+            self.tokens += len(encoding.encode_ordinary(self._pending))
+        self._pending = ""
+        return self.tokens
+
+
+def count_file_tokens(
+    file_path: Path, limit: Optional[int] = None, chunk_size: int = CHUNK_SIZE
+) -> int:
+    """
+    Counts the tokens of a file while reading it in chunks, so memory stays
+    bounded by the chunk size. Reading stops once the count reaches the limit.
+    """
+    counter = TokenCounter(limit)
+    with file_path.open("r", encoding="utf-8", errors="ignore") as f:
+        while not counter.exceeded:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            counter.feed(chunk)
+    return counter.finish()
+
+
+def get_tokenizer_threads_from_env() -> int:
+    return int(os.getenv("TOKENIZER_THREADS", "0")) or os.cpu_count() or 1
+
+
+@dataclass
+class TokenizerStats:
+    """Counters reported by the batch tokenizer"""
+
+    threads: int
+    batches: int = 0
+    texts: int = 0
+    characters: int = 0
+    seconds: float = 0.0
+
+
+class BatchTokenizer:
+    """
+    Counts tokens of many texts at once with tiktoken's encode_ordinary_batch,
+    which encodes on a thread pool while the GIL is released.
+
+    Texts are grouped into batches by size, so at most BATCH_SIZE_BUDGET of text
+    is held in memory at a time. The number of threads defaults to the
+    TOKENIZER_THREADS environment variable, or the number of CPUs.
+    """
+
+    def __init__(
+        self,
+        num_threads: Optional[int] = None,
+        batch_size_budget: int = BATCH_SIZE_BUDGET,
+    ):
+        self.num_threads = num_threads or get_tokenizer_threads_from_env()
+        self.batch_size_budget = batch_size_budget
+        self.stats = TokenizerStats(threads=self.num_threads)
+
+    def count_tokens(self, texts: Sequence[str]) -> List[int]:
+        counts: List[int] = []
+        batch: List[str] = []
+        batch_size = 0
+        for text in texts:
+            batch.append(text)
+            batch_size += len(text)
+            if batch_size >= self.batch_size_budget:
+                counts.extend(self._encode_batch(batch))
+                batch = []
+                batch_size = 0
+        if batch:
+            counts.extend(self._encode_batch(batch))
+        return counts
+
+    def count_file_tokens(
+        self, file_paths: Sequence[Path], limit: Optional[int] = None
+    ) -> List[int]:
+        """
+        Counts the tokens of many files. Files up to STREAMING_THRESHOLD are read
+        and encoded in batches. Larger files are counted by streaming, which stops
+        once the count reaches the limit.
+        """
+        counts: List[int] = [0] * len(file_paths)
+        batch_indexes: List[int] = []
+        batch_texts: List[str] = []
+        batch_size = 0
+
+        def flush() -> None:
+            for index, tokens in zip(batch_indexes, self._encode_batch(batch_texts)):
+                counts[index] = tokens
+            batch_indexes.clear()
+            batch_texts.clear()
+
+        for index, file_path in enumerate(file_paths):
+            if file_path.stat().st_size > STREAMING_THRESHOLD:
+                counts[index] = count_file_tokens(file_path, limit)
+                continue
+            with file_path.open("r", encoding="utf-8", errors="ignore") as f:
+                text = f.read()
+            batch_indexes.append(index)
+            batch_texts.append(text)
+            batch_size += len(text)
+            if batch_size >= self.batch_size_budget:
+                flush()
+                batch_size = 0
+        if batch_texts:
+            flush()
+        return counts
+
+    def _encode_batch(self, texts: List[str]) -> List[int]:
+        start = time.perf_counter()
+        tokens = encoding.encode_ordinary_batch(texts, num_threads=self.num_threads)
+        self.stats.batches += 1
+        self.stats.texts += len(texts)
+        self.stats.characters += sum(len(text) for text in texts)
+        self.stats.seconds += time.perf_counter() - start
+        return [len(t) for t in tokens]
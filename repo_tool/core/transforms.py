@@ -0,0 +1,230 @@
+from dataclasses import replace
+from enum import Enum
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from repo_tool.core.scan import FileRecord
+from repo_tool.core.tokens import encoding
+
+# Lines longer than this are cut by truncate_data_literals
+MAX_LINE_CHARS = 400
+# A leading comment block longer than this is kept as is by drop_license_header
+MAX_HEADER_LINES = 200
+LICENSE_WORDS = ("license", "copyright", "spdx-license-identifier")
+
+_HASH = ("#",)
+_SLASH = ("//",)
+_C_BLOCK = ("/*", "*/")
+_MARKUP_BLOCK = ("<!--", "-->")
+
+# Extension -> prefixes of full-line comments
+LINE_COMMENTS: Dict[str, Tuple[str, ...]] = {
+    **dict.fromkeys(
+        (".py", ".sh", ".bash", ".zsh", ".rb", ".pl", ".r", ".yaml", ".yml"),
+        _HASH,
+    ),
+    **dict.fromkeys((".toml", ".cfg", ".ini", ".dockerfile", ".tf"), _HASH),
+    **dict.fromkeys(
+        (".js", ".jsx", ".ts", ".tsx", ".mjs", ".cjs", ".java", ".kt", ".scala"),
+        _SLASH,
+    ),
+    **dict.fromkeys(
+        (".c", ".h", ".cc", ".cpp", ".hpp", ".cs", ".go", ".rs", ".swift"), _SLASH
+    ),
+    **dict.fromkeys((".php", ".dart"), ("//", "#")),
+    **dict.fromkeys((".sql", ".lua", ".hs"), ("--",)),
+}
+
+# Extension -> start and end of block comments
+BLOCK_COMMENTS: Dict[str, Tuple[str, str]] = {
+    **dict.fromkeys(
+        (".js", ".jsx", ".ts", ".tsx", ".mjs", ".cjs", ".java", ".kt", ".scala"),
+        _C_BLOCK,
+    ),
+    **dict.fromkeys(
+        (".c", ".h", ".cc", ".cpp", ".hpp", ".cs", ".go", ".rs", ".swift"), _C_BLOCK
+    ),
+    **dict.fromkeys((".php", ".dart", ".css", ".scss", ".less", ".sql"), _C_BLOCK),
+    **dict.fromkeys((".html", ".htm", ".xml", ".svg", ".vue"), _MARKUP_BLOCK),
+}
+
+
+class TransformName(str, Enum):
+    """The transforms that can be enabled in the filter settings"""
+
+    DROP_LICENSE_HEADER = "drop_license_header"
+    STRIP_COMMENTS = "strip_comments"
+    TRUNCATE_DATA_LITERALS = "truncate_data_literals"
+    COLLAPSE_WHITESPACE = "collapse_whitespace"
+
+
+# A transform takes the lines of a file, with their line endings, and its
+# extension, and yields the transformed lines
+LineTransform = Callable[[Iterator[str], str], Iterator[str]]
+
+
+def _is_comment_line(stripped: str, extension: str) -> bool:
+    return stripped.startswith(LINE_COMMENTS.get(extension, ()))
+
+
+def _iter_comment_blocks(
+    lines: Iterator[str], extension: str
+) -> Iterator[Tuple[bool, str]]:
+    """
+    Yields each line with whether it is a comment: a full-line comment, or a
+    line of a block comment that starts and ends at line boundaries. Comments
+    after code on the same line are never detected, so string literals that
+    look like comments are only misread when they start a line.
+    """
+    block = BLOCK_COMMENTS.get(extension)
+    in_block = False
+    for line in lines:
+        stripped = line.strip()
+        if in_block and block is not None:
+            end = stripped.find(block[1])
+            if end < 0:
+                yield True, line
+                continue
+            in_block = False
+            # The block ends on this line, and a line with code after the end
+            # is kept as code
+            yield not stripped[end + len(block[1]) :].strip(), line
+        elif block is not None and stripped.startswith(block[0]):
+            # Only a block comment that runs to the end of its last line is a
+            # comment line, so code after it is never removed
+            closed = block[1] in stripped[len(block[0]) :]
+            if closed and not stripped.endswith(block[1]):
+                yield False, line
+                continue
+            in_block = not closed
+            yield True, line
+        else:
+            # Shebangs are kept, since they say how the file is run
+            yield (
+                _is_comment_line(stripped, extension) and not stripped.startswith("#!")
+            ), line
+
+
+def _mentions_license(header: List[str]) -> bool:
+    text = "".join(header).lower()
+    return any(word in text for word in LICENSE_WORDS)
+
+
+def drop_license_header(lines: Iterator[str], extension: str) -> Iterator[str]:
+    """Drops the comment block at the top of the file if it mentions a license"""
+    blocks = _iter_comment_blocks(lines, extension)
+    # The comment lines at the top, with the blank lines between them
+    header: List[str] = []
+    for is_comment, line in blocks:
+        if not header and line.startswith("#!"):
+            # Shebangs are kept, the header may follow them
+            yield line
+            continue
+        if is_comment or (header and not line.strip()):
+            header.append(line)
+            if len(header) <= MAX_HEADER_LINES:
+                continue
+            yield from header
+            break
+        if not _mentions_license(header):
+            yield from header
+        yield line
+        break
+    else:
+        # The whole file is a comment
+        if not _mentions_license(header):
+            yield from header
+        return
+    yield from (line for _, line in blocks)
+
+
+def strip_comments(lines: Iterator[str], extension: str) -> Iterator[str]:
+    """Removes full-line comments and block comments"""
+    for is_comment, line in _iter_comment_blocks(lines, extension):
+        if not is_comment:
+            yield line
+
+
+def truncate_data_literals(lines: Iterator[str], extension: str) -> Iterator[str]:
+    """Cuts lines longer than MAX_LINE_CHARS, such as embedded data or minified code"""
+    for line in lines:
+        text = line.rstrip("\n")
+        if len(text) > MAX_LINE_CHARS:
+            cut = len(text) - MAX_LINE_CHARS
+            line = f"{text[:MAX_LINE_CHARS]}... ({cut} characters truncated)\n"
+        yield line
+
+
+def collapse_whitespace(lines: Iterator[str], extension: str) -> Iterator[str]:
+    """Removes trailing whitespace and turns runs of blank lines into one"""
+    blank = False
+    for line in lines:
+        text = line.rstrip()
+        if not text:
+            if blank:
+                continue
+            blank = True
+        else:
+            blank = False
+        yield text + "\n" if line.endswith("\n") else text
+
+
+# Transforms are applied in this order whatever order they are enabled in, so
+# the license header is found before the comments are stripped
+TRANSFORMS: Dict[TransformName, LineTransform] = {
+    TransformName.DROP_LICENSE_HEADER: drop_license_header,
+    TransformName.STRIP_COMMENTS: strip_comments,
+    TransformName.TRUNCATE_DATA_LITERALS: truncate_data_literals,
+    TransformName.COLLAPSE_WHITESPACE: collapse_whitespace,
+}
+
+
+def normalize_transforms(names: Iterable[str]) -> List[str]:
+    """
+    Returns the names of the enabled transforms in the order they are applied.
+    Raises ValueError for an unknown name.
+    """
+    enabled = {TransformName(name) for name in names}
+    return [name.value for name in TRANSFORMS if name in enabled]
+
+
+def transform_content(content: str, extension: str, names: Iterable[str]) -> str:
+    """Passes the lines of the content through the enabled transforms"""
+    lines: Iterator[str] = iter(content.splitlines(keepends=True))
+    for name in normalize_transforms(names):
+        lines = TRANSFORMS[TransformName(name)](lines, extension)
+    return "".join(lines)
+
+
+def apply_transforms(record: FileRecord, names: Iterable[str]) -> FileRecord:
+    """
+    Returns a copy of the record with its content transformed, its token count
+    after the transforms in tokens, and its count before them in
+    original_tokens. Records without content are returned as is.
+    """
+    if record.is_binary or record.content is None:
+        return record
+    original_tokens = record.tokens
+    if original_tokens is None:
+        original_tokens = len(encoding.encode_ordinary(record.content))
+    content = transform_content(record.content, record.extension, names)
+    tokens = original_tokens
+    if content != record.content:
+        tokens = len(encoding.encode_ordinary(content))
+    return replace(
+        record, content=content, tokens=tokens, original_tokens=original_tokens
+    )
+
+
+def iter_transformed(
+    records: Iterable[FileRecord], names: Optional[Iterable[str]]
+) -> Iterator[FileRecord]:
+    """
+    Yields the records with the enabled transforms applied to their content,
+    one file at a time. The records are passed through when none is enabled.
+    """
+    enabled = normalize_transforms(names or [])
+    if not enabled:
+        yield from records
+        return
+    for record in records:
+        yield apply_transforms(record, enabled)
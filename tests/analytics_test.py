@@ -0,0 +1,119 @@
+import numpy as np
+import pytest
+
+from repo_tool.core.analytics import (
+    MAX_TREE_DEPTH,
+    DirectoryNode,
+    FileAnalytics,
+    analyze_file_stats,
+    analyze_files,
+)
+from repo_tool.core.summary import FileData, FileStats
+
+PATHS = [
+    "README.md",
+    "src/main.py",
+    "src/util.py",
+    "src/pkg/a.py",
+    "src/pkg/b.py",
+    "docs/guide.md",
+    "docs/api/index.md",
+    "Makefile",
+]
+EXTENSIONS = [".md", ".py", ".py", ".py", ".py", ".md", ".md", "no_extension"]
+TOKENS = [120, 900, 0, 35, 4096, 64, 700, 13]
+SIZES = [480, 3600, 0, 140, 16384, 256, 2800, 52]
+
+
+def find(node: DirectoryNode, path: str) -> DirectoryNode:
+    for child in node.children:
+        if path == child.path or path.startswith(child.path + "/"):
+            return child if path == child.path else find(child, path)
+    raise KeyError(path)
+
+
+def test_percentiles_match_numpy_per_extension() -> None:
+    analytics = analyze_files(PATHS, EXTENSIONS, TOKENS, SIZES)
+
+    assert analytics.tokens.count == len(TOKENS)
+    assert analytics.tokens.total == sum(TOKENS)
+    assert analytics.tokens.max == max(TOKENS)
+    assert [analytics.tokens.p50, analytics.tokens.p90, analytics.tokens.p99] == (
+        pytest.approx(np.percentile(TOKENS, [50, 90, 99]).tolist())
+    )
+
+    by_extension = {item.extension: item for item in analytics.extensions}
+    assert [item.extension for item in analytics.extensions] == [
+        ".py",
+        ".md",
+        "no_extension",
+    ]
+    for extension, item in by_extension.items():
+        sizes = [s for s, e in zip(SIZES, EXTENSIONS) if e == extension]
+        assert item.sizes.count == len(sizes)
+        assert item.sizes.mean == pytest.approx(np.mean(sizes))
+        assert [item.sizes.p50, item.sizes.p90, item.sizes.p99] == pytest.approx(
+            np.percentile(sizes, [50, 90, 99]).tolist()
+        )
+
+
+def test_histograms_use_power_of_two_bins() -> None:
+    histogram = analyze_files(PATHS, EXTENSIONS, TOKENS, SIZES).tokens.histogram
+
+    assert sum(histogram.counts) == len(TOKENS)
+    assert len(histogram.edges) == len(histogram.counts) + 1
+    for value in TOKENS:
+        bin_index = next(
+            i
+            for i in range(len(histogram.counts))
+            if histogram.edges[i] <= value < histogram.edges[i + 1]
+        )
+        assert histogram.counts[bin_index] > 0
+    # 0 is alone in the first bin, 4096 opens the last one
+    assert histogram.counts[0] == 1
+    assert histogram.edges[-2] == 4096
+
+
+def test_directory_tree_rolls_tokens_up() -> None:
+    tree = analyze_files(PATHS, EXTENSIONS, TOKENS, SIZES).directories
+
+    assert tree.tokens == sum(TOKENS)
+    assert tree.files == len(PATHS)
+    assert [child.path for child in tree.children] == ["src", "docs"]
+    assert find(tree, "src").tokens == 900 + 0 + 35 + 4096
+    assert find(tree, "src/pkg").files == 2
+    assert find(tree, "docs/api").tokens == 700
+
+
+def test_deep_directories_are_counted_at_the_depth_limit() -> None:
+    deep = "/".join(f"d{i}" for i in range(MAX_TREE_DEPTH + 3)) + "/file.py"
+    tree = analyze_files([deep], [".py"], [10], [40]).directories
+
+    node = tree
+    while node.children:
+        node = node.children[0]
+    assert node.path.count("/") == MAX_TREE_DEPTH - 1
+    assert node.tokens == 10
+
+
+def test_analytics_round_trip_and_empty_stats() -> None:
+    file_stats = FileStats(
+        file_count=2,
+        total_size=0.5,
+        average_size=0.25,
+        max_size=0.3,
+        min_size=0.2,
+        context_length=30,
+        file_data=[
+            FileData(name="a.py", path="a.py", extension=".py", tokens=10),
+            FileData(name="b.md", path="x/b.md", extension=".md", tokens=20),
+        ],
+        file_sizes=[200, 300],
+    )
+    analytics = analyze_file_stats(file_stats)
+    assert FileAnalytics.from_json(analytics.to_json()) == analytics
+
+    empty = analyze_file_stats(FileStats(0, 0, 0, 0, 0, 0))
+    assert empty.tokens.count == 0
+    assert empty.extensions == []
+    assert FileAnalytics.from_json(empty.to_json()) == empty
@@ -0,0 +1,135 @@
+import gzip
+import os
+from pathlib import Path
+from typing import Dict, Iterator, Tuple
+
+from git import Repo
+
+from repo_tool.core.artifacts import (
+    ArtifactStore,
+    accepts_gzip,
+    digest_artifact_key,
+    etag_matches,
+    gzip_chunks,
+)
+from repo_tool.core.filter import FileSource, FilterSettings
+
+SETTINGS = FilterSettings([], [".git/"], 50000)
+
+
+def test_etag_matches() -> None:
+    etag = '"abc"'
+    assert etag_matches('"abc"', etag)
+    assert etag_matches('"x", W/"abc"', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches('"abcd"', etag)
+    assert not etag_matches(None, etag)
+
+
+def test_accepts_gzip() -> None:
+    assert accepts_gzip("gzip, deflate, br")
+    assert accepts_gzip("deflate;q=0.5, *;q=0.1")
+    assert not accepts_gzip("gzip;q=0, *")
+    assert not accepts_gzip("identity")
+    assert not accepts_gzip(None)
+
+
+def test_gzip_chunks() -> None:
+    chunks = [b"line %d\n" % i for i in range(1000)]
+    assert gzip.decompress(b"".join(gzip_chunks(chunks))) == b"".join(chunks)
+
+
+def test_write_stores_the_compressed_variant(tmp_path: Path) -> None:
+    store = ArtifactStore(tmp_path, max_bytes=1000)
+    streamed = b"".join(store.write("key", [b"ab", b"cd"], compressed=True))
+    assert gzip.decompress(streamed) == b"abcd"
+
+    path = store.get("key", compressed=True)
+    assert path is not None and path.read_bytes() == streamed
+    path = store.get("key")
+    assert path is not None and path.read_bytes() == b"abcd"
+
+
+def test_write_stores_the_artifact_once_consumed(tmp_path: Path) -> None:
+    store = ArtifactStore(tmp_path, max_bytes=1000)
+    assert store.get("key") is None
+
+    chunks = store.write("key", [b"ab", b"cd"])
+    assert next(chunks) == b"ab"
+    assert store.get("key") is None
+    assert list(chunks) == [b"cd"]
+
+    path = store.get("key")
+    assert path is not None and path.read_bytes() == b"abcd"
+
+
+def test_interrupted_write_stores_nothing(tmp_path: Path) -> None:
+    store = ArtifactStore(tmp_path, max_bytes=1000)
+    chunks = store.write("key", [b"ab", b"cd"])
+    next(chunks)
+    chunks.close()
+
+    assert store.get("key") is None
+    assert os.listdir(tmp_path) == []
+
+
+def test_write_stores_the_index_and_reads_ranges(tmp_path: Path) -> None:
+    store = ArtifactStore(tmp_path, max_bytes=1000)
+    index: Dict[str, Tuple[int, int]] = {}
+
+    def chunks() -> Iterator[bytes]:
+        yield b"head "
+        index["a"] = (5, 3)
+        yield b"aaa "
+        index["b"] = (9, 2)
+        yield b"bb"
+
+    assert store.get_index("key") is None
+    list(store.write("key", chunks(), index=index))
+
+    assert store.get_index("key") == {"a": (5, 3), "b": (9, 2)}
+    ranges = store.open_ranges("key", [(9, 2), (5, 3)])
+    assert ranges is not None and b"".join(ranges) == b"bbaaa"
+    assert store.open_ranges("missing", [(0, 1)]) is None
+
+
+def test_evicts_the_least_recently_used(tmp_path: Path) -> None:
+    store = ArtifactStore(tmp_path, max_bytes=70)
+    for i, key in enumerate(["a", "b"]):
+        list(store.write(key, [b"x" * 4]))
+        os.utime(tmp_path / key, (i, i))
+        os.utime(tmp_path / f"{key}.gz", (i, i))
+    assert store.get("a") is not None
+
+    list(store.write("c", [b"x" * 4]))
+    assert sorted(os.listdir(tmp_path)) == ["a", "a.gz", "c", "c.gz"]
+
+
+def test_digest_artifact_key(tmp_path: Path) -> None:
+    repo = Repo.init(tmp_path)
+    (tmp_path / "main.py").write_text("print(1)\n", encoding="utf-8")
+    repo.git.add(A=True)
+    repo.index.commit("init")
+
+    def key(settings: FilterSettings = SETTINGS, output_format: str = "txt") -> str:
+        result = digest_artifact_key(
+            tmp_path, settings, FileSource.FILESYSTEM, output_format
+        )
+        assert result is not None
+        return result
+
+    first = key()
+    assert key() == first
+    assert key(output_format="json") != first
+    assert key(FilterSettings([], [".git/"], 100)) != first
+
+    (tmp_path / "main.py").write_text("print(2)\n", encoding="utf-8")
+    assert digest_artifact_key(tmp_path, SETTINGS, FileSource.FILESYSTEM, "txt") is None
+    repo.git.add(A=True)
+    repo.index.commit("change")
+    assert key() != first
+
+    # Untracked files are only part of the digest when the working tree is walked
+    (tmp_path / "new.py").write_text("print(3)\n", encoding="utf-8")
+    assert digest_artifact_key(tmp_path, SETTINGS, FileSource.FILESYSTEM, "txt") is None
+    assert digest_artifact_key(tmp_path, SETTINGS, FileSource.GIT_INDEX, "txt")
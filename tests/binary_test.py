@@ -0,0 +1,32 @@
+from pathlib import Path
+
+from repo_tool.core.binary import is_binary_content, is_binary_file
+from repo_tool.core.digest import generate_digest_content
+
+
+def test_is_binary_content() -> None:
+    assert not is_binary_content(b"")
+    assert not is_binary_content(b"def main():\n    return 0\n")
+    assert not is_binary_content("こんにちは\n".encode("utf-8"))
+    assert is_binary_content(b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR")
+    assert is_binary_content(bytes(range(1, 32)) * 4)
+
+
+def test_is_binary_file_is_cached_by_size_and_mtime(tmp_path: Path) -> None:
+    file_path = tmp_path / "data.bin"
+    file_path.write_bytes(b"\x00\x01\x02\x03")
+    assert is_binary_file(file_path)
+
+    file_path.write_text("now it is text\n", encoding="utf-8")
+    assert not is_binary_file(file_path)
+
+
+def test_digest_skips_binary_files(tmp_path: Path) -> None:
+    text_file = tmp_path / "main.py"
+    text_file.write_text("print('hello')\n", encoding="utf-8")
+    binary_file = tmp_path / "image.dat"
+    binary_file.write_bytes(b"\x00\xff" * 100)
+
+    digest = generate_digest_content(tmp_path, [text_file, binary_file])
+    assert "main.py" in digest
+    assert "image.dat" not in digest
@@ -0,0 +1,44 @@
+from pathlib import Path
+from typing import Callable, Dict, List, Union
+
+import pytest
+
+FILES: Dict[str, Union[str, bytes]] = {
+    "README.md": "# Title\r\n\r\nSome text\r\n",
+    "src/main.py": "def main() -> None:\n    print('hello')\n" * 20,
+    "src/empty.py": "",
+    "image.png": b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR",
+}
+
+
+@pytest.fixture(name="repo_path")
+def repo_path_fixture(tmp_path: Path) -> Path:
+    """A repository of FILES, with CRLF text, an empty file and a binary file"""
+    for name, content in FILES.items():
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if isinstance(content, bytes):
+            path.write_bytes(content)
+        else:
+            path.write_bytes(content.encode("utf-8"))
+    return tmp_path
+
+
+@pytest.fixture(name="count_reads")
+def count_reads_fixture(
+    monkeypatch: pytest.MonkeyPatch,
+) -> Callable[[], List[str]]:
+    """Returns a function that starts recording the names of the files read"""
+
+    def count_reads() -> List[str]:
+        reads: List[str] = []
+        read_bytes = Path.read_bytes
+
+        def counting_read_bytes(self: Path) -> bytes:
+            reads.append(self.name)
+            return read_bytes(self)
+
+        monkeypatch.setattr(Path, "read_bytes", counting_read_bytes)
+        return reads
+
+    return count_reads
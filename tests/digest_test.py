@@ -0,0 +1,122 @@
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+import pytest
+
+from repo_tool.core.digest import (
+    DedupStats,
+    digest_from_records,
+    generate_digest_content,
+    iter_digest,
+    iter_indexed_digest,
+    page_records,
+)
+from repo_tool.core.filter import FileSource, FilterSettings, scan_repository
+from repo_tool.core.scan import iter_with_content
+from repo_tool.core.tokens import encoding
+
+
+def test_iter_digest_reads_files_as_it_streams(
+    repo_path: Path, count_reads: Callable[[], List[str]]
+) -> None:
+    records = scan_repository(
+        repo_path,
+        filter_settings=FilterSettings([], [], 50000),
+        file_source=FileSource.FILESYSTEM,
+    )
+    expected = digest_from_records(iter_with_content(records))
+
+    reads = count_reads()
+    chunks = iter_digest(iter_with_content(records))
+    streamed = ""
+    for chunk in chunks:
+        streamed += chunk
+        if streamed.endswith("----\nsrc/empty.py\n"):
+            break
+    # Only the file being written has been read
+    assert reads == ["README.md", "empty.py"]
+
+    assert streamed + "".join(chunks) == expected
+    assert reads == ["README.md", "empty.py", "main.py"]
+
+
+def test_page_records_in_path_order(repo_path: Path) -> None:
+    records = scan_repository(
+        repo_path,
+        filter_settings=FilterSettings([], [], 50000),
+        file_source=FileSource.FILESYSTEM,
+    )
+    paths: List[str] = []
+    cursor = None
+    while True:
+        page, cursor = page_records(list(reversed(records)), cursor, limit=2)
+        paths.extend(record.relative_path for record in page)
+        if cursor is None:
+            break
+    assert paths == ["README.md", "src/empty.py", "src/main.py"]
+
+    # A page holds at least one file, even if it is over max_bytes
+    page, cursor = page_records(records, max_bytes=1)
+    assert [record.relative_path for record in page] == ["README.md"]
+    page, cursor = page_records(records, cursor, max_bytes=1000)
+    assert [record.relative_path for record in page] == ["src/empty.py", "src/main.py"]
+    assert cursor is None
+
+    with pytest.raises(ValueError):
+        page_records(records, "%%%")
+
+
+def test_page_reads_only_its_files(
+    repo_path: Path, count_reads: Callable[[], List[str]]
+) -> None:
+    records = scan_repository(
+        repo_path,
+        filter_settings=FilterSettings([], [], 50000),
+        file_source=FileSource.FILESYSTEM,
+    )
+    reads = count_reads()
+    page, _ = page_records(records, limit=1)
+    assert [record.content for record in iter_with_content(page)] == [
+        "# Title\n\nSome text\n"
+    ]
+    assert reads == ["README.md"]
+
+
+def test_iter_indexed_digest_records_section_ranges(repo_path: Path) -> None:
+    records = scan_repository(
+        repo_path,
+        filter_settings=FilterSettings([], [], 50000),
+        file_source=FileSource.FILESYSTEM,
+        keep_content=True,
+    )
+    index: Dict[str, Tuple[int, int]] = {}
+    digest = b"".join(iter_indexed_digest(records, index))
+    assert digest.decode() == digest_from_records(records)
+
+    offset, length = index["README.md"]
+    assert (
+        digest[offset : offset + length] == b"----\nREADME.md\n# Title\n\nSome text\n\n"
+    )
+    assert list(index) == ["README.md", "src/empty.py", "src/main.py"]
+
+
+def test_dedup_writes_identical_files_once(tmp_path: Path) -> None:
+    license_text = "Permission is hereby granted, free of charge.\n" * 20
+    for name in ["LICENSE", "vendor/a/LICENSE", "vendor/b/LICENSE"]:
+        (tmp_path / name).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / name).write_text(license_text, encoding="utf-8")
+    files = [tmp_path / "LICENSE", tmp_path / "vendor/a/LICENSE"]
+    files.append(tmp_path / "vendor/b/LICENSE")
+
+    dedup = DedupStats()
+    digest = generate_digest_content(tmp_path, files, dedup)
+
+    assert digest.count(license_text) == 1
+    assert "----\nvendor/b/LICENSE\n(identical to LICENSE)\n" in digest
+    reference_tokens = len(encoding.encode_ordinary("(identical to LICENSE)\n"))
+    assert dedup.duplicates == 2
+    assert dedup.saved_tokens == 2 * (
+        len(encoding.encode_ordinary(license_text)) - reference_tokens
+    )
+    assert "2 identical files were replaced by references" in digest
+    assert generate_digest_content(tmp_path, files).count(license_text) == 3
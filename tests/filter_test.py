@@ -0,0 +1,136 @@
+import os
+import shutil
+from pathlib import Path
+from typing import Iterator, List
+
+import pytest
+from git import Repo
+
+from repo_tool.core.filter import (
+    FileSource,
+    FilterSettings,
+    FilterStats,
+    filter_files,
+    filter_files_in_repo,
+    get_all_files,
+    get_tracked_files,
+    should_prune_dir,
+    walk_files,
+)
+from repo_tool.core.token_cache import TokenCache, git_blob_sha
+from repo_tool.core.tokens import SizeCheck, check_size_against_limit, max_token_bytes
+
+
+@pytest.fixture(name="repo_path")
+def repo_path_fixture(tmp_path: Path) -> Path:
+    """Create a small repository tree in a temporary directory"""
+    files = [
+        "README.md",
+        "src/main.py",
+        "src/utils/helpers.py",
+        "src/cabin/house.py",
+        ".git/HEAD",
+        ".git/objects/ab/cdef",
+        "node_modules/pkg/index.js",
+        "examples/demo/app.py",
+        "build.log",
+    ]
+    for file in files:
+        path = tmp_path / file
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(f"content of {file}\n", encoding="utf-8")
+    return tmp_path
+
+
+def relative_paths(repo_path: Path, files: List[Path]) -> List[str]:
+    return [file.relative_to(repo_path).as_posix() for file in files]
+
+
+def test_walk_files_prunes_excluded_directories(repo_path: Path) -> None:
+    ignore_patterns = [".git/*", "node_modules/", "examples/**", "*.log"]
+    files = relative_paths(repo_path, list(walk_files(repo_path, ignore_patterns)))
+    assert files == [
+        "README.md",
+        "src/main.py",
+        "src/cabin/house.py",
+        "src/utils/helpers.py",
+    ]
+
+
+def test_walk_files_does_not_descend_into_pruned_directories(
+    repo_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    visited: List[str] = []
+    original_scandir = os.scandir
+
+    def tracking_scandir(path: str) -> Iterator[os.DirEntry[str]]:
+        visited.append(Path(path).relative_to(repo_path).as_posix())
+        return original_scandir(path)
+
+    monkeypatch.setattr(os, "scandir", tracking_scandir)
+    list(walk_files(repo_path, [".git/*", "node_modules/"]))
+    assert not any(path.startswith((".git", "node_modules")) for path in visited)
+
+
+def test_get_all_files_returns_only_files(repo_path: Path) -> None:
+    files = get_all_files(repo_path, [])
+    assert all(file.is_file() for file in files)
+    assert len(files) == 9
+
+
+def test_should_prune_dir() -> None:
+    assert should_prune_dir(".git", [".git/*"])
+    assert should_prune_dir("tools/bin", ["*bin/*"])
+    assert should_prune_dir("node_modules", ["node_modules/"])
+    assert not should_prune_dir("src", ["*.py", "src"])
+
+
+def test_check_size_against_limit() -> None:
+    assert check_size_against_limit(99, 100) is SizeCheck.UNDER
+    assert check_size_against_limit(100, 100) is SizeCheck.UNKNOWN
+    assert check_size_against_limit(100 * max_token_bytes(), 100) is SizeCheck.OVER
+
+
+def test_filter_files_skips_encodes_decided_by_size(tmp_path: Path) -> None:
+    small = tmp_path / "small.py"
+    small.write_text("print('hello')\n", encoding="utf-8")
+    huge = tmp_path / "huge.txt"
+    huge.write_text("x" * (20 * max_token_bytes()), encoding="utf-8")
+    ambiguous = tmp_path / "ambiguous.txt"
+    ambiguous.write_text("hello world " * 4, encoding="utf-8")
+
+    stats = FilterStats()
+    files = filter_files([small, huge, ambiguous], tmp_path, [], [], 20, stats)
+
+    assert small in files
+    assert huge not in files
+    assert stats.files_checked == 3
+    assert stats.encodes_skipped == 2
+    assert stats.encodes == 1
+
+
+def test_get_tracked_files_reads_the_git_index(repo_path: Path) -> None:
+    shutil.rmtree(repo_path / ".git")
+    repo = Repo.init(repo_path)
+    repo.git.add("README.md", "src/main.py", "node_modules/pkg/index.js")
+    (repo_path / "untracked.py").write_text("print('untracked')\n", encoding="utf-8")
+
+    token_cache = TokenCache()
+    files = get_tracked_files(repo_path, ["node_modules/"], token_cache)
+
+    assert relative_paths(repo_path, files) == ["README.md", "src/main.py"]
+    readme = repo_path / "README.md"
+    assert token_cache.known_blob_sha(readme, readme.stat()) == git_blob_sha(readme)
+
+
+def test_filter_files_in_repo_with_git_index(repo_path: Path) -> None:
+    shutil.rmtree(repo_path / ".git")
+    repo = Repo.init(repo_path)
+    repo.git.add("README.md", "src/main.py")
+    (repo_path / "src/main.py").unlink()
+
+    settings = FilterSettings([], [], 1000)
+    files = filter_files_in_repo(
+        repo_path, filter_settings=settings, file_source=FileSource.GIT_INDEX
+    )
+    assert relative_paths(repo_path, files) == ["README.md"]
@@ -0,0 +1,259 @@
+from pathlib import Path
+from typing import Generator, List
+
+import pytest
+from git import Repo
+from sqlmodel import Session, SQLModel, create_engine
+
+from repo_tool.api.repositories import FilterResultRepository
+from repo_tool.core.analytics import analyze_files
+from repo_tool.core.filter import (
+    FileSource,
+    FilterSettings,
+    filter_files_in_repo,
+    scan_repository,
+    walk_order_key,
+)
+from repo_tool.core.incremental import (
+    has_uncommitted_changes,
+    refresh_filter_result,
+    sync_filter_result,
+)
+from repo_tool.core.scan import FileRecord, FilterStats
+from repo_tool.core.summary import (
+    FileSortKey,
+    FileStats,
+    SortOrder,
+    aggregate_records,
+    top_files,
+)
+from repo_tool.core.tokens import encoding
+
+SETTINGS = FilterSettings([], [".git/", "*.log"], 50000)
+
+
+@pytest.fixture(name="store")
+def store_fixture() -> Generator[FilterResultRepository, None, None]:
+    engine = create_engine("sqlite:///:memory:")
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield FilterResultRepository(session)
+
+
+@pytest.fixture(name="repo")
+def repo_fixture(tmp_path: Path) -> Repo:
+    repo = Repo.init(tmp_path)
+    for i in range(20):
+        path = tmp_path / f"pkg{i % 3}" / f"mod{i}.py"
+        path.parent.mkdir(exist_ok=True)
+        path.write_text(f"def f{i}():\n    return {i}\n", encoding="utf-8")
+    (tmp_path / "README.md").write_text("# Demo\n", encoding="utf-8")
+    repo.git.add(A=True)
+    repo.index.commit("init")
+    return repo
+
+
+def refresh(
+    repo: Repo, store: FilterResultRepository, stats: FilterStats
+) -> List[FileRecord]:
+    return refresh_filter_result(
+        Path(repo.working_dir),
+        "alice/demo",
+        store,
+        filter_settings=SETTINGS,
+        stats=stats,
+        file_source=FileSource.FILESYSTEM,
+    )
+
+
+def test_walk_order_key_matches_walk(repo: Repo) -> None:
+    repo_path = Path(repo.working_dir)
+    files = filter_files_in_repo(repo_path, filter_settings=SETTINGS)
+    relative = [file.relative_to(repo_path).as_posix() for file in files]
+    assert sorted(relative, key=walk_order_key) == relative
+
+
+def test_refresh_only_checks_changed_files(
+    repo: Repo, store: FilterResultRepository
+) -> None:
+    repo_path = Path(repo.working_dir)
+    first = refresh(repo, store, FilterStats())
+    assert len(first) == 21
+
+    (repo_path / "pkg0" / "mod0.py").write_text("x = 1\n", encoding="utf-8")
+    (repo_path / "pkg1" / "mod1.py").unlink()
+    (repo_path / "pkg2" / "mod2.py").rename(repo_path / "pkg2" / "renamed.py")
+    (repo_path / "pkg0" / "new.py").write_text("y = 2\n", encoding="utf-8")
+    (repo_path / "build.log").write_text("ignored\n", encoding="utf-8")
+    repo.git.add(A=True)
+    repo.index.commit("change")
+
+    stats = FilterStats()
+    records = refresh(repo, store, stats)
+    # mod0.py, renamed.py and new.py; deleted and ignored paths are not read
+    assert stats.files_checked == 3
+
+    expected = filter_files_in_repo(repo_path, filter_settings=SETTINGS)
+    assert [record.path for record in records] == expected
+    by_path = {record.relative_path: record for record in records}
+    assert by_path["pkg0/mod0.py"].tokens == len(encoding.encode_ordinary("x = 1\n"))
+    assert "pkg1/mod1.py" not in by_path
+
+
+def test_refresh_at_the_same_commit_reads_nothing(
+    repo: Repo, store: FilterResultRepository
+) -> None:
+    first = refresh(repo, store, FilterStats())
+
+    stats = FilterStats()
+    second = refresh(repo, store, stats)
+    assert stats.files_checked == 0
+    assert [(r.relative_path, r.tokens) for r in second] == [
+        (r.relative_path, r.tokens) for r in first
+    ]
+
+
+def assert_same_stats(actual: FileStats, expected: FileStats) -> None:
+    assert actual.file_count == expected.file_count
+    assert actual.context_length == expected.context_length
+    assert actual.total_size == pytest.approx(expected.total_size)
+    assert actual.min_size == pytest.approx(expected.min_size)
+    assert actual.max_size == pytest.approx(expected.max_size)
+    assert sorted(
+        (t.extension, t.count, t.tokens) for t in actual.extension_tokens
+    ) == sorted((t.extension, t.count, t.tokens) for t in expected.extension_tokens)
+    # Only the files with the most tokens are read from the stored result
+    assert [d.tokens for d in actual.file_data] == [
+        d.tokens for d in top_files(expected.file_data)
+    ]
+    expected_paths = {(d.path, d.tokens) for d in expected.file_data}
+    assert {(d.path, d.tokens) for d in actual.file_data} <= expected_paths
+
+
+def test_stored_totals_follow_changes(
+    repo: Repo, store: FilterResultRepository
+) -> None:
+    repo_path = Path(repo.working_dir)
+    state_key = sync_filter_result(
+        repo_path, "alice/demo", store, SETTINGS, file_source=FileSource.FILESYSTEM
+    )
+    assert state_key is not None
+    stats = store.get_file_stats("alice/demo", state_key)
+    assert stats is not None
+    assert_same_stats(stats, aggregate_records(refresh(repo, store, FilterStats())))
+
+    (repo_path / "pkg0" / "mod0.py").write_text("x = 1\n" * 50, encoding="utf-8")
+    (repo_path / "README.md").unlink()
+    (repo_path / "pkg0" / "new.txt").write_text("y = 2\n", encoding="utf-8")
+    repo.git.add(A=True)
+    repo.index.commit("change")
+
+    sync_filter_result(
+        repo_path, "alice/demo", store, SETTINGS, file_source=FileSource.FILESYSTEM
+    )
+    stats = store.get_file_stats("alice/demo", state_key)
+    assert stats is not None
+    expected = aggregate_records(
+        scan_repository(repo_path, filter_settings=SETTINGS, count_tokens=True)
+    )
+    assert_same_stats(stats, expected)
+    assert ".md" not in {t.extension for t in stats.extension_tokens}
+
+
+def test_files_are_listed_from_the_stored_result(
+    repo: Repo, store: FilterResultRepository
+) -> None:
+    repo_path = Path(repo.working_dir)
+    state_key = sync_filter_result(
+        repo_path, "alice/demo", store, SETTINGS, file_source=FileSource.FILESYSTEM
+    )
+    assert state_key is not None
+    (repo_path / "pkg1" / "renamed.py").write_text("z = 3\n", encoding="utf-8")
+    (repo_path / "pkg1" / "mod1.py").unlink()
+    repo.git.add(A=True)
+    repo.index.commit("rename")
+    sync_filter_result(
+        repo_path, "alice/demo", store, SETTINGS, file_source=FileSource.FILESYSTEM
+    )
+
+    pages, cursor = [], None
+    while True:
+        page, total, cursor = store.get_files(
+            "alice/demo",
+            state_key,
+            sort=FileSortKey.NAME,
+            order=SortOrder.ASC,
+            extension=".py",
+            cursor=cursor,
+            limit=3,
+        )
+        pages.extend(page)
+        if cursor is None:
+            break
+    assert total == 20
+    assert [f.name for f in pages] == sorted(f.name for f in pages)
+    assert "pkg1/renamed.py" in {f.path for f in pages}
+    assert "pkg1/mod1.py" not in {f.path for f in pages}
+
+    found, total, _ = store.get_files("alice/demo", state_key, search="README")
+    assert total == 1
+    assert (found[0].name, found[0].extension) == ("README.md", ".md")
+
+    records = sorted(refresh(repo, store, FilterStats()), key=lambda r: r.relative_path)
+    analytics = store.get_file_analytics("alice/demo", state_key)
+    assert analytics == analyze_files(
+        [r.relative_path for r in records],
+        [r.extension for r in records],
+        [r.tokens or 0 for r in records],
+        [r.size for r in records],
+    )
+
+
+def test_no_totals_for_uncommitted_changes(
+    repo: Repo, store: FilterResultRepository
+) -> None:
+    repo_path = Path(repo.working_dir)
+    (repo_path / "pkg0" / "mod0.py").write_text("changed\n", encoding="utf-8")
+    state_key = sync_filter_result(
+        repo_path, "alice/demo", store, SETTINGS, file_source=FileSource.FILESYSTEM
+    )
+    assert state_key is None
+
+
+@pytest.mark.parametrize(
+    "file_source, stored",
+    [(FileSource.FILESYSTEM, False), (FileSource.GIT_INDEX, True)],
+)
+def test_untracked_files_are_uncommitted_when_walked(
+    repo: Repo, store: FilterResultRepository, file_source: FileSource, stored: bool
+) -> None:
+    repo_path = Path(repo.working_dir)
+    (repo_path / "pkg0" / "new.py").write_text("new = 1\n", encoding="utf-8")
+    state_key = sync_filter_result(
+        repo_path, "alice/demo", store, SETTINGS, file_source=file_source
+    )
+    assert (state_key is not None) == stored
+
+
+def test_git_ignored_files_are_uncommitted_unless_excluded(repo: Repo) -> None:
+    repo_path = Path(repo.working_dir)
+    (repo_path / ".gitignore").write_text("*.gen\n*.log\nbuild/\n", encoding="utf-8")
+    repo.git.add(A=True)
+    repo.index.commit("ignore")
+    # Excluded by SETTINGS, so not walked
+    (repo_path / "debug.log").write_text("log\n", encoding="utf-8")
+    assert not has_uncommitted_changes(repo, FileSource.FILESYSTEM, SETTINGS)
+
+    # Walked, but never in a git diff
+    (repo_path / "pkg0" / "schema.gen").write_text("x = 1\n", encoding="utf-8")
+    assert has_uncommitted_changes(repo, FileSource.FILESYSTEM, SETTINGS)
+    assert not has_uncommitted_changes(repo, FileSource.GIT_INDEX, SETTINGS)
+    excluded = FilterSettings([], [".git/", "*.log", "*.gen"], 50000)
+    assert not has_uncommitted_changes(repo, FileSource.FILESYSTEM, excluded)
+
+    # Ignored directories are reported as a whole
+    (repo_path / "build").mkdir()
+    (repo_path / "build" / "out.py").write_text("y = 2\n", encoding="utf-8")
+    assert has_uncommitted_changes(repo, FileSource.FILESYSTEM, excluded)
+    excluded.exclude_patterns.append("build/")
+    assert not has_uncommitted_changes(repo, FileSource.FILESYSTEM, excluded)
@@ -0,0 +1,67 @@
+import fnmatch
+
+import pytest
+
+from repo_tool.core.matcher import CompiledFilter, PatternSet, compile_filter
+
+PATTERNS = [
+    "*.png",
+    "*.tar.gz",
+    ".git/*",
+    "*bin/*",
+    "benchmarks/**",
+    "src/main.py",
+    "docs*",
+    "*.test.ts[x]",
+    "src/**/test_?.py",
+    "LICENSE",
+]
+
+PATHS = [
+    "logo.png",
+    "assets/logo.png",
+    "release.tar.gz",
+    ".git/HEAD",
+    ".github/workflows/ci.yml",
+    "node_modules/.bin/tsc",
+    "benchmarks/run.py",
+    "src/main.py",
+    "src/main.pyc",
+    "docs/index.md",
+    "app.test.tsx",
+    "app.test.ts",
+    "src/pkg/test_a.py",
+    "src/pkg/test_ab.py",
+    "LICENSE",
+    "sub/LICENSE",
+    "README.md",
+]
+
+
+@pytest.mark.parametrize("path", PATHS)
+def test_pattern_set_matches_like_fnmatch(path: str) -> None:
+    expected = any(fnmatch.fnmatch(path, pattern) for pattern in PATTERNS)
+    assert PatternSet(PATTERNS).match(path) == expected
+
+
+def test_empty_pattern_set_matches_nothing() -> None:
+    pattern_set = PatternSet([])
+    assert not pattern_set
+    assert not pattern_set.match("README.md")
+
+
+def test_compiled_filter() -> None:
+    compiled = CompiledFilter(("src/*",), ("*.pyc", "build/"))
+    assert compiled.is_included("src/main.py")
+    assert not compiled.is_included("README.md")
+    assert compiled.is_ignored("src/main.pyc")
+    assert compiled.is_ignored("build", is_dir=True)
+    assert not compiled.is_ignored("build", is_dir=False)
+    assert compiled.should_prune("build")
+    assert not compiled.should_prune("src")
+
+
+def test_compile_filter_is_cached() -> None:
+    include = ["src/a.py", "src/b.py"]
+    exclude = ["*.png"]
+    assert compile_filter(include, exclude) is compile_filter(list(include), exclude)
@@ -1,16 +1,27 @@
 # type: ignore
+import json
 from datetime import datetime
 
 import pytest
-from sqlmodel import Session, SQLModel, create_engine
+from sqlmodel import Session, SQLModel, create_engine, select
 
 from repo_tool.api.repositories import (
     FilterSettingsRepository,
     SummaryCacheRepository,
+    SummaryCacheTable,
+    TokenCountRepository,
     get_repository_id,
 )
+from repo_tool.core.analytics import FileAnalytics, analyze_files
 from repo_tool.core.filter import FilterSettings
-from repo_tool.core.summary import FileData, FileType, Summary
+from repo_tool.core.summary import (
+    FileData,
+    FileDataColumns,
+    FileSortKey,
+    FileType,
+    SortOrder,
+    Summary,
+)
 
 
 @pytest.fixture(name="session")
@@ -271,3 +282,147 @@ class TestSummaryCacheRepository:
         for i in range(3):
             summary = summary_cache_repository.get_by_repository_id(f"test/repo{i}")
             assert summary is None
+
+    def test_file_data_is_stored_by_column(
+        self, session, summary_cache_repository, sample_summary
+    ):
+        sample_summary.file_data[0].original_tokens = 120
+        sample_summary.file_data.append(
+            FileData(name="renamed", path="/a/b.ts", extension=".ts", tokens=7)
+        )
+        summary_cache_repository.upsert(sample_summary, datetime.now().isoformat())
+
+        cache = session.exec(select(SummaryCacheTable)).one()
+        assert json.loads(cache.summary_json)["file_data"] == []
+
+        retrieved = summary_cache_repository.get_by_repository_id("test/repo")
+        assert isinstance(retrieved.file_data, FileDataColumns)
+        assert list(retrieved.file_data) == sample_summary.file_data
+        assert retrieved.file_data[-1].name == "renamed"
+        assert retrieved.file_data[:2] == sample_summary.file_data[:2]
+        assert json.loads(retrieved.to_json()) == json.loads(sample_summary.to_json())
+
+    def test_legacy_summary_json_is_read(
+        self, session, summary_cache_repository, sample_summary
+    ):
+        session.add(
+            SummaryCacheTable(
+                repository_id="test/repo",
+                summary_json=sample_summary.to_json(),
+                last_updated=datetime.now().isoformat(),
+            )
+        )
+        session.commit()
+
+        retrieved = summary_cache_repository.get_by_repository_id("test/repo")
+        assert retrieved.file_data == sample_summary.file_data
+
+    def test_files_are_paged_in_sort_order(
+        self, summary_cache_repository, sample_summary
+    ):
+        files = [
+            FileData(
+                name=f"f{i}{ext}",
+                path=f"src/{i % 3}/f{i}{ext}",
+                extension=ext,
+                tokens=i % 7,
+            )
+            for i in range(30)
+            for ext in [".py" if i % 2 else ".md"]
+        ]
+        summary_cache_repository.upsert(
+            sample_summary, datetime.now().isoformat(), files=files
+        )
+        assert summary_cache_repository.has_files("test/repo")
+
+        def read_all(**kwargs):
+            pages, cursor = [], None
+            while True:
+                page, total, cursor = summary_cache_repository.get_files(
+                    "test/repo", cursor=cursor, limit=4, **kwargs
+                )
+                pages.extend(page)
+                if cursor is None:
+                    return pages, total
+
+        by_tokens, total = read_all()
+        assert total == 30
+        assert [(f.tokens, f.path) for f in by_tokens] == sorted(
+            ((f.tokens, f.path) for f in files), reverse=True
+        )
+
+        by_name, _ = read_all(sort=FileSortKey.NAME, order=SortOrder.ASC)
+        assert [f.name for f in by_name] == sorted(f.name for f in files)
+
+        filtered, total = read_all(extension=".py", search="SRC/1/")
+        expected = [f for f in files if f.extension == ".py" and "src/1/" in f.path]
+        assert total == len(expected)
+        assert sorted(f.path for f in filtered) == sorted(f.path for f in expected)
+
+        assert summary_cache_repository.get_files("test/repo", search="%")[1] == 0
+
+    def test_cursor_of_another_sort_order_is_rejected(
+        self, summary_cache_repository, sample_summary
+    ):
+        summary_cache_repository.upsert(
+            sample_summary, datetime.now().isoformat(), files=sample_summary.file_data
+        )
+        _, _, cursor = summary_cache_repository.get_files("test/repo", limit=1)
+        with pytest.raises(ValueError):
+            summary_cache_repository.get_files(
+                "test/repo", sort=FileSortKey.PATH, cursor=cursor
+            )
+        with pytest.raises(ValueError):
+            summary_cache_repository.get_files("test/repo", cursor="not a cursor")
+
+        summary_cache_repository.delete_by_repository_id("test/repo")
+        assert not summary_cache_repository.has_files("test/repo")
+
+    def test_analytics_are_stored_with_the_summary(
+        self, summary_cache_repository, sample_summary
+    ):
+        assert summary_cache_repository.get_analytics_json("test/repo") is None
+        analytics = analyze_files(["a/b.py"], [".py"], [10], [40])
+        summary_cache_repository.upsert(
+            sample_summary, datetime.now().isoformat(), analytics=analytics
+        )
+
+        stored = summary_cache_repository.get_analytics_json("test/repo")
+        assert FileAnalytics.from_json(stored) == analytics
+
+        # They only hold for the summary they were stored with
+        summary_cache_repository.upsert(sample_summary, datetime.now().isoformat())
+        assert summary_cache_repository.get_analytics_json("test/repo") is None
+        stored = summary_cache_repository.put_analytics("test/repo", analytics)
+        assert summary_cache_repository.get_analytics_json("test/repo") == stored
+
+        summary_cache_repository.delete_by_repository_id("test/repo")
+        assert summary_cache_repository.get_analytics_json("test/repo") is None
+
+
+class TestTokenCountRepository:
+    def test_put_and_get_many(self, session):
+        repository = TokenCountRepository(session)
+        repository.put_many({"a" * 40: 10, "b" * 40: 20}, "o200k_base")
+
+        counts = repository.get_many(["a" * 40, "b" * 40, "c" * 40], "o200k_base")
+        assert counts == {"a" * 40: 10, "b" * 40: 20}
+        assert repository.get_many(["a" * 40], "cl100k_base") == {}
+
+    def test_put_existing_is_ignored(self, session):
+        repository = TokenCountRepository(session)
+        repository.put_many({"a" * 40: 10}, "o200k_base")
+        repository.put_many({"a" * 40: 10}, "o200k_base")
+        assert repository.count() == 1
+
+    def test_evicts_least_recently_used(self, session):
+        repository = TokenCountRepository(session, max_entries=2)
+        repository.put_many({"a" * 40: 1}, "o200k_base")
+        repository.put_many({"b" * 40: 2}, "o200k_base")
+        # Touch "a" so that "b" becomes the least recently used entry
+        repository.touch_many(["a" * 40], "o200k_base")
+        repository.put_many({"c" * 40: 3}, "o200k_base")
+
+        assert repository.count() == 2
+        counts = repository.get_many(["a" * 40, "b" * 40, "c" * 40], "o200k_base")
+        assert counts == {"a" * 40: 1, "c" * 40: 3}
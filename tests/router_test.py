@@ -1,24 +1,35 @@
+import io
+import json
+import os
 import shutil
 import tempfile
+import zipfile
 from pathlib import Path
-from typing import Generator
+from typing import Dict, Generator, Optional, Tuple, Union, cast
 
 import pytest
 from fastapi import FastAPI
 from fastapi.testclient import TestClient
+from git import Repo
 from sqlalchemy import create_engine
 from sqlmodel import Session, SQLModel
 
 from repo_tool.api.database import get_session
 from repo_tool.api.repositories import FilterSettingsRepository, SummaryCacheRepository
-from repo_tool.api.router import get_github, router
+from repo_tool.api.router import get_artifact_store, get_github, router
+from repo_tool.core.artifacts import ArtifactStore
 from repo_tool.core.github import GitHub
+from repo_tool.core.split import INDEX_NAME, PART_OVERHEAD
 
 test_repo_url = "https://github.com/HirotoShioi/query-cache"
 repo_id = "HirotoShioi/query-cache"
 repo_name = "query-cache"
 author = "HirotoShioi"
 
+local_author = "alice"
+local_name = "demo"
+local_url = f"https://github.com/{local_author}/{local_name}"
+
 
 @pytest.fixture(name="session")
 def session_fixture() -> Generator[Session, None, None]:
@@ -68,7 +79,7 @@ def reset_github(github_dir: Path) -> Generator[None, None, None]:
 
 @pytest.fixture(name="client")
 def client_fixture(
-    session: Session, github: GitHub
+    session: Session, github: GitHub, tmp_path: Path
 ) -> Generator[TestClient, None, None]:
     """Create a new FastAPI test client with the in-memory database."""
     app = FastAPI()
@@ -77,10 +88,31 @@ def client_fixture(
     # Override the GitHub dependency with our temporary directory instance
     app.dependency_overrides[get_github] = lambda: github
     app.dependency_overrides[get_session] = lambda: session
+    app.dependency_overrides[get_artifact_store] = lambda: ArtifactStore(
+        tmp_path / "artifacts"
+    )
     yield TestClient(app)
     app.dependency_overrides.clear()
 
 
+@pytest.fixture(name="local_repo")
+def local_repo_fixture(github_dir: Path) -> Repo:
+    """Creates a cloned repository in the GitHub directory without the network"""
+    repo_path = github_dir / local_author / local_name
+    (repo_path / "src").mkdir(parents=True)
+    repo = Repo.init(repo_path)
+    (repo_path / "README.md").write_text("# Demo\n\nhello\n")
+    for i in range(12):
+        (repo_path / "src" / f"mod{i}.py").write_text(
+            f"def f{i}():\n    return {i}\n" * (i + 1)
+        )
+    (repo_path / "src" / "notes.txt").write_text("notes\n")
+    repo.git.add(A=True)
+    repo.index.commit("init")
+    repo.create_remote("origin", local_url)
+    return repo
+
+
 def test_get_repositories_empty(client: TestClient) -> None:
     response = client.get("/repositories")
     assert response.status_code == 200
@@ -559,3 +591,269 @@ def test_get_repository_digest_default_format(
     assert "author" in content
     assert "files" in content
     assert isinstance(content["files"], list)
+
+
+def test_digest_index_locates_each_section(
+    client: TestClient, local_repo: Repo
+) -> None:
+    text = client.get(
+        f"/repositories/{local_author}/{local_name}/digest",
+        headers={"Accept": "text/plain"},
+    ).content
+
+    response = client.get(f"/repositories/{local_author}/{local_name}/digest/index")
+    assert response.status_code == 200
+    index = response.json()
+    assert "src/mod3.py" in index
+    offset, length = index["src/mod3.py"]
+    section = text[offset : offset + length].decode()
+    assert "src/mod3.py" in section
+    assert "return 3" in section
+
+
+def test_digest_range_is_served_uncompressed(
+    client: TestClient, local_repo: Repo
+) -> None:
+    index = client.get(f"/repositories/{local_author}/{local_name}/digest/index").json()
+    offset, length = index["src/mod5.py"]
+
+    response = client.get(
+        f"/repositories/{local_author}/{local_name}/digest",
+        headers={
+            "Accept": "text/plain",
+            "Accept-Encoding": "gzip",
+            "Range": f"bytes={offset}-{offset + length - 1}",
+        },
+    )
+    assert response.status_code == 206
+    assert "content-encoding" not in response.headers
+    sections = client.get(
+        f"/repositories/{local_author}/{local_name}/digest/sections",
+        params={"path": ["src/mod5.py"]},
+    )
+    assert response.content == sections.content
+    assert "return 5" in response.text
+
+
+def test_digest_sections(client: TestClient, local_repo: Repo) -> None:
+    url = f"/repositories/{local_author}/{local_name}/digest/sections"
+
+    response = client.get(url, params={"path": ["src/mod2.py", "README.md"]})
+    assert response.status_code == 200
+    assert response.text.index("src/mod2.py") < response.text.index("README.md")
+
+    response = client.get(url, params={"path": ["src/mod2.py", "missing.py"]})
+    assert response.status_code == 404
+    assert "missing.py" in response.json()["detail"]
+
+
+def test_digest_sections_of_uncommitted_changes(
+    client: TestClient, local_repo: Repo
+) -> None:
+    url = f"/repositories/{local_author}/{local_name}/digest/sections"
+    client.get(url, params={"path": ["src/mod1.py"]})
+    (Path(local_repo.working_dir) / "src" / "mod1.py").write_text("changed = 1\n")
+
+    response = client.get(url, params={"path": ["src/mod1.py"]})
+    assert response.status_code == 200
+    assert "changed = 1" in response.text
+    index = client.get(f"/repositories/{local_author}/{local_name}/digest/index")
+    assert index.status_code == 409
+
+
+class EvictingArtifactStore(ArtifactStore):
+    """Evicts each digest right after its index is read, as a concurrent writer"""
+
+    def get_index(self, key: str) -> Optional[Dict[str, Tuple[int, int]]]:
+        index = super().get_index(key)
+        if index is not None:
+            self.path(key).unlink()
+        return index
+
+
+def test_digest_sections_after_eviction(
+    client: TestClient, local_repo: Repo, tmp_path: Path
+) -> None:
+    url = f"/repositories/{local_author}/{local_name}/digest/sections"
+    assert client.get(url, params={"path": ["README.md"]}).status_code == 200
+
+    app = cast(FastAPI, client.app)
+    app.dependency_overrides[get_artifact_store] = lambda: EvictingArtifactStore(
+        tmp_path / "artifacts"
+    )
+    response = client.get(url, params={"path": ["README.md"]})
+    assert response.status_code == 503
+
+
+def test_files_are_paged_sorted_and_filtered(
+    client: TestClient, local_repo: Repo
+) -> None:
+    url = f"/repositories/{local_author}/{local_name}/files"
+
+    paths = []
+    params: Dict[str, Union[str, int]] = {"sort": "path", "order": "asc", "limit": 5}
+    while True:
+        response = client.get(url, params=params)
+        assert response.status_code == 200
+        page = response.json()
+        assert len(page["files"]) <= 5
+        paths.extend(file["path"] for file in page["files"])
+        if page["next_cursor"] is None:
+            break
+        params["cursor"] = page["next_cursor"]
+    assert page["total"] == len(paths)
+    assert paths == sorted(paths)
+    assert {"README.md", "src/mod0.py", "src/mod11.py"} <= set(paths)
+
+    files = client.get(url, params={"sort": "tokens", "order": "desc"}).json()
+    tokens = [file["tokens"] for file in files["files"]]
+    assert tokens == sorted(tokens, reverse=True)
+    assert files["files"][0]["path"] == "src/mod11.py"
+
+    python = client.get(url, params={"extension": ".py", "limit": 100}).json()
+    assert python["total"] == 12
+    assert all(file["extension"] == ".py" for file in python["files"])
+
+    found = client.get(
+        url, params={"search": "MOD1", "sort": "path", "order": "asc"}
+    ).json()
+    assert [file["path"] for file in found["files"]] == [
+        "src/mod1.py",
+        "src/mod10.py",
+        "src/mod11.py",
+    ]
+
+    # A cursor only continues the sort order it was made for
+    response = client.get(url, params={"sort": "tokens", "cursor": params["cursor"]})
+    assert response.status_code == 400
+
+
+def test_digest_is_not_modified_until_the_next_commit(
+    client: TestClient, local_repo: Repo
+) -> None:
+    url = f"/repositories/{local_author}/{local_name}/digest"
+    headers = {"Accept": "text/plain"}
+    response = client.get(url, headers=headers)
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+
+    response = client.get(url, headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+    assert response.content == b""
+
+    (Path(local_repo.working_dir) / "README.md").write_text("# Demo\n\nchanged\n")
+    local_repo.index.add(["README.md"])
+    local_repo.index.commit("change")
+    response = client.get(url, headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+    assert "changed" in response.text
+
+
+def test_digest_encoding_follows_accept_encoding(
+    client: TestClient, local_repo: Repo
+) -> None:
+    url = f"/repositories/{local_author}/{local_name}/digest"
+    plain = client.get(
+        url, headers={"Accept": "text/plain", "Accept-Encoding": "identity"}
+    )
+    assert "content-encoding" not in plain.headers
+
+    # The first response is streamed while it is stored, the second one is read
+    # from the stored variant
+    for _ in range(2):
+        compressed = client.get(
+            url, headers={"Accept": "text/plain", "Accept-Encoding": "gzip"}
+        )
+        assert compressed.headers["content-encoding"] == "gzip"
+        assert compressed.headers["vary"] == "Accept-Encoding"
+        assert compressed.headers["etag"] != plain.headers["etag"]
+        assert compressed.content == plain.content
+
+    refused = client.get(
+        url, headers={"Accept": "text/plain", "Accept-Encoding": "gzip;q=0"}
+    )
+    assert "content-encoding" not in refused.headers
+    assert refused.headers["etag"] == plain.headers["etag"]
+
+
+def test_digest_is_split_into_a_zip_by_token_budget(
+    client: TestClient, local_repo: Repo
+) -> None:
+    response = client.post(
+        "/digest", json={"url": local_url, "token_budget": PART_OVERHEAD + 100}
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/zip"
+    assert "content-encoding" not in response.headers
+    assert response.headers["content-disposition"] == (
+        f'attachment; filename="{local_name}_digest.zip"'
+    )
+
+    archive = zipfile.ZipFile(io.BytesIO(response.content))
+    names = archive.namelist()
+    assert names[0] == INDEX_NAME
+    parts = names[1:]
+    assert len(parts) > 1
+    text = "".join(archive.read(name).decode() for name in parts)
+    for i in range(12):
+        assert f"src/mod{i}.py" in text
+
+    response = client.post("/digest", json={"url": local_url, "token_budget": 1})
+    assert response.status_code == 400
+
+
+def test_digest_pages_follow_the_cursor(
+    client: TestClient, local_repo: Repo, tmp_path: Path
+) -> None:
+    url = f"/repositories/{local_author}/{local_name}/digest"
+    everything = client.get(url).json()
+    assert everything["next_cursor"] is None
+    all_paths = [file["path"] for file in everything["files"]]
+    artifacts = sorted(os.listdir(tmp_path / "artifacts"))
+
+    for page_params in ({"limit": 5}, {"max_bytes": 1}):
+        paths = []
+        params: Dict[str, Union[str, int]] = dict(page_params)
+        while True:
+            response = client.get(url, params=params)
+            assert response.status_code == 200
+            page = response.json()
+            if "max_bytes" in params:
+                # A page holds at least one file, even over max_bytes
+                assert len(page["files"]) == 1
+            paths.extend(file["path"] for file in page["files"])
+            if page["next_cursor"] is None:
+                break
+            params["cursor"] = page["next_cursor"]
+        assert paths == sorted(all_paths)
+
+    response = client.get(url, params={"cursor": "not a cursor!"})
+    assert response.status_code == 400
+
+    # Pages are not stored, so they do not evict the whole digests, but they
+    # are still validated by their ETag
+    assert sorted(os.listdir(tmp_path / "artifacts")) == artifacts
+    page = client.get(url, params={"limit": 5})
+    response = client.get(
+        url, params={"limit": 5}, headers={"If-None-Match": page.headers["etag"]}
+    )
+    assert response.status_code == 304
+
+
+def test_digest_is_streamed_as_ndjson(client: TestClient, local_repo: Repo) -> None:
+    url = f"/repositories/{local_author}/{local_name}/digest"
+    everything = client.get(url).json()
+
+    response = client.get(url, headers={"Accept": "application/x-ndjson"})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = response.text.splitlines()
+    files = [json.loads(line) for line in lines]
+    assert files == everything["files"]
+
+    response = client.get(
+        url, headers={"Accept": "application/x-ndjson"}, params={"limit": 2}
+    )
+    assert [json.loads(line) for line in response.text.splitlines()] == files[:2]
@@ -0,0 +1,187 @@
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List
+
+import pytest
+from git import Repo
+
+from repo_tool.core.digest import digest_from_records, generate_digest_content
+from repo_tool.core.filter import (
+    FileSource,
+    FilterSettings,
+    iter_scan_repository,
+    scan_repository,
+)
+from repo_tool.core.scan import (
+    FilterStats,
+    decode_text,
+    iter_scan_files,
+    iter_with_content,
+    iter_with_content_ahead,
+)
+from repo_tool.core.summary import aggregate_records, top_files
+from repo_tool.core.token_cache import TokenCache
+from repo_tool.core.tokens import encoding
+
+
+def test_decode_text_translates_line_endings() -> None:
+    assert decode_text(b"a\r\nb\rc\n") == "a\nb\nc\n"
+
+
+def test_scan_repository_reads_each_file_once(
+    repo_path: Path, count_reads: Callable[[], List[str]]
+) -> None:
+    reads = count_reads()
+    stats = FilterStats()
+    records = scan_repository(
+        repo_path,
+        filter_settings=FilterSettings([], [], 50000),
+        stats=stats,
+        file_source=FileSource.FILESYSTEM,
+        count_tokens=True,
+        keep_content=True,
+    )
+
+    assert sorted(reads) == ["README.md", "empty.py", "main.py"]
+    assert stats.binary_files == 1
+    assert [record.relative_path for record in records] == [
+        "README.md",
+        "src/empty.py",
+        "src/main.py",
+    ]
+    for record in records:
+        assert record.content is not None
+        assert record.tokens == len(encoding.encode_ordinary(record.content))
+        assert record.blob_sha is not None
+
+
+def test_scan_repository_skips_reads_decided_by_size(
+    repo_path: Path, count_reads: Callable[[], List[str]]
+) -> None:
+    reads = count_reads()
+    records = scan_repository(
+        repo_path,
+        filter_settings=FilterSettings([], [], 50000),
+        file_source=FileSource.FILESYSTEM,
+    )
+
+    assert reads == []
+    assert all(record.tokens is None for record in records)
+
+
+class CountingStore:
+    """Token count store that records its calls"""
+
+    def __init__(self) -> None:
+        self.counts: Dict[str, int] = {}
+        self.lookups = 0
+        self.touched: List[str] = []
+
+    def get_many(self, blob_shas: Iterable[str], encoding_name: str) -> Dict[str, int]:
+        self.lookups += 1
+        return {sha: self.counts[sha] for sha in blob_shas if sha in self.counts}
+
+    def put_many(self, counts: Dict[str, int], encoding_name: str) -> None:
+        self.counts.update(counts)
+
+    def touch_many(self, blob_shas: Iterable[str], encoding_name: str) -> None:
+        self.touched.extend(blob_shas)
+
+
+@pytest.mark.parametrize("file_source", [FileSource.FILESYSTEM, FileSource.GIT_INDEX])
+def test_warm_scan_looks_up_cached_counts_together(
+    tmp_path: Path, file_source: FileSource
+) -> None:
+    for i in range(40):
+        (tmp_path / f"mod{i}.py").write_text(f"value = {i}\n" * 3, encoding="utf-8")
+    Repo.init(tmp_path).git.add(A=True)
+    settings = FilterSettings([], [".git/"], 1000)
+    store = CountingStore()
+    cold = scan_repository(
+        tmp_path,
+        filter_settings=settings,
+        token_cache=TokenCache(store),
+        file_source=file_source,
+        count_tokens=True,
+    )
+
+    store.lookups = 0
+    stats = FilterStats()
+    warm = scan_repository(
+        tmp_path,
+        filter_settings=settings,
+        stats=stats,
+        token_cache=TokenCache(store),
+        file_source=file_source,
+        count_tokens=True,
+    )
+    assert [r.tokens for r in warm] == [r.tokens for r in cold]
+    assert stats.encodes == 0
+    assert store.lookups == 1
+    assert sorted(store.touched) == sorted(store.counts)
+
+
+def test_records_build_the_same_digest_and_summary(repo_path: Path) -> None:
+    records = scan_repository(
+        repo_path,
+        filter_settings=FilterSettings([], [], 50000),
+        file_source=FileSource.FILESYSTEM,
+        count_tokens=True,
+        keep_content=True,
+    )
+    paths = [record.path for record in records]
+    assert digest_from_records(records) == generate_digest_content(repo_path, paths)
+
+    file_stats = aggregate_records(records)
+    assert file_stats.file_count == 3
+    assert file_stats.context_length == sum(record.tokens or 0 for record in records)
+    assert top_files(file_stats.file_data, 1)[0].path == "src/main.py"
+
+
+def test_iter_scan_repository_yields_before_the_walk_ends(tmp_path: Path) -> None:
+    for i in range(10):
+        (tmp_path / f"file{i}.py").write_text(f"print({i})\n", encoding="utf-8")
+
+    stats = FilterStats()
+    records = iter_scan_repository(
+        tmp_path,
+        filter_settings=FilterSettings([], [], 50000),
+        stats=stats,
+        file_source=FileSource.FILESYSTEM,
+    )
+    first = next(records)
+    assert first.relative_path == "file0.py"
+    assert stats.files_checked == 1
+
+
+def test_iter_scan_files_keeps_order_with_pending_batches(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr("repo_tool.core.scan.MAX_QUEUED_RECORDS", 3)
+    files = []
+    for i in range(10):
+        file_path = tmp_path / f"file{i}.py"
+        file_path.write_text("x = 1\n" * i, encoding="utf-8")
+        files.append(file_path)
+
+    records = list(iter_scan_files(files, tmp_path, [], [], 50000, count_tokens=True))
+    assert [record.path for record in records] == files
+    assert all(record.tokens is not None for record in records)
+
+
+def test_iter_with_content_ahead_keeps_order_and_bounds_reads(
+    tmp_path: Path, count_reads: Callable[[], List[str]]
+) -> None:
+    for i in range(20):
+        (tmp_path / f"file{i:02d}.py").write_text(f"print({i})\n", encoding="utf-8")
+    records = scan_repository(
+        tmp_path,
+        filter_settings=FilterSettings([], [], 50000),
+        file_source=FileSource.FILESYSTEM,
+    )
+    expected = [record.content for record in iter_with_content(records)]
+
+    reads = count_reads()
+    contents = iter_with_content_ahead(records, read_ahead=4)
+    assert next(contents).content == expected[0]
+    assert len(reads) <= 4
+    assert [record.content for record in contents] == expected[1:]
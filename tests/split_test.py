@@ -0,0 +1,142 @@
+import io
+import zipfile
+from pathlib import Path
+from typing import List
+
+import pytest
+
+from repo_tool.core.scan import FileRecord
+from repo_tool.core.split import (
+    INDEX_NAME,
+    PART_OVERHEAD,
+    DigestSection,
+    generate_digest_parts,
+    iter_zip,
+    part_name,
+    plan_digest_parts,
+    section_overhead,
+    split_content,
+)
+from repo_tool.core.tokens import encoding
+
+BUDGET = 1000
+
+
+def make_files(tmp_path: Path, sizes: List[int]) -> List[Path]:
+    files = []
+    for i, lines in enumerate(sizes):
+        file_path = tmp_path / f"file{i}.py"
+        file_path.write_text(f"value_{i} = {i}\n" * lines, encoding="utf-8")
+        files.append(file_path)
+    return files
+
+
+def record(relative_path: str, tokens: int) -> FileRecord:
+    return FileRecord(
+        path=Path(relative_path),
+        relative_path=relative_path,
+        size=tokens,
+        extension=".py",
+        tokens=tokens,
+    )
+
+
+def test_plan_keeps_order_and_only_splits_oversized_files() -> None:
+    records = [record("a.py", 400), record("b.py", 400), record("c.py", 5000)]
+    records.append(record("d.py", 10))
+    parts = plan_digest_parts(records, BUDGET)
+
+    labels = [[section.label for section in part.sections] for part in parts]
+    assert labels[0] == ["a.py"]
+    assert labels[1] == ["b.py"]
+    assert all(label[0].startswith("c.py (piece ") for label in labels[2:-1])
+    assert labels[-1] == ["d.py"]
+    assert sum(part.tokens for part in parts[2:-1]) >= 5000
+
+
+def test_plan_requires_token_counts() -> None:
+    with pytest.raises(ValueError):
+        plan_digest_parts([record("a.py", 1)], 10)
+    missing = record("a.py", 1)
+    missing.tokens = None
+    with pytest.raises(ValueError):
+        plan_digest_parts([missing], BUDGET)
+
+
+def test_split_content_keeps_everything() -> None:
+    content = "short\n" * 10 + "x" * 100 + "\n"
+    pieces = split_content(content, 4)
+    assert len(pieces) == 4
+    assert "".join(pieces) == content
+
+
+def test_pieces_of_mixed_density_stay_under_the_budget(tmp_path: Path) -> None:
+    # The first half of the lines has few tokens per character and the second
+    # half many, so pieces of the same length would not fit
+    file_path = tmp_path / "mixed.py"
+    content = (" " * 80 + "x\n") * 200 + "1;2,3.4!5?6:7\n" * 200
+    file_path.write_text(content, encoding="utf-8")
+    tokens = len(encoding.encode_ordinary(content))
+    label = DigestSection(record("mixed.py", tokens), 99999, 99999).label
+    budget = PART_OVERHEAD + section_overhead(label) + tokens * 6 // 10
+    parts = generate_digest_parts(tmp_path, [file_path], budget)
+
+    assert list(parts) == [INDEX_NAME, part_name(1, 2), part_name(2, 2)]
+    for name in list(parts)[1:]:
+        assert len(encoding.encode_ordinary(parts[name])) <= budget
+
+
+def test_split_file_is_encoded_once_for_all_its_pieces(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    calls: List[int] = []
+
+    def counting_split_content(content: str, pieces: int) -> List[str]:
+        calls.append(pieces)
+        return split_content(content, pieces)
+
+    monkeypatch.setattr("repo_tool.core.split.split_content", counting_split_content)
+    files = make_files(tmp_path, [5, 400, 5])
+    parts = generate_digest_parts(tmp_path, files, BUDGET)
+
+    assert len(calls) == 1
+    assert calls[0] == len(parts) - 3
+    pieces = [
+        text
+        for text in parts.values()
+        if "file1.py (piece " in text and "value_1 = 1" in text
+    ]
+    assert len(pieces) == calls[0]
+
+
+def test_generate_digest_parts_stay_under_the_budget(tmp_path: Path) -> None:
+    files = make_files(tmp_path, [5, 20, 10, 3, 15])
+    parts = generate_digest_parts(tmp_path, files, BUDGET)
+
+    names = list(parts)
+    assert names[0] == INDEX_NAME
+    assert len(names) > 2
+    for name in names[1:]:
+        assert len(encoding.encode_ordinary(parts[name])) <= BUDGET
+    for file_path in files:
+        assert f"  {file_path.name}\n" in parts[INDEX_NAME]
+    assert parts[names[-1]].endswith("--END--")
+
+
+def test_iter_zip(tmp_path: Path) -> None:
+    files = [("a.txt", iter(["hello ", "world"])), ("b.txt", iter([]))]
+    archive = zipfile.ZipFile(io.BytesIO(b"".join(iter_zip(files))))
+    assert archive.namelist() == ["a.txt", "b.txt"]
+    assert archive.read("a.txt") == b"hello world"
+    assert archive.read("b.txt") == b""
+
+
+def test_generate_digest_parts_with_transforms(tmp_path: Path) -> None:
+    file_path = tmp_path / "spaced.py"
+    file_path.write_text("a = 1    \n\n\n\n" * 50, encoding="utf-8")
+    parts = generate_digest_parts(
+        tmp_path, [file_path], BUDGET, ["collapse_whitespace"]
+    )
+
+    assert "a = 1\n\na = 1\n" in parts[part_name(1, 1)]
+    assert "    \n" not in parts[part_name(1, 1)]
@@ -0,0 +1,159 @@
+import asyncio
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Sequence
+
+import pytest
+
+from repo_tool.core.summary import FileInfo, process_files, top_files
+from repo_tool.core.token_cache import TokenCache, git_blob_sha
+from repo_tool.core.tokens import (
+    BatchTokenizer,
+    TokenCounter,
+    count_file_tokens,
+    encoding,
+    find_safe_boundary,
+)
+
+SOURCE = (
+    "import os\n"
+    "\n"
+    "def main() -> None:\n"
+    "    print('hello world')  # say hello\n"
+    "    return None\n"
+    "}\n"
+    "// comment\n"
+    "123 numbers\n"
+    "\n\n\n"
+    "trailing words without newline"
+)
+
+
+def test_find_safe_boundary() -> None:
+    assert find_safe_boundary("a\nb") == 2
+    assert find_safe_boundary("a\n    b") == -1
+    assert find_safe_boundary("a\n") == -1
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 32, 1024])
+def test_count_file_tokens_matches_full_encode(tmp_path: Path, chunk_size: int) -> None:
+    file_path = tmp_path / "main.py"
+    file_path.write_text(SOURCE * 20, encoding="utf-8")
+
+    expected = len(encoding.encode_ordinary(SOURCE * 20))
+    assert count_file_tokens(file_path, chunk_size=chunk_size) == expected
+
+
+def test_count_file_tokens_stops_at_limit(tmp_path: Path) -> None:
+    file_path = tmp_path / "generated.txt"
+    file_path.write_text("word\n" * 100_000, encoding="utf-8")
+
+    tokens = count_file_tokens(file_path, limit=100, chunk_size=64)
+    assert 100 <= tokens < 200
+
+
+def test_token_counter_ignores_input_after_limit() -> None:
+    counter = TokenCounter(limit=5)
+    counter.feed("one\ntwo\nthree\nfour\nfive\nsix\n")
+    counter.feed("seven\n")
+    assert counter.exceeded
+    assert counter.finish() >= 5
+
+
+def test_batch_tokenizer_matches_single_encodes() -> None:
+    texts = [SOURCE * i for i in range(10)]
+    tokenizer = BatchTokenizer(num_threads=2, batch_size_budget=len(SOURCE) * 8)
+
+    counts = tokenizer.count_tokens(texts)
+    assert counts == [len(encoding.encode_ordinary(text)) for text in texts]
+    assert tokenizer.stats.texts == len(texts)
+    assert tokenizer.stats.batches > 1
+
+
+def test_batch_tokenizer_streams_large_files(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr("repo_tool.core.tokens.STREAMING_THRESHOLD", len(SOURCE) * 4)
+    paths = []
+    for i in (1, 8, 2):
+        file_path = tmp_path / f"file{i}.py"
+        file_path.write_text(SOURCE * i, encoding="utf-8")
+        paths.append(file_path)
+
+    tokenizer = BatchTokenizer(num_threads=2)
+    counts = tokenizer.count_file_tokens(paths)
+    assert counts == [len(encoding.encode_ordinary(SOURCE * i)) for i in (1, 8, 2)]
+    # Only the two small files were encoded as a batch
+    assert tokenizer.stats.texts == 2
+
+
+def test_git_blob_sha_matches_git(tmp_path: Path) -> None:
+    file_path = tmp_path / "hello.txt"
+    file_path.write_bytes(b"hello\n")
+    # git hash-object hello.txt
+    assert git_blob_sha(file_path) == "ce013625030ba8dba906f756967f9e9ca394464a"
+
+
+def test_warm_token_cache_needs_no_encodes(tmp_path: Path) -> None:
+    class MemoryStore:
+        def __init__(self) -> None:
+            self.counts: Dict[str, int] = {}
+
+        def get_many(
+            self, blob_shas: Iterable[str], encoding_name: str
+        ) -> Dict[str, int]:
+            return {sha: self.counts[sha] for sha in blob_shas if sha in self.counts}
+
+        def put_many(self, counts: Dict[str, int], encoding_name: str) -> None:
+            self.counts.update(counts)
+
+        def touch_many(self, blob_shas: Iterable[str], encoding_name: str) -> None:
+            pass
+
+    for i in range(5):
+        (tmp_path / f"file{i}.py").write_text(SOURCE * (i + 1), encoding="utf-8")
+    file_infos = [FileInfo(path, tmp_path) for path in sorted(tmp_path.iterdir())]
+
+    store = MemoryStore()
+    cold_cache = TokenCache(store)
+    cold = asyncio.run(process_files(file_infos, cold_cache))
+    assert cold_cache.misses == 5
+
+    warm_cache = TokenCache(store)
+    warm = asyncio.run(process_files(file_infos, warm_cache))
+    assert warm_cache.misses == 0
+    assert warm.context_length == cold.context_length
+
+
+def test_process_files_reads_once_and_tokenizes_in_batches(
+    tmp_path: Path, count_reads: Callable[[], List[str]]
+) -> None:
+    class CountingTokenizer(BatchTokenizer):
+        def __init__(self) -> None:
+            super().__init__()
+            self.calls = 0
+
+        def count_tokens(self, texts: Sequence[str]) -> List[int]:
+            self.calls += 1
+            return super().count_tokens(texts)
+
+    expected = {}
+    for i in range(40):
+        text = SOURCE * (i % 7 + 1) + f"\r\nfile {i}\n"
+        (tmp_path / f"file{i:02d}.py").write_text(text, encoding="utf-8")
+        expected[f"file{i:02d}.py"] = len(
+            encoding.encode_ordinary(text.replace("\r\n", "\n"))
+        )
+    (tmp_path / "image.png").write_bytes(b"\x89PNG\r\n\x1a\n\x00\x00")
+    file_infos = [FileInfo(path, tmp_path) for path in sorted(tmp_path.iterdir())]
+
+    reads = count_reads()
+    tokenizer = CountingTokenizer()
+    stats = asyncio.run(process_files(file_infos, tokenizer=tokenizer))
+
+    assert {d.path: d.tokens for d in stats.file_data} == expected
+    assert stats.context_length == sum(expected.values())
+    top = top_files(stats.file_data, 5)
+    assert [d.tokens for d in top] == sorted(expected.values(), reverse=True)[:5]
+    # The content read for the blob SHA is tokenized without a second read
+    assert sorted(reads) == sorted(expected)
+    assert tokenizer.calls == 1
@@ -0,0 +1,125 @@
+from pathlib import Path
+
+import pytest
+
+from repo_tool.core.scan import FileRecord
+from repo_tool.core.summary import aggregate_records
+from repo_tool.core.tokens import encoding
+from repo_tool.core.transforms import (
+    MAX_LINE_CHARS,
+    apply_transforms,
+    iter_transformed,
+    normalize_transforms,
+    transform_content,
+)
+
+PYTHON_FILE = """#!/usr/bin/env python
+# Copyright (c) 2024 Example
+# Licensed under the MIT License
+
+# Entry point
+def main() -> None:  # keep this
+    print("# not a comment")
+
+
+
+    return None
+"""
+
+C_FILE = """/*
+ * SPDX-License-Identifier: Apache-2.0
+ */
+#include <stdio.h>
+
+/* helper */
+int x = 1; /* trailing */
+/* a */ int y = 2;
+// line comment
+"""
+
+
+def record(relative_path: str, content: str) -> FileRecord:
+    return FileRecord(
+        path=Path(relative_path),
+        relative_path=relative_path,
+        size=len(content),
+        extension=Path(relative_path).suffix,
+        content=content,
+    )
+
+
+def test_drop_license_header_keeps_shebang_and_code() -> None:
+    result = transform_content(PYTHON_FILE, ".py", ["drop_license_header"])
+    assert result.startswith("#!/usr/bin/env python\ndef main()")
+    assert "Copyright" not in result
+
+
+def test_drop_license_header_keeps_other_headers() -> None:
+    content = "# Helpers for the tests\n\nimport os\n"
+    assert transform_content(content, ".py", ["drop_license_header"]) == content
+    c_result = transform_content(C_FILE, ".c", ["drop_license_header"])
+    assert c_result.startswith("#include <stdio.h>\n")
+
+
+def test_strip_comments_only_removes_whole_line_comments() -> None:
+    result = transform_content(PYTHON_FILE, ".py", ["strip_comments"])
+    assert result.startswith("#!/usr/bin/env python\n\ndef main() -> None:  # keep")
+    assert 'print("# not a comment")' in result
+
+    c_result = transform_content(C_FILE, ".c", ["strip_comments"])
+    assert c_result == (
+        "#include <stdio.h>\n\nint x = 1; /* trailing */\n/* a */ int y = 2;\n"
+    )
+
+
+def test_code_after_the_end_of_a_block_comment_is_kept() -> None:
+    content = "/* setup\n * runs once\n */ init();\nint z = 3;\n/* done */\n"
+    assert transform_content(content, ".c", ["strip_comments"]) == (
+        " */ init();\nint z = 3;\n"
+    )
+
+    header = "/*\n * Copyright 2024 Example\n */ start();\nrun();\n"
+    assert transform_content(header, ".c", ["drop_license_header"]) == (
+        " */ start();\nrun();\n"
+    )
+
+
+def test_collapse_whitespace_and_truncate() -> None:
+    content = "a = 1   \n\n\n\n" + "x" * (MAX_LINE_CHARS * 2) + "\n"
+    result = transform_content(
+        content, ".py", ["truncate_data_literals", "collapse_whitespace"]
+    )
+    lines = result.splitlines()
+    assert lines[:2] == ["a = 1", ""]
+    assert len(lines[2]) < MAX_LINE_CHARS + 50
+    assert lines[2].endswith(f"({MAX_LINE_CHARS} characters truncated)")
+
+
+def test_unknown_transform_is_rejected() -> None:
+    with pytest.raises(ValueError):
+        normalize_transforms(["minify"])
+    order = normalize_transforms(["collapse_whitespace", "drop_license_header"])
+    assert order == ["drop_license_header", "collapse_whitespace"]
+
+
+def test_transformed_tokens_are_reported_in_the_summary() -> None:
+    records = [record("main.py", PYTHON_FILE), record("empty.py", "")]
+    transformed = list(
+        iter_transformed(records, ["drop_license_header", "collapse_whitespace"])
+    )
+    main = transformed[0]
+    assert main.original_tokens == len(encoding.encode_ordinary(PYTHON_FILE))
+    assert main.tokens == len(encoding.encode_ordinary(main.content or ""))
+    assert main.tokens < main.original_tokens
+
+    stats = aggregate_records(transformed)
+    assert stats.original_context_length == main.original_tokens
+    assert stats.context_length == main.tokens
+    by_path = {file_data.path: file_data for file_data in stats.file_data}
+    assert by_path["main.py"].original_tokens == main.original_tokens
+
+
+def test_no_transforms_pass_records_through() -> None:
+    original = record("main.py", PYTHON_FILE)
+    assert list(iter_transformed([original], [])) == [original]
+    assert apply_transforms(original, []).content == PYTHON_FILE